@@ -29,6 +29,7 @@ const initialFeedbackState = {
     correction_text: '',
     route_mode: '',
     confidence_score: 0,
+    request_id: null,
 };
 
 const MathRenderer = ({ content }) => (
@@ -278,6 +279,7 @@ const App = () => {
                 generated_solution: String(data.solution),
                 route_mode: data.mode,
                 confidence_score: data.confidence,
+                request_id: data.request_id,
             }));
         } catch (error) {
             console.error('Error fetching solution:', error);
@@ -0,0 +1,246 @@
+"""
+Admission control in front of the gateway.
+
+Two layers keep one heavy client from starving everyone else:
+
+- `UserRateLimiter`: a token bucket per user (per client address for
+  anonymous callers), checked by the API before any work is done.
+- `ConcurrencyLimiter`: a global cap on agent executions (the Gemini/Tavily
+  calls) with a bounded FIFO wait queue. Cache hits never take a slot.
+
+Both refuse with `AdmissionRejected`, which the API turns into a fast 429
+with Retry-After instead of letting requests pile up until they time out.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict
+
+from resilience import remaining
+from telemetry import admission_rejections, admission_wait_seconds, get_logger
+
+logger = get_logger("admission")
+
+# CONFIGURATION
+
+# Sustained requests per minute per user, and how many may arrive at once
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "30"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "10"))
+# Buckets kept in memory; the least recently seen users are dropped first
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "10000"))
+
+# Agent executions running at once, and how many more may wait for a slot
+MAX_IN_FLIGHT_LLM = int(os.getenv("MAX_IN_FLIGHT_LLM", "32"))
+MAX_QUEUED_LLM = int(os.getenv("MAX_QUEUED_LLM", "64"))
+# Longest a request waits for a slot (also bounded by the request deadline)
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+RATE_LIMITED = "rate_limited"
+QUEUE_FULL = "queue_full"
+QUEUE_TIMEOUT = "queue_timeout"
+
+
+class AdmissionRejected(Exception):
+    """The request was refused before doing any work; retry after `retry_after` seconds."""
+
+    status = "429_TOO_MANY_REQUESTS"
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Request refused ({reason}), retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _reject(reason: str, retry_after: float) -> AdmissionRejected:
+    admission_rejections.inc(reason=reason)
+    return AdmissionRejected(reason, retry_after)
+
+# PER-USER RATE LIMIT
+
+class UserRateLimiter:
+    """
+    Token bucket per user: `burst` tokens, refilled at `per_minute` / 60 per
+    second. A request costing more than the burst (a large batch) is admitted
+    once the bucket is full and drives it negative, so the user waits until
+    the whole cost has been refilled. Buckets live in an LRU map capped at
+    `max_users`; an evicted user simply starts again with a full bucket.
+    Thread-safe.
+    """
+
+    def __init__(
+        self,
+        per_minute: float = RATE_LIMIT_PER_MINUTE,
+        burst: float = RATE_LIMIT_BURST,
+        max_users: int = RATE_LIMIT_MAX_USERS,
+    ):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_users = max_users
+        # user -> [tokens, last refill time]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    def acquire(self, user: str, cost: float = 1.0) -> None:
+        """
+        Takes `cost` tokens from the user's bucket. A cost above the burst
+        size only needs a full bucket, then leaves it in debt for the rest, so
+        a large batch is throttled rather than refused forever but still pays
+        for every query.
+
+        Raises:
+            AdmissionRejected: the bucket does not hold enough tokens yet.
+        """
+        if not self.enabled:
+            return
+        needed = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(user, None) or [self.burst, now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            self._buckets[user] = bucket
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+
+            if bucket[0] >= needed:
+                bucket[0] -= cost
+                self.admitted += 1
+                return
+            self.rejected += 1
+            retry_after = (needed - bucket[0]) / self.rate
+
+        logger.info("Rate limited", extra={"user": user, "retry_after": round(retry_after, 2)})
+        raise _reject(RATE_LIMITED, retry_after)
+
+    def stats(self) -> Dict[str, float]:
+        return {"users": len(self._buckets), "admitted": self.admitted, "rejected": self.rejected}
+
+# GLOBAL CONCURRENCY CAP
+
+class ConcurrencyLimiter:
+    """
+    At most `max_in_flight` holders at once, with up to `max_queued` more
+    waiting in FIFO order. A caller that finds the queue full is refused at
+    once; a queued caller gives up after `queue_timeout` or when the request
+    deadline runs out, whichever is sooner. A released slot is handed directly
+    to the oldest waiter, so late arrivals cannot overtake the queue.
+
+    Must be used from one event loop (the API's); it is not thread-safe.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = MAX_IN_FLIGHT_LLM,
+        max_queued: int = MAX_QUEUED_LLM,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Moving average of how long a slot is held, for Retry-After estimates
+        self._avg_hold_seconds = 1.0
+        self.admitted = 0
+        self.queued = 0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _retry_after(self) -> float:
+        """Roughly how long until the current queue has drained."""
+        return max(1.0, self._avg_hold_seconds * (self.waiting + 1) / self.max_in_flight)
+
+    async def acquire(self) -> None:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            admission_wait_seconds.observe(0.0)
+            return
+        if self.waiting >= self.max_queued:
+            raise _reject(QUEUE_FULL, self._retry_after())
+
+        start = time.perf_counter()
+        timeout = self.queue_timeout
+        left = remaining()
+        if left is not None:
+            timeout = max(0.0, min(timeout, left))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait([waiter], timeout=timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not waiter.done():
+            self._abandon(waiter)
+            raise _reject(QUEUE_TIMEOUT, self._retry_after())
+
+        # The releasing holder handed its slot over; in_flight is unchanged
+        self.admitted += 1
+        admission_wait_seconds.observe(time.perf_counter() - start)
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        """Leaves the queue; passes the slot on if it was handed over in the meantime."""
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Holds one slot for the duration of the block."""
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - start
+            self._avg_hold_seconds += 0.1 * (held - self._avg_hold_seconds)
+            self.release()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "avg_hold_seconds": round(self._avg_hold_seconds, 3),
+        }
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    """Retry-After takes whole seconds."""
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+# Process-wide limiters used by the API and the async gateway paths
+user_rate_limiter = UserRateLimiter()
+llm_admission = ConcurrencyLimiter()
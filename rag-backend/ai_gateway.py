@@ -1,82 +1,750 @@
 # CORE AGENT IMPORTS
-from guardrails import input_guardrail, output_guardrail
-from kb_response_agent import KBResponseAgent
-from model_context_protocol import WebSearchAgent_MCP
-from kb_search import kb_similarity_search 
+import asyncio
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+from guardrails import input_guardrail, input_guardrail_batch, output_guardrail
+from kb_response_agent import KBResponseAgent, KBResponseAgentAsync, KBResponseAgentStream
+from model_context_protocol import WebSearchAgent_MCP, WebSearchAgent_MCP_Async, WebSearchAgent_MCP_Stream
+from kb_search import (
+    embed_query,
+    embed_queries,
+    search_by_vector,
+    search_by_vectors,
+    best_distance,
+    run_in_search_executor,
+    SearchHits,
+)
+from admission import AdmissionRejected, llm_admission
+from answer_cache import AnswerCache, answer_cache, is_usable_answer
+from resilience import (
+    KB_FALLBACK_RESERVE_SECONDS,
+    REQUEST_DEADLINE_SECONDS,
+    DependencyError,
+    DependencyTimeout,
+    deadline,
+    reserve,
+)
+from single_flight import SingleFlight
+from telemetry import get_logger, record_request, request_id_var, span
 
 #ROUTING CONFIGURATION
 
-from router_agent import HIGH_CONFIDENCE_THRESHOLD, KB_RESPONSE, WEB_SEARCH 
+from router_agent import (
+    HEDGE_BAND,
+    HEDGE_FIRST_WINS,
+    HEDGE_POLICY,
+    KB_RESPONSE,
+    LEXICAL_SIGNAL,
+    VECTOR_SIGNAL,
+    WEB_SEARCH,
+    lexical_route,
+    query_topic,
+    route_threshold,
+)
+from routing_log import RoutingDecision, routing_log
+
+logger = get_logger("gateway")
+
+# Maximum number of LLM generations a batch runs at the same time
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Concurrent requests with the same normalized query and level share one execution
+gateway_single_flight = SingleFlight()
+
+# Hedged execution counters: hedged, kb_won, web_won, wasted_kb, wasted_web, cancelled
+hedge_stats: Counter = Counter()
+
+# Degraded answers: web_to_kb counts web legs that failed and were answered from the KB
+fallback_stats: Counter = Counter()
+
+# GATEWAY STAGES (shared by the sync and async paths)
+
+def _rejected_response() -> dict:
+    return {
+        "mode": "REJECTED",
+        "message": "Input rejected: Query does not meet the strict Math relevancy policy.",
+        "status": "400_BAD_INPUT"
+    }
+
+
+def _dependency_failure_response(mode: str, error: DependencyError) -> dict:
+    """503 when an upstream failed or its circuit is open, 504 when it ran out of time."""
+    if isinstance(error, DependencyTimeout):
+        message = f"The {error.dependency} service did not answer in time. Please retry."
+    else:
+        message = f"The {error.dependency} service is unavailable. Please retry shortly."
+    logger.warning("Dependency failure", extra={"mode": mode, "status": error.status, "error": str(error)})
+    return {
+        "mode": mode,
+        "message": message,
+        "status": error.status,
+        "dependency": error.dependency,
+        "retry_after": error.retry_after,
+    }
+
 
+def _overloaded_response(mode: str, error: AdmissionRejected) -> dict:
+    """429 when every LLM slot is busy and the wait queue is full or too slow."""
+    return {
+        "mode": mode,
+        "message": "The assistant is at capacity. Please retry shortly.",
+        "status": error.status,
+        "retry_after": error.retry_after,
+    }
 
-def process_query_through_gateway(query: str, level: str = "unspecified") -> dict:
+
+def _route(
+    kb_hits_for_routing: SearchHits,
+    query: str,
+    level: str
+) -> Tuple[str, List[Tuple[str, float]], float, RoutingDecision]:
     """
-    The main wrapper function that acts as the AI Gateway, enforcing 
-    Input and Output Guardrails around the core RAG logic.
+    Decides between the KB and Web agents from the KB search hits: the
+    closest vector distance against the threshold calibrated for the query's
+    level and topic, or else a strong enough lexical hit (LEXICAL_ROUTE_SCORE).
+    Confidence always comes from the vector distance. The caller records the
+    returned decision in the routing log (for calibrate_router.py) once it
+    knows which agent answered.
     """
-    
-    # INPUT GUARDRAIL CHECK
-    print("\n[GATEWAY] 1. Checking Input Guardrails...")
-    if not input_guardrail(query):
-        return {
-            "mode": "REJECTED",
-            "message": "Input rejected: Query does not meet the strict Math relevancy policy.",
-            "status": "400_BAD_INPUT"
-        }
+    with span("routing"):
+        # routing variables
+        mode = WEB_SEARCH # Default mode if KB is not confident
+        context_for_llm = []
+        confidence = 0.0
+        top_distance = None
+        signal = None
+        lexical_score = kb_hits_for_routing.lexical_score
+        topic = query_topic(query)
+        threshold = route_threshold(level, topic)
 
-    # CORE RAG LOGIC EXECUTION (Routing)
-    print("[GATEWAY] 2. Input approved. Running core RAG routing...")
-    
-    # Execute the KB Search to get hits and distances
-    kb_hits_for_routing = kb_similarity_search(query, k=5)
-    
-    # routing variables
-    mode = WEB_SEARCH # Default mode if KB is not confident
-    context_for_llm = []
-    confidence = 0.0
-
-    if kb_hits_for_routing:
-        top_distance = kb_hits_for_routing[0][1]
-        # Calculate confidence
-        confidence = 1.0 - top_distance 
-        if top_distance < HIGH_CONFIDENCE_THRESHOLD:
-            mode = KB_RESPONSE
-            context_for_llm = kb_hits_for_routing # Use all relevant hits for KB context
-            
-    print(f"[GATEWAY] 2. Routed to **{mode}**. Top Similarity Score: {confidence:.4f}")
-    
-    final_solution = ""
-    
-    # EXECUTE RESPONSE AGENT 
+        if kb_hits_for_routing:
+            top_distance = best_distance(kb_hits_for_routing)
+            # Calculate confidence
+            confidence = 1.0 - top_distance 
+            if top_distance < threshold:
+                signal = VECTOR_SIGNAL
+            elif lexical_route(lexical_score):
+                signal = LEXICAL_SIGNAL
+            if signal is not None:
+                mode = KB_RESPONSE
+                context_for_llm = kb_hits_for_routing # Use all relevant hits for KB context
+
+    decision = RoutingDecision(
+        query, level, topic, top_distance, lexical_score, threshold, mode, signal, request_id_var.get()
+    )
+    logger.info("Routed query", extra={"mode": mode, "confidence": round(confidence, 4), "topic": topic, "threshold": threshold, "signal": signal})
+    return mode, context_for_llm, confidence, decision
+
+
+def _run_agent(query: str, mode: str, context_for_llm: List[Tuple[str, float]]) -> str:
+    """Executes the response agent selected by the router."""
     if mode == KB_RESPONSE:
-        print("[GATEWAY] 3. Executing KB Response Agent...")
-        final_solution = KBResponseAgent(query, context_for_llm)
-        
+        return KBResponseAgent(query, context_for_llm)
+
     elif mode == WEB_SEARCH:
-        print("[GATEWAY] 3. Executing MCP Web Search Agent...")
-        final_solution = WebSearchAgent_MCP(query) 
+        return WebSearchAgent_MCP(query)
 
-    else:
-        final_solution = "Error: Routing failure or unhandled mode."
+    return "Error: Routing failure or unhandled mode."
+
+
+async def _run_agent_async(query: str, mode: str, context_for_llm: List[Tuple[str, float]]) -> str:
+    """Async variant of `_run_agent`."""
+    if mode == KB_RESPONSE:
+        return await KBResponseAgentAsync(query, context_for_llm)
+
+    elif mode == WEB_SEARCH:
+        return await WebSearchAgent_MCP_Async(query)
 
+    return "Error: Routing failure or unhandled mode."
+
+
+# FALLBACK POLICY
+
+def _can_fall_back(mode: str, kb_hits_for_routing: List[Tuple[str, float]]) -> bool:
+    """A failed web leg is answered from the KB hits, if there are any."""
+    return mode == WEB_SEARCH and bool(kb_hits_for_routing)
+
+
+def _note_fallback(error: DependencyError) -> None:
+    fallback_stats["web_to_kb"] += 1
+    logger.warning("Web leg failed, answering from the KB", extra={"error": str(error)})
+
+
+def _run_agent_with_fallback(
+    query: str,
+    mode: str,
+    context_for_llm: List[Tuple[str, float]],
+    kb_hits_for_routing: List[Tuple[str, float]]
+) -> Tuple[str, str, bool]:
+    """
+    Runs the routed agent. A web leg runs KB_FALLBACK_RESERVE_SECONDS short of
+    the request deadline so that, if it fails, the KB agent can still answer
+    from the routing hits within the deadline.
+
+    Returns:
+        (final_solution, mode that produced it, degraded)
+
+    Raises:
+        DependencyError: the agent failed and no fallback applied, or the fallback failed too.
+    """
+    if not _can_fall_back(mode, kb_hits_for_routing):
+        return _run_agent(query, mode, context_for_llm), mode, False
+    try:
+        with reserve(KB_FALLBACK_RESERVE_SECONDS):
+            return _run_agent(query, mode, context_for_llm), mode, False
+    except DependencyError as e:
+        _note_fallback(e)
+        return KBResponseAgent(query, kb_hits_for_routing), KB_RESPONSE, True
+
+
+async def _run_agent_with_fallback_async(
+    query: str,
+    mode: str,
+    context_for_llm: List[Tuple[str, float]],
+    kb_hits_for_routing: List[Tuple[str, float]]
+) -> Tuple[str, str, bool]:
+    """Async variant of `_run_agent_with_fallback`."""
+    if not _can_fall_back(mode, kb_hits_for_routing):
+        return await _run_agent_async(query, mode, context_for_llm), mode, False
+    try:
+        with reserve(KB_FALLBACK_RESERVE_SECONDS):
+            return await _run_agent_async(query, mode, context_for_llm), mode, False
+    except DependencyError as e:
+        _note_fallback(e)
+        return await KBResponseAgentAsync(query, kb_hits_for_routing), KB_RESPONSE, True
+
+
+# HEDGED EXECUTION
+
+def _should_hedge(kb_hits_for_routing: SearchHits, query: str, level: str) -> bool:
+    # A lexical KB route does not depend on the vector threshold, so it is never borderline
+    if HEDGE_BAND <= 0 or not kb_hits_for_routing or lexical_route(kb_hits_for_routing.lexical_score):
+        return False
+    return abs(best_distance(kb_hits_for_routing) - route_threshold(level, query_topic(query))) <= HEDGE_BAND
+
+
+def _succeeded(task: asyncio.Task) -> bool:
+    """True when a finished agent task returned a usable answer (this also retrieves its exception)."""
+    return task.exception() is None and is_usable_answer(task.result())
+
+
+async def _run_hedged(
+    query: str,
+    routed_mode: str,
+    kb_hits_for_routing: List[Tuple[str, float]]
+) -> Tuple[str, str]:
+    """
+    Runs the KB and Web agents concurrently for a borderline query and keeps
+    one answer according to HEDGE_POLICY. The losing agent is cancelled if it
+    is still running. If neither answer is usable, the routed mode's answer is
+    returned, or the other agent's answer when the routed one raised.
+
+    Returns:
+        (final_solution, mode of the agent that produced it)
+    """
+    logger.info("Borderline confidence, hedging KB and Web agents", extra={"policy": HEDGE_POLICY})
+    hedge_stats["hedged"] += 1
+    tasks = {
+        KB_RESPONSE: asyncio.create_task(KBResponseAgentAsync(query, kb_hits_for_routing)),
+        WEB_SEARCH: asyncio.create_task(WebSearchAgent_MCP_Async(query)),
+    }
+
+    winner = None
+    try:
+        if HEDGE_POLICY == HEDGE_FIRST_WINS:
+            pending = set(tasks.values())
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for mode, task in tasks.items():
+                    if task in done and _succeeded(task) and winner is None:
+                        winner = mode
+        else:
+            for mode in (KB_RESPONSE, WEB_SEARCH):
+                await asyncio.wait([tasks[mode]])
+                if _succeeded(tasks[mode]):
+                    winner = mode
+                    break
+    finally:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+                hedge_stats["cancelled"] += 1
+
+    if winner is None:
+        # Neither answer is usable; both agents have finished. Keep the routed
+        # one unless it raised (raises if both did).
+        other_mode = WEB_SEARCH if routed_mode == KB_RESPONSE else KB_RESPONSE
+        mode = routed_mode if tasks[routed_mode].exception() is None else other_mode
+        logger.info("No usable hedged answer", extra={"mode": mode})
+        return tasks[mode].result(), mode
+
+    hedge_stats["kb_won" if winner == KB_RESPONSE else "web_won"] += 1
+    hedge_stats["wasted_web" if winner == KB_RESPONSE else "wasted_kb"] += 1
+    logger.info("Hedge resolved", extra={"mode": winner})
+    return tasks[winner].result(), winner
+
+
+def _finalize(mode: str, final_solution: str, confidence: float, degraded: bool = False) -> dict:
+    """
+    Applies the output guardrail and builds the gateway response. `degraded`
+    marks a fallback answer, which the answer cache does not store.
+    """
     # OUTPUT GUARDRAIL CHECK 
-    print("[GATEWAY] 4. Checking Output Guardrails...")
-    
-    guarded_output = output_guardrail(final_solution)
-    
+    with span("output_guardrail"):
+        guarded_output = output_guardrail(final_solution)
+
     if guarded_output != final_solution:
+        logger.warning("Output guardrail blocked the answer", extra={"mode": mode})
         return {
             "mode": "BLOCKED",
             "message": guarded_output, 
             "status": "403_FORBIDDEN"
         }
-    
+
     # RETURN FINAL RESPONSE
-    return {
+    response = {
         "mode": mode,
         "solution": guarded_output,
         "confidence": confidence,
-        "status": "200_OK"
+        "status": "200_OK",
+        "cached": False
     }
+    if degraded:
+        response["degraded"] = True
+    return response
+
+
+def process_query_through_gateway(
+    query: str,
+    level: str = "unspecified",
+    deadline_seconds: float = REQUEST_DEADLINE_SECONDS
+) -> dict:
+    """
+    The main wrapper function that acts as the AI Gateway, enforcing 
+    Input and Output Guardrails around the core RAG logic.
+
+    Everything runs under a `deadline_seconds` deadline (0 disables it) that
+    bounds every Gemini and Tavily call. Upstream failures come back as a
+    503_SERVICE_UNAVAILABLE or 504_GATEWAY_TIMEOUT response.
+    """
+    start = time.perf_counter()
+    with deadline(deadline_seconds):
+        response = _process_query(query, level)
+    record_request(response, time.perf_counter() - start)
+    return response
+
+
+def _process_query(query: str, level: str) -> dict:
+    """The sync gateway pipeline."""
+
+    # INPUT GUARDRAIL CHECK
+    with span("input_guardrail"):
+        allowed = input_guardrail(query)
+    if not allowed:
+        return _rejected_response()
+
+    # ANSWER CACHE (exact tier, then semantic tier on the query embedding)
+    cached_response = answer_cache.get_exact(query, level)
+    if cached_response is not None:
+        logger.info("Served from the answer cache", extra={"tier": "exact"})
+        return cached_response
+
+    with span("embedding"):
+        query_vector = embed_query(query)
+    cached_response = answer_cache.get_semantic(query_vector, level, query)
+    if cached_response is not None:
+        logger.info("Served from the answer cache", extra={"tier": "semantic"})
+        return cached_response
+
+    # CORE RAG LOGIC EXECUTION (Routing)
+    # Execute the KB Search to get hits and distances
+    with span("vector_query"):
+        kb_hits_for_routing = search_by_vector(query_vector, k=5, query=query)
+    mode, context_for_llm, confidence, decision = _route(kb_hits_for_routing, query, level)
+
+    # EXECUTE RESPONSE AGENT (a failed web leg falls back to the KB)
+    try:
+        final_solution, mode, degraded = _run_agent_with_fallback(query, mode, context_for_llm, kb_hits_for_routing)
+    except DependencyError as e:
+        return _dependency_failure_response(mode, e)
+    finally:
+        # Logged with the mode that answered, after any fallback
+        routing_log.record_decision(decision, mode)
+
+    response = _finalize(mode, final_solution, confidence, degraded)
+    answer_cache.put(query, level, response, query_vector)
+    return response
+
+
+async def process_query_through_gateway_async(
+    query: str,
+    level: str = "unspecified",
+    deadline_seconds: float = REQUEST_DEADLINE_SECONDS
+) -> dict:
+    """
+    Non-blocking AI Gateway used by the API. Embedding and vector search are
+    offloaded to the bounded KB search executor, and the Gemini/Tavily calls use
+    async clients, so concurrent requests no longer serialize on the event loop.
+
+    Identical in-flight requests (same normalized query and level) are
+    coalesced: they attach to one execution and all receive its result. The
+    shared execution runs under the deadline of the request that started it.
+    Cache misses take an LLM admission slot (admission.py) for the agent call
+    and come back as 429_TOO_MANY_REQUESTS when none frees up in time.
+    """
+    start = time.perf_counter()
+    with deadline(deadline_seconds):
+        response = await gateway_single_flight.do(
+            AnswerCache.make_key(query, level),
+            lambda: _process_query_async(query, level)
+        )
+    record_request(response, time.perf_counter() - start)
+    return response
+
+
+async def _process_query_async(query: str, level: str) -> dict:
+    """The uncoalesced async gateway pipeline."""
+
+    # INPUT GUARDRAIL CHECK (cheap, runs inline)
+    with span("input_guardrail"):
+        allowed = input_guardrail(query)
+    if not allowed:
+        return _rejected_response()
+
+    # ANSWER CACHE (exact tier, then semantic tier on the query embedding)
+    cached_response = answer_cache.get_exact(query, level)
+    if cached_response is not None:
+        logger.info("Served from the answer cache", extra={"tier": "exact"})
+        return cached_response
+
+    with span("embedding"):
+        query_vector = await run_in_search_executor(embed_query, query)
+    cached_response = answer_cache.get_semantic(query_vector, level, query)
+    if cached_response is not None:
+        logger.info("Served from the answer cache", extra={"tier": "semantic"})
+        return cached_response
+
+    # CORE RAG LOGIC EXECUTION (Routing)
+    with span("vector_query"):
+        kb_hits_for_routing = await run_in_search_executor(search_by_vector, query_vector, 5, query)
+    mode, context_for_llm, confidence, decision = _route(kb_hits_for_routing, query, level)
+
+    # EXECUTE RESPONSE AGENT (holding an LLM admission slot; hedged when the
+    # top distance is borderline, otherwise a failed web leg falls back to the KB)
+    degraded = False
+    try:
+        async with llm_admission.slot():
+            if _should_hedge(kb_hits_for_routing, query, level):
+                final_solution, mode = await _run_hedged(query, mode, kb_hits_for_routing)
+            else:
+                final_solution, mode, degraded = await _run_agent_with_fallback_async(
+                    query, mode, context_for_llm, kb_hits_for_routing
+                )
+    except AdmissionRejected as e:
+        return _overloaded_response(mode, e)
+    except DependencyError as e:
+        return _dependency_failure_response(mode, e)
+    finally:
+        # Logged with the mode that answered, after hedging or fallback
+        routing_log.record_decision(decision, mode)
+
+    response = _finalize(mode, final_solution, confidence, degraded)
+    answer_cache.put(query, level, response, query_vector)
+    return response
+
+
+# STREAMING GATEWAY
+
+async def stream_query_through_gateway(
+    query: str,
+    level: str = "unspecified",
+    deadline_seconds: float = REQUEST_DEADLINE_SECONDS
+) -> AsyncIterator[dict]:
+    """
+    Streaming AI Gateway. Yields events as `{"event": name, "data": {...}}`:
+
+    - `route`: routing metadata (mode, confidence, cached), sent before any content.
+      Sent a second time, with `degraded: true`, when the web leg fails before
+      its first chunk and the KB agent answers instead.
+    - `token`: a chunk of the solution text.
+    - `done`: the final status, carrying the guardrail message when the query was
+      rejected or the output was blocked, or the 503/504 status when an upstream
+      failed.
+
+    The output guardrail is re-checked on the accumulated text before every chunk
+    is released, so a blocked answer stops streaming at the offending chunk.
+    """
+    start = time.perf_counter()
+    route = {}
+    with deadline(deadline_seconds):
+        async for event in _stream_query(query, level):
+            if event["event"] == "route":
+                route = event["data"]
+            elif event["event"] == "done":
+                record_request({**route, **event["data"]}, time.perf_counter() - start)
+            yield event
+
+
+async def _stream_query(query: str, level: str) -> AsyncIterator[dict]:
+    """The streaming gateway pipeline."""
+
+    # INPUT GUARDRAIL CHECK
+    with span("input_guardrail"):
+        allowed = input_guardrail(query)
+    if not allowed:
+        yield {"event": "done", "data": _rejected_response()}
+        return
+
+    # ANSWER CACHE
+    cached_response = answer_cache.get_exact(query, level)
+    query_vector = None
+    if cached_response is None:
+        with span("embedding"):
+            query_vector = await run_in_search_executor(embed_query, query)
+        cached_response = answer_cache.get_semantic(query_vector, level, query)
+
+    if cached_response is not None:
+        logger.info("Served from the answer cache", extra={"tier": cached_response.get("cache_tier")})
+        yield {"event": "route", "data": {
+            "mode": cached_response["mode"],
+            "confidence": cached_response["confidence"],
+            "cached": True,
+            "cache_tier": cached_response.get("cache_tier"),
+        }}
+        yield {"event": "token", "data": {"text": cached_response["solution"]}}
+        yield {"event": "done", "data": {"status": cached_response["status"], "mode": cached_response["mode"]}}
+        return
+
+    # CORE RAG LOGIC EXECUTION (Routing)
+    with span("vector_query"):
+        kb_hits_for_routing = await run_in_search_executor(search_by_vector, query_vector, 5, query)
+    mode, context_for_llm, confidence, decision = _route(kb_hits_for_routing, query, level)
+    yield {"event": "route", "data": {"mode": mode, "confidence": confidence, "cached": False}}
+
+    # EXECUTE RESPONSE AGENT (streaming, holding an LLM admission slot)
+    try:
+        async with llm_admission.slot():
+            async for event in _stream_agent(query, level, mode, context_for_llm, kb_hits_for_routing, confidence, query_vector):
+                if event["event"] == "route":
+                    mode = event["data"]["mode"]
+                yield event
+    except AdmissionRejected as e:
+        yield {"event": "done", "data": _overloaded_response(mode, e)}
+    finally:
+        # Logged with the mode that answered, after any fallback
+        routing_log.record_decision(decision, mode)
+
+
+async def _stream_agent(
+    query: str,
+    level: str,
+    mode: str,
+    context_for_llm: List[Tuple[str, float]],
+    kb_hits_for_routing: List[Tuple[str, float]],
+    confidence: float,
+    query_vector: np.ndarray
+) -> AsyncIterator[dict]:
+    """Streams the routed agent's answer; a web leg that fails before its first chunk falls back to the KB."""
+    legs = [(mode, context_for_llm)]
+    if _can_fall_back(mode, kb_hits_for_routing):
+        legs.append((KB_RESPONSE, kb_hits_for_routing))
+
+    final_solution = ""
+    degraded = False
+    for leg, (leg_mode, leg_context) in enumerate(legs):
+        has_fallback = leg + 1 < len(legs)
+        if leg_mode == KB_RESPONSE:
+            chunks = KBResponseAgentStream(query, leg_context)
+        else:
+            chunks = WebSearchAgent_MCP_Stream(query)
+
+        try:
+            with reserve(KB_FALLBACK_RESERVE_SECONDS if has_fallback else 0.0):
+                async for chunk in chunks:
+                    final_solution += chunk
+                    with span("output_guardrail"):
+                        guarded_output = output_guardrail(final_solution)
+                    if guarded_output != final_solution:
+                        logger.warning("Output guardrail blocked the stream", extra={"mode": mode})
+                        await chunks.aclose()
+                        yield {"event": "done", "data": {"mode": "BLOCKED", "message": guarded_output, "status": "403_FORBIDDEN"}}
+                        return
+                    yield {"event": "token", "data": {"text": chunk}}
+            break
+        except DependencyError as e:
+            if final_solution or not has_fallback:
+                yield {"event": "done", "data": _dependency_failure_response(mode, e)}
+                return
+            _note_fallback(e)
+            mode, degraded = KB_RESPONSE, True
+            yield {"event": "route", "data": {"mode": mode, "confidence": confidence, "cached": False, "degraded": True}}
+
+    response = _finalize(mode, final_solution, confidence, degraded)
+    answer_cache.put(query, level, response, query_vector)
+    yield {"event": "done", "data": {"status": response["status"], "mode": mode}}
+
+
+# BATCH GATEWAY
+
+@dataclass
+class _PendingQuery:
+    """A batch item that passed guardrails and cache lookups and still needs an LLM answer."""
+    index: int
+    query: str
+    query_vector: np.ndarray
+    mode: str
+    context_for_llm: List[Tuple[str, float]]
+    confidence: float
+    kb_hits: List[Tuple[str, float]]
+    decision: RoutingDecision
+
+
+def _plan_batch(queries: List[str], level: str) -> Tuple[List[Optional[dict]], List[_PendingQuery]]:
+    """
+    Runs the CPU-bound part of a batch: guardrails and exact-cache lookups for
+    every query, one batched embedding call, semantic-cache lookups and a single
+    multi-query VectorDB search followed by routing.
+
+    Returns:
+        The responses already known (rejections and cache hits, None elsewhere)
+        and the items that still need a response agent.
+    """
+    logger.info("Planning batch", extra={"queries": len(queries)})
+    responses: List[Optional[dict]] = [None] * len(queries)
+
+    to_embed = []
+    with span("input_guardrail"):
+        decisions = input_guardrail_batch(queries)
+    for i, (query, allowed) in enumerate(zip(queries, decisions)):
+        if not allowed:
+            responses[i] = _rejected_response()
+            continue
+        cached_response = answer_cache.get_exact(query, level)
+        if cached_response is not None:
+            responses[i] = cached_response
+            continue
+        to_embed.append(i)
+
+    if not to_embed:
+        return responses, []
+
+    with span("embedding"):
+        query_vectors = embed_queries([queries[i] for i in to_embed])
+
+    to_search = []
+    for i, query_vector in zip(to_embed, query_vectors):
+        cached_response = answer_cache.get_semantic(query_vector, level, queries[i])
+        if cached_response is not None:
+            responses[i] = cached_response
+        else:
+            to_search.append((i, query_vector))
+
+    pending = []
+    if to_search:
+        with span("vector_query"):
+            hits_per_query = search_by_vectors(
+                np.stack([v for _, v in to_search]), k=5, queries=[queries[i] for i, _ in to_search])
+        for (i, query_vector), kb_hits_for_routing in zip(to_search, hits_per_query):
+            mode, context_for_llm, confidence, decision = _route(kb_hits_for_routing, queries[i], level)
+            pending.append(_PendingQuery(
+                i, queries[i], query_vector, mode, context_for_llm, confidence, kb_hits_for_routing, decision
+            ))
+
+    return responses, pending
+
+
+def _complete(item: _PendingQuery, level: str, final_solution: str, mode: str, degraded: bool) -> dict:
+    response = _finalize(mode, final_solution, item.confidence, degraded)
+    answer_cache.put(item.query, level, response, item.query_vector)
+    return response
+
+
+def _answer_item(item: _PendingQuery, level: str, deadline_seconds: float) -> dict:
+    """Answers one batch item under its own deadline, with the web-to-KB fallback."""
+    mode = item.mode
+    with deadline(deadline_seconds):
+        try:
+            final_solution, mode, degraded = _run_agent_with_fallback(
+                item.query, item.mode, item.context_for_llm, item.kb_hits
+            )
+        except DependencyError as e:
+            return _dependency_failure_response(item.mode, e)
+        finally:
+            routing_log.record_decision(item.decision, mode)
+    return _complete(item, level, final_solution, mode, degraded)
+
+
+def _record_batch(responses: List[dict], seconds: float) -> None:
+    """Records every batch item with the latency of the whole batch."""
+    for response in responses:
+        record_request(response, seconds)
+
+
+def process_queries_batch(
+    queries: List[str],
+    level: str = "unspecified",
+    deadline_seconds: float = REQUEST_DEADLINE_SECONDS
+) -> List[dict]:
+    """
+    Runs many queries through the AI Gateway in one pass. Embedding and
+    retrieval are vectorized across the batch and the response agents run on a
+    bounded thread pool (BATCH_LLM_CONCURRENCY). Each item's agent gets its
+    own `deadline_seconds`, counted from when it starts.
+
+    Returns:
+        One gateway response per query, in input order.
+    """
+    start = time.perf_counter()
+    responses, pending = _plan_batch(queries, level)
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(BATCH_LLM_CONCURRENCY, len(pending))) as pool:
+            answered = pool.map(lambda item: _answer_item(item, level, deadline_seconds), pending)
+            for item, response in zip(pending, answered):
+                responses[item.index] = response
+    _record_batch(responses, time.perf_counter() - start)
+    return responses
+
+
+async def process_queries_batch_async(
+    queries: List[str],
+    level: str = "unspecified",
+    deadline_seconds: float = REQUEST_DEADLINE_SECONDS
+) -> List[dict]:
+    """
+    Async variant of `process_queries_batch`. The batched embedding and search
+    run on the KB search executor and the response agents fan out on the event
+    loop, at most BATCH_LLM_CONCURRENCY at a time, each taking an LLM admission
+    slot like a single request.
+    """
+    start = time.perf_counter()
+    responses, pending = await run_in_search_executor(_plan_batch, queries, level)
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
 
+    async def answer(item: _PendingQuery) -> None:
+        mode = item.mode
+        async with semaphore:
+            with deadline(deadline_seconds):
+                try:
+                    async with llm_admission.slot():
+                        final_solution, mode, degraded = await _run_agent_with_fallback_async(
+                            item.query, item.mode, item.context_for_llm, item.kb_hits
+                        )
+                except AdmissionRejected as e:
+                    responses[item.index] = _overloaded_response(item.mode, e)
+                    return
+                except DependencyError as e:
+                    responses[item.index] = _dependency_failure_response(item.mode, e)
+                    return
+                finally:
+                    routing_log.record_decision(item.decision, mode)
+        responses[item.index] = _complete(item, level, final_solution, mode, degraded)
 
+    await asyncio.gather(*(answer(item) for item in pending))
+    _record_batch(responses, time.perf_counter() - start)
+    return responses
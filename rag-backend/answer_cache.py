@@ -0,0 +1,260 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from query_utils import math_signature, normalize_query
+
+# CONFIGURATION
+
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+
+EXACT_TIER = "exact"
+SEMANTIC_TIER = "semantic"
+
+# Agent outputs that mean "no usable answer" (grounded refusals); never cached
+UNUSABLE_ANSWER_PREFIXES = (
+    "KB Response Agent failed",
+    "Insufficient context",
+    "The necessary information for a complete answer is not available",
+)
+
+
+def is_usable_answer(answer: str) -> bool:
+    return bool(answer) and not answer.lstrip("'").startswith(UNUSABLE_ANSWER_PREFIXES)
+
+
+@dataclass
+class _CacheEntry:
+    level: str
+    response: dict
+    expires_at: float
+    size: int
+    embedding: Optional[np.ndarray] = None
+    signature: Tuple[str, ...] = ()
+
+
+def _response_size(response: dict) -> int:
+    """Approximate memory footprint of a cached gateway response."""
+    return sys.getsizeof(response) + sum(
+        sys.getsizeof(v) for v in response.values()
+    )
+
+
+class _LRUTier:
+    """A single LRU/TTL tier bounded by entry count and approximate bytes."""
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, now: float) -> Optional[_CacheEntry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: _CacheEntry) -> None:
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = entry
+        self.bytes += entry.size
+        while self.entries and (
+            len(self.entries) > self.max_entries or self.bytes > self.max_bytes
+        ):
+            oldest = next(iter(self.entries))
+            self.remove(oldest)
+            self.evictions += 1
+
+    def remove(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class AnswerCache:
+    """
+    Two-tier cache of gateway responses.
+
+    - Exact tier: keyed on the normalized query plus `level`.
+    - Semantic tier: reuses the query embedding and serves a stored answer for the
+      same `level` when cosine similarity is at or above `semantic_threshold`
+      and the two queries have the same numbers, LaTeX commands and operators
+      (`math_signature`), since embeddings barely tell "x^2-5x+6=0" from
+      "x^2-5x+7=0".
+
+    Both tiers evict least-recently-used entries past their TTL, entry count or
+    byte budget. Only successful (200_OK) responses with a usable answer are
+    stored.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        max_bytes: int = ANSWER_CACHE_MAX_BYTES,
+        semantic_threshold: float = SEMANTIC_CACHE_THRESHOLD,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self._exact = _LRUTier(EXACT_TIER, max_entries, max_bytes // 2)
+        self._semantic = _LRUTier(SEMANTIC_TIER, max_entries, max_bytes // 2)
+        self._lock = threading.Lock()
+        # Semantic matches refused because the queries' math differed
+        self.signature_mismatches = 0
+
+        # Stacked unit vectors of the semantic tier, rebuilt lazily after writes
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+
+    @staticmethod
+    def make_key(query: str, level: str) -> str:
+        return f"{level}\x1f{normalize_query(query)}"
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _served(self, entry: _CacheEntry, tier: str) -> dict:
+        response = dict(entry.response)
+        response["cached"] = True
+        response["cache_tier"] = tier
+        return response
+
+    # Lookups
+
+    def get_exact(self, query: str, level: str) -> Optional[dict]:
+        """Returns a cached response for the normalized query and level, if any."""
+        key = self.make_key(query, level)
+        with self._lock:
+            entry = self._exact.get(key, time.monotonic())
+            if entry is None:
+                self._exact.misses += 1
+                return None
+            self._exact.hits += 1
+            return self._served(entry, EXACT_TIER)
+
+    def get_semantic(self, embedding: Sequence[float], level: str, query: str) -> Optional[dict]:
+        """
+        Returns the most similar cached response for the level above the
+        threshold whose query has the same math signature as `query`.
+        """
+        query_vec = self._unit(embedding)
+        signature = math_signature(query)
+        now = time.monotonic()
+        with self._lock:
+            if self._matrix is None:
+                self._rebuild_matrix()
+
+            best_key = None
+            if self._matrix_keys:
+                scores = self._matrix @ query_vec
+                for idx in np.argsort(-scores):
+                    if scores[idx] < self.semantic_threshold:
+                        break
+                    key = self._matrix_keys[idx]
+                    entry = self._semantic.get(key, now)
+                    if entry is None or entry.level != level:
+                        continue
+                    if entry.signature != signature:
+                        self.signature_mismatches += 1
+                        continue
+                    best_key = key
+                    break
+                if len(self._semantic.entries) != len(self._matrix_keys):
+                    # Expired entries were dropped during the scan
+                    self._matrix = None
+
+            if best_key is None:
+                self._semantic.misses += 1
+                return None
+            self._semantic.hits += 1
+            return self._served(self._semantic.entries[best_key], SEMANTIC_TIER)
+
+    # Writes
+
+    def put(
+        self,
+        query: str,
+        level: str,
+        response: dict,
+        embedding: Optional[Sequence[float]] = None,
+    ) -> None:
+        """
+        Stores a successful gateway response in both tiers. Degraded (fallback)
+        answers and refusals ("Insufficient context", ...) are not stored.
+        """
+        if response.get("status") != "200_OK" or response.get("degraded"):
+            return
+        if not is_usable_answer(response.get("solution", "")):
+            return
+
+        key = self.make_key(query, level)
+        expires_at = time.monotonic() + self.ttl_seconds
+        size = _response_size(response)
+        with self._lock:
+            self._exact.put(key, _CacheEntry(level, response, expires_at, size))
+            if embedding is not None:
+                vec = self._unit(embedding)
+                self._semantic.put(
+                    key,
+                    _CacheEntry(level, response, expires_at, size + vec.nbytes, vec, math_signature(query)),
+                )
+                self._matrix = None
+
+    def _rebuild_matrix(self) -> None:
+        """Stacks the semantic tier's vectors into one matrix. Caller must hold the lock."""
+        self._matrix_keys = list(self._semantic.entries.keys())
+        if self._matrix_keys:
+            self._matrix = np.stack(
+                [self._semantic.entries[k].embedding for k in self._matrix_keys]
+            )
+        else:
+            self._matrix = np.empty((0, 0), dtype=np.float32)
+
+    def clear(self) -> None:
+        with self._lock:
+            for tier in (self._exact, self._semantic):
+                tier.entries.clear()
+                tier.bytes = 0
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                EXACT_TIER: self._exact.stats(),
+                SEMANTIC_TIER: {**self._semantic.stats(), "signature_mismatches": self.signature_mismatches},
+            }
+
+
+# Process-wide answer cache used by the gateway
+answer_cache = AnswerCache()
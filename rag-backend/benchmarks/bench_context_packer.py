@@ -0,0 +1,110 @@
+"""
+Prompt context size before and after the context packer, on sample prompts.
+
+KB prompts use the 5 seed documents closest to each question (what Chroma
+returns for the seed KB). Web prompts use synthetic Tavily-style results:
+long pages made of several seed documents wrapped in site boilerplate, plus a
+mirrored copy of the top page, which is the usual shape of real results.
+
+Run from rag-backend/:  python -m benchmarks.bench_context_packer
+"""
+import json
+import random
+import statistics
+import time
+
+import numpy as np
+
+from context_packer import (
+    KB_CONTEXT_TOKEN_BUDGET,
+    WEB_CONTEXT_TOKEN_BUDGET,
+    embed_texts,
+    pack_passages,
+    sentence_memo,
+)
+from kb_search import embed_query
+
+SEED_DOCUMENTS = "knowledge_base/seed_documents.jsonl"
+K = 5
+
+QUESTIONS = [
+    "What is the formula for integration by parts?",
+    "Find the derivative of x^x using logarithmic differentiation.",
+    "What is the eccentricity of the ellipse x^2/9 + y^2/4 = 1?",
+    "Find the sum of an infinite geometric progression with ratio 1/3.",
+    "Find the modulus and argument of the complex number 1 + i.",
+    "What is the angle between two vectors with dot product zero?",
+    "State Bayes' theorem and give an example.",
+    "When does a quadratic equation have real and equal roots?",
+]
+
+BOILERPLATE = [
+    "Sign up for our newsletter to get the latest JEE preparation tips.",
+    "This page may contain affiliate links. Read our privacy policy for details.",
+    "Related articles: Top 10 tricks for calculus, Coordinate geometry cheat sheet.",
+    "Download the app for offline access to thousands of solved problems.",
+]
+
+
+def _seed_documents():
+    with open(SEED_DOCUMENTS, encoding="utf-8") as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+
+def _kb_passages(question, documents, doc_vectors):
+    scores = doc_vectors @ embed_query(question)
+    return [documents[i] for i in np.argsort(-scores)[:K]]
+
+
+def _web_passages(question, documents, doc_vectors, rng):
+    ranked = _kb_passages(question, documents, doc_vectors)
+    pages = []
+    for i in range(K - 1):
+        body = [ranked[i]] + rng.sample(documents, 3)
+        pages.append(" ".join(rng.sample(BOILERPLATE, 2) + body + rng.sample(BOILERPLATE, 2)))
+    # A mirror site republishing the top page
+    pages.append(pages[0])
+    return pages
+
+
+def _run(label, budget, passages_for):
+    before, after, cold_ms, warm_ms = [], [], [], []
+    for question in QUESTIONS:
+        passages = passages_for(question)
+        sentence_memo.clear()
+        start = time.perf_counter()
+        packed = pack_passages(question, passages, budget, label=label)
+        cold_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        pack_passages(question, passages, budget, label=label)
+        warm_ms.append((time.perf_counter() - start) * 1000)
+        before.append(packed.tokens_before)
+        after.append(packed.tokens_after)
+
+    total_before, total_after = sum(before), sum(after)
+    return (
+        f"{label:>4} budget={budget:<5} tokens/prompt {statistics.mean(before):>7.0f} -> {statistics.mean(after):>6.0f} "
+        f"({(1 - total_after / total_before) * 100:>4.1f}% fewer)  "
+        f"pack p50 cold {statistics.median(cold_ms):>6.1f}ms warm {statistics.median(warm_ms):>5.1f}ms"
+    )
+
+
+def main():
+    rng = random.Random(0)
+    documents = _seed_documents()
+    doc_vectors = embed_texts(documents)
+
+    rows = [
+        _run("KB", KB_CONTEXT_TOKEN_BUDGET, lambda q: _kb_passages(q, documents, doc_vectors)),
+        _run("web", WEB_CONTEXT_TOKEN_BUDGET, lambda q: _web_passages(q, documents, doc_vectors, rng)),
+        # Tight budgets show the sentence-ranking stage on the KB prompts as well
+        _run("KB", 150, lambda q: _kb_passages(q, documents, doc_vectors)),
+        _run("web", 600, lambda q: _web_passages(q, documents, doc_vectors, rng)),
+    ]
+    print()
+    for row in rows:
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
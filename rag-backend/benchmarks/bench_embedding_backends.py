@@ -0,0 +1,117 @@
+"""
+Compares the sentence-transformers and int8 ONNX embedding backends:
+
+- parity: cosine similarity between the two backends' embeddings of the same
+  texts, and top-1 agreement when retrieving KB-style passages;
+- latency: single-query encode time;
+- memory: peak RSS of a fresh process that loads the backend and encodes;
+- image size: installed size of each backend's Python dependencies.
+
+Exits non-zero if parity falls below PARITY_MIN_COSINE, so it can gate CI.
+Build the ONNX model first:  python embedding_backends.py export
+
+Run from rag-backend/:  python -m benchmarks.bench_embedding_backends
+"""
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from embedding_backends import OnnxMiniLMBackend, SentenceTransformerBackend
+
+PARITY_MIN_COSINE = 0.99
+LATENCY_ROUNDS = 50
+
+QUERIES = [
+    "What is the formula for integration by parts?",
+    "sum of first n natural numbers",
+    "Find the eccentricity of the ellipse x^2/9 + y^2/4 = 1",
+    "State Bayes theorem",
+    "\\int x \\cos(x) dx",
+    "nature of roots when discriminant is zero",
+]
+PASSAGES = [
+    "The formula for integration by parts is $\\int u dv = uv - \\int v du$.",
+    "The sum of the first $n$ natural numbers is $S_n = \\frac{n(n+1)}{2}$.",
+    "The eccentricity of an ellipse is $e = \\sqrt{1 - \\frac{b^2}{a^2}}$.",
+    "Bayes' Theorem: $P(A|B) = \\frac{P(B|A) P(A)}{P(B)}$.",
+    "The nature of the roots is determined by the discriminant $D = b^2 - 4ac$.",
+]
+
+RSS_PROBE = """
+import json, resource, sys
+from embedding_backends import load_embedding_backend
+backend = load_embedding_backend(sys.argv[1])
+backend.encode(["warm-up question about integrals"])
+print(json.dumps({"max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+PACKAGES = {
+    "sentence-transformers": ["torch", "sentence_transformers", "transformers", "tokenizers"],
+    "onnx": ["onnxruntime", "tokenizers"],
+}
+
+
+def _package_size_mb(package: str) -> float:
+    spec = importlib.util.find_spec(package)
+    if spec is None or not spec.submodule_search_locations:
+        return 0.0
+    total = 0
+    for root in spec.submodule_search_locations:
+        for dirpath, _, filenames in os.walk(root):
+            total += sum(os.path.getsize(os.path.join(dirpath, f)) for f in filenames)
+    return total / (1024 * 1024)
+
+
+def _latency_ms(backend) -> float:
+    samples = []
+    for i in range(LATENCY_ROUNDS):
+        start = time.perf_counter()
+        backend.encode([QUERIES[i % len(QUERIES)]])
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _peak_rss_mb(name: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", RSS_PROBE, name], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])["max_rss_mb"]
+
+
+def main() -> int:
+    reference = SentenceTransformerBackend()
+    candidate = OnnxMiniLMBackend()
+
+    # Parity
+    texts = QUERIES + PASSAGES
+    ref_vecs = reference.encode(texts)
+    onnx_vecs = candidate.encode(texts)
+    cosines = np.sum(ref_vecs * onnx_vecs, axis=1)
+
+    ref_top1 = np.argmax(reference.encode(QUERIES) @ reference.encode(PASSAGES).T, axis=1)
+    onnx_top1 = np.argmax(candidate.encode(QUERIES) @ candidate.encode(PASSAGES).T, axis=1)
+    agreement = float(np.mean(ref_top1 == onnx_top1))
+
+    print(f"\nParity: min cosine={cosines.min():.4f} mean cosine={cosines.mean():.4f} "
+          f"top-1 agreement={agreement:.0%}")
+
+    # Latency, memory and image size
+    print(f"\n{'backend':<24}{'p50 encode':>12}{'peak RSS':>12}{'deps size':>12}")
+    for name, backend in ((reference.name, reference), (candidate.name, candidate)):
+        size = sum(_package_size_mb(p) for p in PACKAGES[name])
+        print(f"{name:<24}{_latency_ms(backend):>10.2f}ms{_peak_rss_mb(name):>10.0f}MB{size:>10.0f}MB")
+
+    if cosines.min() < PARITY_MIN_COSINE:
+        print(f"\nFAIL: ONNX embeddings diverge from sentence-transformers (min cosine < {PARITY_MIN_COSINE}).")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
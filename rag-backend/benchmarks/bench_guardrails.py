@@ -0,0 +1,64 @@
+"""
+Guardrail cost per call: the original per-keyword substring scan versus the
+compiled GuardrailEngine, as the allow-list grows from the built-in keywords
+to thousands of terms.
+
+Run from rag-backend/:  python -m benchmarks.bench_guardrails
+"""
+import random
+import string
+import time
+
+from guardrails import MATH_KEYWORDS, GuardrailEngine
+
+SIZES = [len(MATH_KEYWORDS), 1_000, 5_000]
+ROUNDS = 2_000
+
+INPUTS = [
+    "What is the formula for integration by parts?",
+    "Can you reset my password and assume I forgot it",
+    "Find the eccentricity of the ellipse x^2/9 + y^2/4 = 1 and explain each step in detail",
+    "tell me a joke about cats",
+]
+
+
+def _synthetic_terms(n, rng):
+    terms = list(MATH_KEYWORDS)
+    while len(terms) < n:
+        terms.append("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 12))))
+    return terms
+
+
+def _substring_scan(terms, text):
+    lowered = text.lower()
+    return any(word in lowered for word in terms)
+
+
+def _us_per_call(fn):
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        fn(INPUTS[i % len(INPUTS)])
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def main():
+    rng = random.Random(0)
+    print(f"\n{'terms':>7} {'substring scan':>16} {'compiled':>10} {'compile once':>14}")
+    for size in SIZES:
+        terms = _synthetic_terms(size, rng)
+        start = time.perf_counter()
+        engine = GuardrailEngine(terms)
+        compile_ms = (time.perf_counter() - start) * 1000
+
+        scan = _us_per_call(lambda text: _substring_scan(terms, text))
+        compiled = _us_per_call(engine.matched_keyword)
+        print(f"{size:>7} {scan:>14.1f}us {compiled:>8.1f}us {compile_ms:>12.1f}ms")
+
+    engine = GuardrailEngine()
+    start = time.perf_counter()
+    engine.check_inputs(INPUTS * 250)
+    print(f"\nbatch of {len(INPUTS) * 250} inputs: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
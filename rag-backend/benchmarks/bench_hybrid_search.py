@@ -0,0 +1,224 @@
+"""
+Recall@k and latency of vector, lexical (BM25) and hybrid (RRF) KB search.
+
+Each labeled question names the seed document that answers it. Half of the
+questions are written in LaTeX or bare formulas, the rest in plain words, so
+the table shows where each ranking helps. Besides recall@k and MRR it
+reports the KB route rate: the share of questions the router would answer
+from the KB (best vector distance under the router threshold, or best BM25
+coverage at least LEXICAL_ROUTE_SCORE; the rest would go to web search), and
+how many of those routed questions also retrieved the right document.
+
+The vector side is an exact NumPy index over the seed documents embedded
+with the configured embedding backend (the same neighbours Chroma returns).
+The lexical latency rows use synthetic corpora sampled from the seed
+vocabulary to show how BM25 queries scale with the KB size.
+
+Run from rag-backend/:
+    python -m benchmarks.bench_hybrid_search
+    python -m benchmarks.bench_hybrid_search --metric cosine --sizes 1000 100000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.load_test import percentile
+from kb_search import HYBRID_CANDIDATES, best_distance, embed_queries, fuse_rankings
+from lexical_index import LexicalIndex, tokenize
+from numpy_index import L2, NumpyVectorIndex
+from resources import get_embedding_model
+from router_agent import HIGH_CONFIDENCE_THRESHOLD, LEXICAL_ROUTE_SCORE, lexical_route
+
+SEED_DOCUMENTS = "knowledge_base/seed_documents.jsonl"
+K = 5
+ROUNDS = 20
+
+# (question, id of the seed document that answers it)
+LATEX_QUESTIONS = [
+    (r"\int x \cos(x) dx", "doc_6"),
+    (r"$S_n = n(n+1)/2$", "doc_16"),
+    (r"$\int_0^{\pi/2} \sin^n(x) dx$", "doc_9"),
+    (r"$\int_a^b f(x) dx = F(b) - F(a)$", "doc_8"),
+    (r"$\frac{dy}{dx} = f'(g(x)) \cdot g'(x)$", "doc_2"),
+    (r"$\lim_{x \to a} \frac{f(x)}{g(x)}$ of the form 0/0", "doc_5"),
+    (r"$(x-h)^2 + (y-k)^2 = r^2$", "doc_11"),
+    (r"$e = \sqrt{1 - \frac{b^2}{a^2}}$", "doc_13"),
+    (r"tangent to $y^2 = 4ax$ at $(x_1, y_1)$", "doc_14"),
+    (r"$S_{\infty} = \frac{a}{1-r}$", "doc_17"),
+    (r"$(x+y)^n = \sum_{k=0}^n \binom{n}{k} x^{n-k} y^k$", "doc_18"),
+    (r"$P(n, r) = \frac{n!}{(n-r)!}$", "doc_19"),
+    (r"$(\cos \theta + i \sin \theta)^n$", "doc_22"),
+    (r"$D = b^2 - 4ac$", "doc_24"),
+    (r"$\mathbf{a} \cdot (\mathbf{b} \times \mathbf{c})$", "doc_25"),
+    (r"$P(A|B) = \frac{P(B|A) P(A)}{P(B)}$", "doc_29"),
+    (r"$P(X=k) = \binom{n}{k} p^k (1-p)^{n-k}$", "doc_30"),
+    ("∫ u dv = uv − ∫ v du", "doc_6"),
+]
+TEXT_QUESTIONS = [
+    ("What is the formula for integration by parts?", "doc_6"),
+    ("What is the sum of the first n natural numbers?", "doc_16"),
+    ("How do I differentiate a composite function?", "doc_2"),
+    ("State the mean value theorem.", "doc_3"),
+    ("How do I find a local maximum of a function?", "doc_4"),
+    ("What is the area between two curves?", "doc_10"),
+    ("What is the distance between two parallel lines?", "doc_12"),
+    ("When are three points collinear?", "doc_15"),
+    ("What is the sum of an infinite geometric progression?", "doc_17"),
+    ("State the Cauchy-Schwarz inequality.", "doc_20"),
+    ("What is the polar form of a complex number?", "doc_21"),
+    ("What is the sum and product of roots of a quadratic?", "doc_23"),
+    ("Which vector is perpendicular to two given vectors?", "doc_26"),
+    ("What is the equation of a plane in normal form?", "doc_27"),
+    ("Shortest distance between two skew lines", "doc_28"),
+    ("State Bayes' theorem.", "doc_29"),
+]
+
+
+def _seed_corpus():
+    ids, texts = [], []
+    with open(SEED_DOCUMENTS) as f:
+        for line in f:
+            doc = json.loads(line)
+            ids.append(doc["id"])
+            texts.append(doc["text"])
+    return ids, texts
+
+
+def _rankings(questions, vector_index, lexical_index, candidates):
+    """
+    Vector, lexical and fused top-K hits per question, each with whether the
+    router would take the KB route on that search's signals.
+    """
+    vectors = embed_queries([q for q, _ in questions])
+    vector_hits = vector_index.query(vectors, candidates)
+    lexical_hits = lexical_index.query([q for q, _ in questions], candidates)
+
+    def vector_route(hits):
+        return bool(hits) and best_distance(hits) < HIGH_CONFIDENCE_THRESHOLD
+
+    def lexical_only_route(hits):
+        return bool(hits) and lexical_route(hits[0][1])
+
+    return {
+        "vector": [(v[:K], vector_route(v)) for v in vector_hits],
+        "lexical": [(l[:K], lexical_only_route(l)) for l in lexical_hits],
+        "hybrid": [
+            (fuse_rankings(v, l, K), vector_route(v) or lexical_only_route(l))
+            for v, l in zip(vector_hits, lexical_hits)
+        ],
+    }
+
+
+def _quality(questions, results, text_to_id):
+    recall = {1: 0, 3: 0, 5: 0}
+    reciprocal_ranks = 0.0
+    routed = routed_correct = 0
+    for (_, relevant), (hits, kb_route) in zip(questions, results):
+        ranked = [text_to_id[document] for document, _ in hits]
+        rank = ranked.index(relevant) + 1 if relevant in ranked else None
+        for k in recall:
+            recall[k] += rank is not None and rank <= k
+        reciprocal_ranks += 1.0 / rank if rank else 0.0
+        if kb_route:
+            routed += 1
+            routed_correct += rank is not None
+    n = len(questions)
+    return {
+        "r@1": recall[1] / n, "r@3": recall[3] / n, "r@5": recall[5] / n,
+        "mrr": reciprocal_ranks / n, "kb_route": routed / n, "kb_correct": routed_correct / n,
+    }
+
+
+def _latency_ms(fn, questions, rounds):
+    samples = []
+    for _ in range(rounds):
+        for question in questions:
+            start = time.perf_counter()
+            fn(question)
+            samples.append((time.perf_counter() - start) * 1000)
+    return percentile(samples, 50), percentile(samples, 95)
+
+
+def _synthetic_corpus(texts, size, rng):
+    """Documents of 20-60 tokens sampled from the seed vocabulary."""
+    vocabulary = [term for text in texts for term in tokenize(text)]
+    return [(f"syn_{i}", " ".join(rng.choices(vocabulary, k=rng.randint(20, 60)))) for i in range(size)]
+
+
+def _size_mb(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    ) / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k and latency of vector, lexical and hybrid KB search.")
+    parser.add_argument("--metric", default=L2, help="Vector distance (Chroma's default is l2).")
+    parser.add_argument("--candidates", type=int, default=HYBRID_CANDIDATES, help="Candidates per ranking before fusion.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="Synthetic corpus sizes for the lexical scaling rows.")
+    args = parser.parse_args()
+
+    ids, texts = _seed_corpus()
+    text_to_id = dict(zip(texts, ids))
+    questions = LATEX_QUESTIONS + TEXT_QUESTIONS
+
+    embeddings = np.asarray(get_embedding_model().encode(texts, batch_size=64), dtype=np.float32)
+    vector_index = NumpyVectorIndex.from_documents(ids, texts, embeddings, args.metric)
+    lexical_index = LexicalIndex.build(zip(ids, texts))
+
+    print(f"\n{len(texts)} seed documents, {args.metric} distance, route threshold {HIGH_CONFIDENCE_THRESHOLD}, "
+          f"lexical route score {LEXICAL_ROUTE_SCORE}, {args.candidates} candidates per ranking")
+    print(f"{'questions':>10} {'search':>8} {'R@1':>6} {'R@3':>6} {'R@5':>6} {'MRR':>6} {'KB route':>9} {'KB+right':>9}")
+    for label, subset in (("latex", LATEX_QUESTIONS), ("text", TEXT_QUESTIONS), ("all", questions)):
+        rankings = _rankings(subset, vector_index, lexical_index, args.candidates)
+        for method, results in rankings.items():
+            q = _quality(subset, results, text_to_id)
+            print(f"{label:>10} {method:>8} {q['r@1']:>6.0%} {q['r@3']:>6.0%} {q['r@5']:>6.0%} {q['mrr']:>6.2f} "
+                  f"{q['kb_route']:>9.0%} {q['kb_correct']:>9.0%}")
+
+    # Per-question latency on the seed KB (the query embedding is memoized after the first round)
+    texts_only = [q for q, _ in questions]
+    vectors = dict(zip(texts_only, embed_queries(texts_only)))
+
+    def vector_search(question):
+        return vector_index.query(vectors[question][np.newaxis, :], args.candidates)[0]
+
+    def hybrid_search(question):
+        return fuse_rankings(vector_search(question), lexical_index.query([question], args.candidates)[0], K)
+
+    print(f"\n{'search':>8} {'p50':>9} {'p95':>9}   (seed KB, per question, embedding excluded)")
+    for method, fn in (
+        ("vector", vector_search),
+        ("lexical", lambda question: lexical_index.query([question], args.candidates)),
+        ("hybrid", hybrid_search),
+    ):
+        p50, p95 = _latency_ms(fn, texts_only, ROUNDS)
+        print(f"{method:>8} {p50:>7.3f}ms {p95:>7.3f}ms")
+
+    rng = random.Random(0)
+    print(f"\n{'docs':>8} {'terms':>8} {'postings':>10} {'build':>8} {'on disk':>9} {'load':>8} {'p50':>9} {'p95':>9}")
+    for size in args.sizes:
+        corpus = _synthetic_corpus(texts, size, rng)
+        start = time.perf_counter()
+        index = LexicalIndex.build(corpus)
+        build_s = time.perf_counter() - start
+        with tempfile.TemporaryDirectory() as index_dir:
+            index.save(index_dir)
+            disk_mb = _size_mb(index_dir)
+            start = time.perf_counter()
+            loaded = LexicalIndex.load(index_dir)
+            load_ms = (time.perf_counter() - start) * 1000
+            p50, p95 = _latency_ms(lambda question: loaded.query([question], args.candidates), texts_only, 3)
+        print(f"{size:>8} {len(index.terms):>8} {len(index.posting_docs):>10} {build_s:>7.2f}s {disk_mb:>7.1f}MB "
+              f"{load_ms:>6.1f}ms {p50:>7.3f}ms {p95:>7.3f}ms")
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Latency and recall of the NumPy vector index against Chroma.
+
+The KB is exported from ./chromadb_math_jee and padded with synthetic unit
+vectors up to each target size, so the comparison also shows how both stores
+scale as the KB grows. Recall@k is measured against exact brute-force
+neighbours (which the NumPy index returns by construction).
+
+Run from rag-backend/:  python -m benchmarks.bench_numpy_index
+"""
+import statistics
+import time
+
+import chromadb
+import numpy as np
+
+from kb_search import COLLECTION_NAME, get_chroma_collection
+from numpy_index import NumpyVectorIndex
+
+SIZES = [1_000, 10_000, 50_000]
+QUERIES = 200
+BATCH = 32
+K = 5
+
+
+def _p50_ms(fn, rounds):
+    samples = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def _corpus(size, rng):
+    kb = get_chroma_collection(COLLECTION_NAME).get(include=["documents", "embeddings"])
+    embeddings = np.asarray(kb["embeddings"], dtype=np.float32)
+    documents = list(kb["documents"])
+
+    extra = size - len(documents)
+    synthetic = rng.normal(size=(extra, embeddings.shape[1])).astype(np.float32)
+    synthetic /= np.linalg.norm(synthetic, axis=1, keepdims=True)
+    embeddings = np.concatenate([embeddings, synthetic])
+    documents += [f"synthetic passage {i}" for i in range(extra)]
+    ids = [f"doc_{i}" for i in range(size)]
+    return ids, documents, embeddings
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"\n{'docs':>8} {'chroma p50':>12} {'numpy p50':>11} "
+          f"{'chroma batch':>13} {'numpy batch':>12} {'chroma R@5':>11} {'numpy R@5':>10}")
+
+    for size in SIZES:
+        ids, documents, embeddings = _corpus(size, rng)
+
+        client = chromadb.EphemeralClient()
+        collection = client.create_collection(f"bench_{size}")
+        for start in range(0, size, 5000):
+            collection.add(
+                ids=ids[start:start + 5000],
+                documents=documents[start:start + 5000],
+                embeddings=embeddings[start:start + 5000].tolist(),
+            )
+        index = NumpyVectorIndex.from_documents(ids, documents, embeddings)
+
+        # Queries are noisy copies of stored vectors, like paraphrased questions
+        picks = rng.integers(0, size, QUERIES)
+        queries = embeddings[picks] + 0.05 * rng.normal(size=(QUERIES, embeddings.shape[1])).astype(np.float32)
+
+        truth = index.search(queries, K)[0]
+        chroma_ids = collection.query(query_embeddings=queries.tolist(), n_results=K)["ids"]
+        chroma_hits = [[int(i.split("_")[1]) for i in row] for row in chroma_ids]
+        chroma_recall = np.mean([len(set(h) & set(t)) / K for h, t in zip(chroma_hits, truth)])
+        numpy_recall = np.mean([len(set(h) & set(t)) / K for h, t in zip(index.search(queries, K)[0], truth)])
+
+        chroma_single = _p50_ms(lambda i: collection.query(query_embeddings=[queries[i].tolist()], n_results=K), QUERIES)
+        numpy_single = _p50_ms(lambda i: index.query(queries[i:i + 1], K), QUERIES)
+        chroma_batch = _p50_ms(lambda i: collection.query(query_embeddings=queries[:BATCH].tolist(), n_results=K), 20)
+        numpy_batch = _p50_ms(lambda i: index.query(queries[:BATCH], K), 20)
+
+        print(f"{size:>8} {chroma_single:>10.2f}ms {numpy_single:>9.2f}ms "
+              f"{chroma_batch:>11.2f}ms {numpy_batch:>10.2f}ms {chroma_recall:>11.3f} {numpy_recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
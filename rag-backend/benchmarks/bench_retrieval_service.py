@@ -0,0 +1,65 @@
+"""
+Per-query retrieval latency: a fresh Chroma client per query (old behaviour)
+versus the long-lived RetrievalService.
+
+Run from rag-backend/:  python -m benchmarks.bench_retrieval_service
+"""
+import statistics
+import time
+
+from resources import get_embedding_model
+from kb_search import (
+    COLLECTION_NAME,
+    RetrievalService,
+    get_chroma_collection,
+)
+
+QUERIES = [
+    "What is the formula for integration by parts?",
+    "Sum of first n natural numbers",
+    "Eccentricity of an ellipse",
+    "State Bayes theorem",
+    "Nature of roots of a quadratic equation",
+]
+ROUNDS = 40
+
+
+def _report(label: str, samples_ms):
+    samples_ms = sorted(samples_ms)
+    p95 = samples_ms[int(0.95 * (len(samples_ms) - 1))]
+    print(
+        f"{label:<28} mean={statistics.mean(samples_ms):7.2f}ms  "
+        f"p50={statistics.median(samples_ms):7.2f}ms  p95={p95:7.2f}ms"
+    )
+
+
+def main():
+    # Embeddings are computed up front so only the VectorDB path is timed.
+    vectors = get_embedding_model().encode(QUERIES).tolist()
+
+    before = []
+    for _ in range(ROUNDS):
+        for vec in vectors:
+            start = time.perf_counter()
+            collection = get_chroma_collection(COLLECTION_NAME)
+            collection.query(query_embeddings=[vec], n_results=5, include=['documents', 'distances'])
+            before.append((time.perf_counter() - start) * 1000)
+
+    service = RetrievalService()
+    service.start()
+    after = []
+    for _ in range(ROUNDS):
+        for vec in vectors:
+            start = time.perf_counter()
+            collection = service.get_collection()
+            collection.query(query_embeddings=[vec], n_results=5, include=['documents', 'distances'])
+            after.append((time.perf_counter() - start) * 1000)
+    service.close()
+
+    print(f"\n{len(before)} queries per variant")
+    _report("client per query (before)", before)
+    _report("RetrievalService (after)", after)
+
+
+if __name__ == "__main__":
+    main()
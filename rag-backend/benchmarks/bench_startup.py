@@ -0,0 +1,58 @@
+"""
+Cold-start cost of the backend: time to import `main_api_app` (what uvicorn
+pays before it can answer /healthz) and time for the explicit warm-up phase
+(what a pod pays before /readyz turns green).
+
+Each phase runs in a fresh interpreter so nothing is cached between samples.
+
+Run from rag-backend/:  python -m benchmarks.bench_startup
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+RUNS = 5
+
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main_api_app
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "torch_loaded": "torch" in sys.modules}))
+"""
+
+WARM_UP_PROBE = """
+import json, time
+import main_api_app
+from resources import warm_up, is_ready
+start = time.perf_counter()
+warm_up()
+print(json.dumps({"seconds": time.perf_counter() - start, "ready": is_ready()}))
+"""
+
+
+def _run(probe: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", probe], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    imports = [_run(IMPORT_PROBE) for _ in range(RUNS)]
+    warm_ups = [_run(WARM_UP_PROBE) for _ in range(RUNS)]
+
+    print(f"\n{RUNS} fresh interpreters per phase")
+    print(
+        f"import main_api_app   median={statistics.median(r['seconds'] for r in imports):6.2f}s  "
+        f"torch loaded at import: {any(r['torch_loaded'] for r in imports)}"
+    )
+    print(
+        f"warm_up()             median={statistics.median(r['seconds'] for r in warm_ups):6.2f}s  "
+        f"ready: {all(r['ready'] for r in warm_ups)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Multi-worker scaling: throughput and per-worker memory of the API under
+gunicorn (gunicorn_conf.py) with 1, 2, 4, ... uvicorn workers, with and
+without the pre-fork preload.
+
+Every configuration starts a fresh gunicorn with the fake Gemini and Tavily
+providers at zero latency and the answer/search caches off, so each request
+spends its time on CPU (guardrails, query embedding, vector search) and
+throughput shows how that work scales across cores. Load comes from several
+client processes, so the client is not the bottleneck.
+
+Memory is read from /proc/<pid>/smaps_rollup (Linux) once the load has run:
+RSS counts shared pages in full for every worker, USS only the worker's
+private pages, and PSS splits shared pages between the processes that map
+them. The total PSS of the master and its workers is the real footprint.
+
+Run from rag-backend/ (needs gunicorn and uvicorn):
+    python -m benchmarks.bench_workers
+    python -m benchmarks.bench_workers --workers 1 2 4 8 --seconds 30
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.load_test import KB_QUESTIONS, WEB_QUESTIONS, percentile
+
+SERVER_ENV = {
+    "LLM_PROVIDER": "fake",
+    "SEARCH_PROVIDER": "fake",
+    "FAKE_LLM_LATENCY_MS": "0",
+    "FAKE_SEARCH_LATENCY_MS": "0",
+    "RATE_LIMIT_PER_MINUTE": "0",
+    "ANSWER_CACHE_TTL_SECONDS": "0",
+    "SEARCH_CACHE_TTL_SECONDS": "0",
+    "LOG_LEVEL": "WARNING",
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _memory(pid: int) -> dict:
+    """RSS, PSS and USS of one process in MiB, from smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def _worker_pids(master_pid: int) -> list:
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def _wait_until_ready(base_url: str, workers: int, timeout: float) -> None:
+    """/readyz lands on an arbitrary worker, so wait for a run of consecutive 200s."""
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    streak = 0
+    while time.perf_counter() < deadline:
+        try:
+            ok = httpx.get(f"{base_url}/readyz", timeout=5.0).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        streak = streak + 1 if ok else 0
+        if streak >= 4 * workers:
+            return
+        time.sleep(0.05 if ok else 0.5)
+    raise RuntimeError(f"Server was not ready after {timeout:.0f}s")
+
+
+def _client(args) -> list:
+    """One client process: `concurrency` request loops for `seconds`. Returns latencies in ms."""
+    base_url, concurrency, seconds, web_fraction, seed = args
+    import httpx
+
+    rng = random.Random(seed)
+
+    async def run():
+        latencies = []
+        stop_at = time.perf_counter() + seconds
+        limits = httpx.Limits(max_connections=concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+            async def loop(user: int):
+                i = 0
+                while time.perf_counter() < stop_at:
+                    pool = WEB_QUESTIONS if rng.random() < web_fraction else KB_QUESTIONS
+                    # A distinct suffix per request keeps the embedding memo and single-flight out of the way
+                    query = f"{rng.choice(pool)} (client {seed} user {user} case {i})"
+                    i += 1
+                    start = time.perf_counter()
+                    response = await client.post("/api/solve", json={"query": query, "user_id": f"bench-{seed}-{user}"})
+                    if response.status_code == 200:
+                        latencies.append((time.perf_counter() - start) * 1000)
+
+            await asyncio.gather(*(loop(u) for u in range(concurrency)))
+        return latencies
+
+    return asyncio.run(run())
+
+
+def run_configuration(workers: int, preload: bool, args) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, **SERVER_ENV)
+    env.update(
+        WEB_CONCURRENCY=str(workers),
+        PRELOAD_APP="1" if preload else "0",
+        BIND=f"127.0.0.1:{port}",
+        SEARCH_CACHE_PATH=os.path.join(tempfile.mkdtemp(), "search_cache.sqlite3"),
+    )
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn_conf.py", args.app],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    try:
+        _wait_until_ready(base_url, workers, timeout=300.0)
+        with multiprocessing.Pool(args.client_processes) as pool:
+            jobs = [
+                (base_url, args.concurrency, args.seconds, args.web_fraction, seed)
+                for seed in range(args.client_processes)
+            ]
+            latencies = [ms for chunk in pool.map(_client, jobs) for ms in chunk]
+
+        master = _memory(server.pid)
+        per_worker = [_memory(pid) for pid in _worker_pids(server.pid)]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    return {
+        "workers": workers,
+        "preload": preload,
+        "req_per_s": len(latencies) / args.seconds,
+        "p50": percentile(latencies, 50) if latencies else float("nan"),
+        "p95": percentile(latencies, 95) if latencies else float("nan"),
+        "worker_rss": sum(m["rss"] for m in per_worker) / len(per_worker),
+        "worker_uss": sum(m["uss"] for m in per_worker) / len(per_worker),
+        "total_pss": master["pss"] + sum(m["pss"] for m in per_worker),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and memory of the API across gunicorn worker counts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="Worker counts to try (default: 1, 2, 4, ... up to the core count).")
+    parser.add_argument("--seconds", type=float, default=15.0, help="Load duration per configuration.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Request loops per client process.")
+    parser.add_argument("--client-processes", type=int, default=4)
+    parser.add_argument("--web-fraction", type=float, default=0.3, help="Share of questions aimed at the web route.")
+    parser.add_argument("--no-baseline", action="store_true", help="Skip the PRELOAD_APP=0 runs.")
+    parser.add_argument("--app", default="main_api_app:create_app()", help="Gunicorn app spec.")
+    parser.add_argument("--verbose", action="store_true", help="Show gunicorn's log output.")
+    args = parser.parse_args()
+
+    workers = args.workers
+    if workers is None:
+        cores = os.cpu_count() or 1
+        workers = [n for n in (1, 2, 4, 8, 16, 32) if n <= cores]
+
+    results = []
+    for preload in (True,) if args.no_baseline else (True, False):
+        for n in workers:
+            results.append(run_configuration(n, preload, args))
+
+    print(f"\n{args.client_processes}x{args.concurrency} concurrent clients, {args.seconds:.0f}s per configuration")
+    print(f"{'workers':>7} {'preload':>8} {'req/s':>8} {'scaling':>8} {'p50':>8} {'p95':>8} "
+          f"{'RSS/worker':>11} {'USS/worker':>11} {'total PSS':>10}")
+    for preload in (True, False):
+        rows = [r for r in results if r["preload"] == preload]
+        if not rows:
+            continue
+        base = rows[0]["req_per_s"] / rows[0]["workers"]
+        for r in rows:
+            print(
+                f"{r['workers']:>7} {'yes' if preload else 'no':>8} {r['req_per_s']:>8.1f} "
+                f"{r['req_per_s'] / (base * r['workers']):>7.0%} "
+                f"{r['p50']:>6.0f}ms {r['p95']:>6.0f}ms "
+                f"{r['worker_rss']:>8.0f}MiB {r['worker_uss']:>8.0f}MiB {r['total_pss']:>7.0f}MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Offline load test of POST /api/solve.
+
+The app runs in-process behind httpx's ASGI transport, with the fake Gemini
+and Tavily providers (see fake_providers.py), so no network or API quota is
+used. The embedding model and the local KB are real. Requests are a mix of
+KB-answerable and web-routed questions; results are grouped by the route
+the gateway took. Upstream failures show up as HTTP 503/504 rows, admission
+control refusals as HTTP 429, and the degraded column counts web-routed
+answers served from the KB instead. The global LLM concurrency cap
+(MAX_IN_FLIGHT_LLM) stays on; the per-user rate limit is off unless
+--with-rate-limit is given.
+
+Run from rag-backend/:
+    python -m benchmarks.load_test --concurrency 32 --requests 1000
+    FAKE_LLM_LATENCY_MS=1500 FAKE_LLM_ERROR_RATE=0.02 python -m benchmarks.load_test
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+# Fake providers unless explicitly overridden; configured before the app is imported
+os.environ.setdefault("LLM_PROVIDER", "fake")
+os.environ.setdefault("SEARCH_PROVIDER", "fake")
+
+KB_QUESTIONS = [
+    "What is the formula for integration by parts?",
+    "Find the derivative of sin x using first principles.",
+    "What is the eccentricity of an ellipse?",
+    "Find the sum of an infinite geometric progression.",
+    "What is the modulus of a complex number?",
+    "Explain the dot product of two vectors.",
+    "State Bayes' theorem in probability.",
+    "When does a quadratic equation have equal roots?",
+]
+
+WEB_QUESTIONS = [
+    "Explain the Jacobian determinant for a change to spherical coordinates.",
+    "Find the Fourier series of a square wave function.",
+    "Solve the Laplace transform of t^2 e^{3t}.",
+    "Prove that the eigenvalues of a real symmetric matrix are real.",
+    "Explain the Cauchy-Riemann equations for complex differentiability.",
+    "Find the volume of a torus using the theorem of Pappus.",
+]
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+async def _wait_until_ready(client, timeout: float) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if (await client.get("/readyz")).status_code == 200:
+            return
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"App was not ready after {timeout:.0f}s: {(await client.get('/readyz')).json()}")
+
+
+async def run_load(concurrency: int, total_requests: int, web_fraction: float, seed: int):
+    import httpx
+    from main_api_app import app
+
+    rng = random.Random(seed)
+    plan = []
+    for i in range(total_requests):
+        pool = WEB_QUESTIONS if rng.random() < web_fraction else KB_QUESTIONS
+        # A distinct suffix per request keeps single-flight from coalescing the load
+        plan.append(f"{rng.choice(pool)} (case {i})")
+
+    latencies = defaultdict(list)
+    degraded = defaultdict(int)
+    next_index = 0
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=120.0) as client:
+            await _wait_until_ready(client, timeout=300.0)
+
+            async def worker(user_id: str):
+                nonlocal next_index
+                while next_index < len(plan):
+                    query = plan[next_index]
+                    next_index += 1
+                    start = time.perf_counter()
+                    response = await client.post("/api/solve", json={"query": query, "level": "JEE", "user_id": user_id})
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    if response.status_code == 200:
+                        body = response.json()
+                        route = body["mode"] + (" (cached)" if body.get("cached") else "")
+                        latencies[route].append(elapsed_ms)
+                        degraded[route] += body.get("degraded", False)
+                    else:
+                        # Upstream failures are 503/504, guardrail decisions 400/403
+                        latencies[f"HTTP {response.status_code}"].append(elapsed_ms)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(f"load-test-{i}") for i in range(concurrency)))
+            wall_seconds = time.perf_counter() - start
+
+    return latencies, degraded, wall_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of /api/solve with fake LLM and search providers.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--web-fraction", type=float, default=0.3, help="Share of questions aimed at the web route.")
+    parser.add_argument("--with-cache", action="store_true", help="Keep the answer and search caches enabled.")
+    parser.add_argument("--with-rate-limit", action="store_true", help="Keep the per-user rate limit enabled.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.with_rate_limit:
+        # Each concurrent worker is one user; the per-user limit would dominate the run
+        os.environ["RATE_LIMIT_PER_MINUTE"] = "0"
+
+    if not args.with_cache:
+        os.environ["ANSWER_CACHE_TTL_SECONDS"] = "0"
+        os.environ["SEARCH_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "search_cache.sqlite3")
+        os.environ["SEARCH_CACHE_TTL_SECONDS"] = "0"
+
+    latencies, degraded, wall_seconds = asyncio.run(
+        run_load(args.concurrency, args.requests, args.web_fraction, args.seed)
+    )
+
+    total = sum(len(v) for v in latencies.values())
+    print(
+        f"\n{total} requests, concurrency {args.concurrency}, {wall_seconds:.1f}s wall, "
+        f"{total / wall_seconds:.1f} req/s overall "
+        f"(LLM={os.environ['LLM_PROVIDER']}, search={os.environ['SEARCH_PROVIDER']})"
+    )
+    print(f"{'route':<24} {'count':>6} {'req/s':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'degraded':>9}")
+    for route, samples in sorted(latencies.items()):
+        print(
+            f"{route:<24} {len(samples):>6} {len(samples) / wall_seconds:>7.1f} "
+            f"{percentile(samples, 50):>7.0f}ms {percentile(samples, 95):>7.0f}ms "
+            f"{percentile(samples, 99):>7.0f}ms {degraded[route]:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
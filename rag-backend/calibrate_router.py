@@ -0,0 +1,339 @@
+"""
+Offline calibration of the router's KB/Web distance threshold.
+
+    python calibrate_router.py                               # report and write router_config.json
+    python calibrate_router.py routing_log.jsonl.1 routing_log.jsonl --dry-run
+
+Streams the routing log (routing_log.py): `decision` lines give the traffic
+(level, topic and closest vector distance of every routed query) and
+`feedback` lines say whether the answer was good. Queries sent to the KB by a
+lexical hit (LEXICAL_ROUTE_SCORE) take that route whatever the distance
+threshold, so they and their feedback are left out of the sweep. Feedback is matched with its decision by
+request id, then by normalized query; feedback without a decision uses
+1 - confidence_score as the distance.
+
+For each segment (all traffic, each level, each topic, each level/topic pair)
+thresholds are swept and every one is scored on the logged traffic:
+
+- web-call rate: share of queries at or above the threshold, and
+- estimated quality: queries below the threshold count with the KB answer
+  accuracy observed at their distance (feedback on KB answers, in distance
+  bins), the rest with the accuracy of web answers.
+
+The recommended threshold is the one with the lowest web-call rate whose
+estimated quality stays within --max-quality-drop of the current threshold's.
+Web accuracy comes from rated web answers (the segment's, else the whole
+log's) or --web-accuracy. Without either, quality cannot be estimated: the
+report shows it as unmeasured and no threshold is written.
+A threshold is only raised over distances where KB answers have feedback;
+above the current threshold those come from hedged answers (HEDGE_BAND) and
+degraded fallbacks, so run with hedging on for a while to collect them.
+Segments with too little feedback are left out and fall back to the broader
+segment when the router loads the config.
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from router_agent import (
+    ANY,
+    KB_RESPONSE,
+    LEXICAL_SIGNAL,
+    ROUTER_CONFIG_PATH,
+    WEB_SEARCH,
+    query_topic,
+    route_threshold,
+)
+from routing_log import DECISION, FEEDBACK, ROUTING_LOG_PATH
+
+# CONFIGURATION
+
+# Assessments that count as a good answer; every other assessment counts as bad
+GOOD_ASSESSMENTS = {"CORRECT"}
+DEFAULT_MAX_QUALITY_DROP = 0.01
+# Rated KB answers a segment needs before it gets its own threshold
+DEFAULT_MIN_FEEDBACK = 20
+# Rated KB answers a distance bin needs before the threshold may be raised over it
+DEFAULT_MIN_BIN_FEEDBACK = 3
+DEFAULT_BIN_WIDTH = 0.05
+DEFAULT_STEP = 0.01
+
+
+@dataclass
+class Segment:
+    """Traffic distances and rated answers of one level/topic segment."""
+    distances: List[float] = field(default_factory=list)
+    kb_feedback: List[Tuple[float, bool]] = field(default_factory=list)
+    web_feedback: List[Tuple[float, bool]] = field(default_factory=list)
+
+
+def _read_lines(paths: List[str]) -> Iterator[dict]:
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash mid-write
+                    continue
+
+
+def load_segments(paths: List[str]) -> Tuple[Dict[Tuple[str, str], Segment], Dict[str, int]]:
+    """
+    Streams the logs into per-segment samples, keyed (level, topic) with "*"
+    for "any". Returns the segments and read counters.
+    """
+    by_request: Dict[Tuple[str, str], dict] = {}
+    by_query: Dict[str, dict] = {}
+    segments: Dict[Tuple[str, str], Segment] = defaultdict(Segment)
+    counts = defaultdict(int)
+
+    def segment_keys(level: Optional[str], topic: str):
+        keys = [(ANY, ANY), (ANY, topic)]
+        if level is not None:
+            keys += [(level, ANY), (level, topic)]
+        return keys
+
+    for entry in _read_lines(paths):
+        if entry.get("type") == DECISION:
+            counts["decisions"] += 1
+            # Older logs have a single "distance" field
+            decision = {
+                "level": entry["level"],
+                "topic": entry["topic"],
+                "distance": entry.get("vector_distance", entry.get("distance")),
+                "signal": entry.get("signal"),
+            }
+            by_request[(entry.get("request_id"), entry["query"])] = decision
+            by_query[entry["query"]] = decision
+            if decision["signal"] == LEXICAL_SIGNAL:
+                counts["lexical_routed"] += 1
+                continue
+            # A query without KB hits goes to the web at any threshold
+            distance = float("inf") if decision["distance"] is None else decision["distance"]
+            for key in segment_keys(entry["level"], entry["topic"]):
+                segments[key].distances.append(distance)
+
+        elif entry.get("type") == FEEDBACK and entry.get("assessment"):
+            counts["feedback"] += 1
+            query = entry.get("query", "")
+            decision = by_request.get((entry.get("request_id"), query)) or by_query.get(query)
+            if decision is not None and decision["signal"] == LEXICAL_SIGNAL:
+                continue
+            if decision is not None and decision["distance"] is not None:
+                counts["feedback_matched"] += 1
+                level, topic, distance = decision["level"], decision["topic"], decision["distance"]
+            elif entry.get("confidence") is not None:
+                level, topic, distance = None, query_topic(query), 1.0 - entry["confidence"]
+            else:
+                continue
+
+            good = entry["assessment"] in GOOD_ASSESSMENTS
+            for key in segment_keys(level, topic):
+                if entry.get("route_mode") == KB_RESPONSE:
+                    segments[key].kb_feedback.append((distance, good))
+                elif entry.get("route_mode") == WEB_SEARCH:
+                    segments[key].web_feedback.append((distance, good))
+
+    if not counts["decisions"]:
+        # No decision log: the rated queries themselves stand in for the traffic
+        for segment in segments.values():
+            segment.distances = [d for d, _ in segment.kb_feedback + segment.web_feedback]
+    return segments, counts
+
+
+def _smoothed(good: float, total: float, prior: float, strength: float = 2.0) -> float:
+    """Accuracy shrunk towards `prior`, so sparse bins do not swing the estimate."""
+    return (good + strength * prior) / (total + strength)
+
+
+def sweep(
+    segment: Segment,
+    current: float,
+    web_accuracy_fallback: Optional[float],
+    args,
+) -> Optional[dict]:
+    """
+    Scores thresholds for one segment. Returns the current and recommended
+    operating points and the sweep, or None without enough feedback.
+
+    `web_accuracy_fallback` is used when the segment has too few rated web
+    answers of its own. When it is None as well, quality is unmeasured and
+    the current threshold is kept.
+    """
+    if len(segment.kb_feedback) < args.min_feedback or not segment.distances:
+        return None
+
+    kb = np.array(segment.kb_feedback, dtype=np.float64)
+    kb_prior = kb[:, 1].mean()
+    if args.web_accuracy is not None:
+        web_accuracy = args.web_accuracy
+    elif len(segment.web_feedback) >= args.min_feedback and web_accuracy_fallback is not None:
+        web_good = sum(good for _, good in segment.web_feedback)
+        web_accuracy = _smoothed(web_good, len(segment.web_feedback), web_accuracy_fallback)
+    else:
+        web_accuracy = web_accuracy_fallback
+
+    traffic = np.sort(np.array(segment.distances, dtype=np.float64))
+    finite = traffic[np.isfinite(traffic)]
+    top = max(float(finite.max()) if len(finite) else current, current) + args.step
+    bins = np.arange(0.0, top + args.bin_width, args.bin_width)
+
+    # KB accuracy per distance bin, and for every logged query
+    bin_of_kb = np.clip(np.digitize(kb[:, 0], bins) - 1, 0, len(bins) - 1)
+    bin_total = np.bincount(bin_of_kb, minlength=len(bins)).astype(np.float64)
+    bin_good = np.bincount(bin_of_kb, weights=kb[:, 1], minlength=len(bins))
+    bin_accuracy = _smoothed(bin_good, bin_total, kb_prior)
+    bin_of_traffic = np.clip(np.digitize(np.where(np.isfinite(traffic), traffic, 0.0), bins) - 1, 0, len(bins) - 1)
+    kb_quality = np.where(np.isfinite(traffic), bin_accuracy[bin_of_traffic], web_accuracy or 0.0)
+    # quality(t) = (sum of KB quality below t + web accuracy * count at or above t) / n
+    prefix = np.concatenate([[0.0], np.cumsum(kb_quality)])
+    n = len(traffic)
+
+    def point(threshold: float) -> dict:
+        below = int(np.searchsorted(traffic, threshold, side="left"))
+        return {
+            "threshold": round(threshold, 4),
+            "web_rate": (n - below) / n,
+            "quality": None if web_accuracy is None else (prefix[below] + web_accuracy * (n - below)) / n,
+        }
+
+    # Raising the threshold over a bin that has traffic needs KB feedback there
+    traffic_per_bin = np.bincount(bin_of_traffic[np.isfinite(traffic)], minlength=len(bins))
+    unsupported = (traffic_per_bin > 0) & (bin_total < args.min_bin_feedback)
+
+    def supported(threshold: float) -> bool:
+        if threshold <= current:
+            return True
+        first = int(np.digitize(current, bins)) - 1
+        last = int(np.digitize(threshold, bins)) - 1
+        return not unsupported[max(first, 0):last + 1].any()
+
+    baseline = point(current)
+    points = [point(t) for t in np.arange(args.step, top, args.step)]
+    # Without a web accuracy the trade-off cannot be scored, so nothing moves
+    eligible = [] if web_accuracy is None else [
+        p for p in points
+        if supported(p["threshold"]) and p["quality"] >= baseline["quality"] - args.max_quality_drop
+    ]
+    best = min(eligible, key=lambda p: (p["web_rate"], -p["quality"]), default=baseline)
+    if best["web_rate"] >= baseline["web_rate"]:
+        best = baseline
+    return {
+        "queries": n,
+        "kb_feedback": len(segment.kb_feedback),
+        "web_feedback": len(segment.web_feedback),
+        "web_accuracy": None if web_accuracy is None else round(web_accuracy, 4),
+        "current": baseline,
+        "recommended": best,
+        "sweep": points,
+    }
+
+
+def calibrate(paths: List[str], args) -> Tuple[Dict[str, dict], Dict[str, int]]:
+    segments, counts = load_segments(paths)
+    overall = segments.get((ANY, ANY), Segment())
+    # Web accuracy of the whole log; unmeasured (None) below --min-feedback rated web answers
+    web_prior = None
+    if len(overall.web_feedback) >= args.min_feedback:
+        web_prior = _smoothed(sum(good for _, good in overall.web_feedback), len(overall.web_feedback), 0.5)
+
+    results = {}
+    # Broadest segments first, so the report reads top-down
+    for level, topic in sorted(segments, key=lambda k: (k[0] != ANY, k[1] != ANY, k)):
+        result = sweep(segments[(level, topic)], route_threshold(level, topic), web_prior, args)
+        if result is not None:
+            results[f"{level}/{topic}"] = result
+    return results, counts
+
+
+def _percent(value: Optional[float]) -> str:
+    return "unmeasured" if value is None else f"{value:.1%}"
+
+
+def web_accuracy_missing(results: Dict[str, dict]) -> bool:
+    return any(r["web_accuracy"] is None for r in results.values())
+
+
+def print_report(results: Dict[str, dict], counts: Dict[str, int], args) -> None:
+    print(
+        f"\n{counts['decisions']} routing decisions, {counts['feedback']} feedback "
+        f"({counts['feedback_matched']} matched to a decision)"
+    )
+    if counts["lexical_routed"]:
+        print(f"{counts['lexical_routed']} decisions took the lexical KB route and are left out of the sweep")
+    if not results:
+        print(f"No segment has {args.min_feedback} rated KB answers yet; nothing to calibrate.")
+        return
+
+    print(f"\n{'segment':<44} {'queries':>8} {'kb fb':>6} {'web fb':>6} "
+          f"{'threshold':>15} {'web rate':>15} {'est. quality':>24}")
+    for key, r in results.items():
+        cur, rec = r["current"], r["recommended"]
+        print(
+            f"{key:<44} {r['queries']:>8} {r['kb_feedback']:>6} {r['web_feedback']:>6} "
+            f"{cur['threshold']:>6.2f} -> {rec['threshold']:<5.2f} "
+            f"{cur['web_rate']:>6.1%} -> {rec['web_rate']:<6.1%} "
+            f"{_percent(cur['quality']):>10} -> {_percent(rec['quality']):<10}"
+        )
+
+    overall = results.get(f"{ANY}/{ANY}")
+    if overall:
+        print(f"\nSweep over all traffic (web accuracy {_percent(overall['web_accuracy'])})")
+        print(f"{'threshold':>9} {'web rate':>9} {'est. quality':>13}")
+        every = max(1, round(args.bin_width / args.step))
+        for p in overall["sweep"][every - 1::every]:
+            print(f"{p['threshold']:>9.2f} {p['web_rate']:>9.1%} {_percent(p['quality']):>13}")
+
+    if web_accuracy_missing(results):
+        print(
+            f"\nFewer than {args.min_feedback} rated web answers in the log, so answer quality above the "
+            "current thresholds is unmeasured and no threshold is raised. Collect feedback on web answers "
+            "or pass --web-accuracy."
+        )
+
+
+def write_config(results: Dict[str, dict], counts: Dict[str, int], path: str) -> None:
+    config = {
+        "thresholds": {key: r["recommended"]["threshold"] for key, r in results.items()},
+        "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "source": dict(counts),
+        "segments": {key: {k: v for k, v in r.items() if k != "sweep"} for key, r in results.items()},
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+    print(f"\nWrote {len(config['thresholds'])} thresholds to {path}; restart the API to load them.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate the router's KB/Web threshold from the routing log.")
+    parser.add_argument("logs", nargs="*", default=[ROUTING_LOG_PATH], help="Routing log files, oldest first.")
+    parser.add_argument("--output", default=ROUTER_CONFIG_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="Report only; do not write the config.")
+    parser.add_argument("--max-quality-drop", type=float, default=DEFAULT_MAX_QUALITY_DROP,
+                        help="Largest allowed drop in estimated quality versus the current threshold.")
+    parser.add_argument("--min-feedback", type=int, default=DEFAULT_MIN_FEEDBACK)
+    parser.add_argument("--min-bin-feedback", type=int, default=DEFAULT_MIN_BIN_FEEDBACK)
+    parser.add_argument("--bin-width", type=float, default=DEFAULT_BIN_WIDTH)
+    parser.add_argument("--step", type=float, default=DEFAULT_STEP)
+    parser.add_argument("--web-accuracy", type=float, default=None,
+                        help="Share of good web answers to assume instead of measuring it from feedback.")
+    args = parser.parse_args()
+
+    missing = [path for path in args.logs if not os.path.exists(path)]
+    if missing:
+        raise SystemExit(f"Routing log not found: {', '.join(missing)} (is ROUTING_LOG_PATH set?)")
+    results, counts = calibrate(args.logs, args)
+    print_report(results, counts, args)
+    if web_accuracy_missing(results):
+        raise SystemExit(1)
+    if results and not args.dry_run:
+        write_config(results, counts, args.output)
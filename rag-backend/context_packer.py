@@ -0,0 +1,216 @@
+"""
+Token-budgeted context packing for the KB and web prompts.
+
+Retrieved passages are packed in three steps before they reach Gemini:
+
+1. Near-duplicates are dropped: passages arrive in rank order and a passage
+   whose embedding is too similar to an already kept one is skipped.
+2. If the rest still exceeds the token budget, passages are split into
+   LaTeX-safe sentences, which are ranked by cosine similarity to the question.
+3. The best sentences are kept until the budget is full and reassembled in
+   their original order, so each passage still reads top to bottom.
+"""
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embedding_backends import EMBEDDING_DIMENSION
+from ingest import split_units
+from kb_search import EmbeddingMemo, embed_query
+from resources import get_embedding_model
+from telemetry import get_logger
+
+logger = get_logger("context_packer")
+
+# CONFIGURATION
+
+KB_CONTEXT_TOKEN_BUDGET = int(os.getenv("KB_CONTEXT_TOKEN_BUDGET", "1200"))
+WEB_CONTEXT_TOKEN_BUDGET = int(os.getenv("WEB_CONTEXT_TOKEN_BUDGET", "1800"))
+# Passages at or above this cosine similarity to a kept passage are dropped
+DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.95"))
+SENTENCE_MEMO_MAX_ENTRIES = int(os.getenv("SENTENCE_MEMO_MAX_ENTRIES", "20000"))
+
+# Gemini averages roughly four characters per token for English text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+@dataclass
+class PackedContext:
+    passages: List[str]
+    # Index into the input passages for each packed passage
+    indexes: List[int]
+    tokens_before: int
+    tokens_after: int
+    duplicates_dropped: int = 0
+    sentences_dropped: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+@dataclass
+class PackerStats:
+    requests: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+    counters: Counter = field(default_factory=Counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, packed: PackedContext) -> None:
+        with self._lock:
+            self.requests += 1
+            self.tokens_before += packed.tokens_before
+            self.tokens_after += packed.tokens_after
+            self.counters["duplicates_dropped"] += packed.duplicates_dropped
+            self.counters["sentences_dropped"] += packed.sentences_dropped
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                **self.counters,
+            }
+
+
+packer_stats = PackerStats()
+
+# Sentences and passages recur across requests (the KB is small), so their
+# embeddings are memoized separately from the question memo
+sentence_memo = EmbeddingMemo(SENTENCE_MEMO_MAX_ENTRIES)
+
+
+def embed_texts(texts: List[str]) -> np.ndarray:
+    """Unit-normalized embeddings for `texts`; memo misses are encoded in one batch."""
+    vectors: List[Optional[np.ndarray]] = []
+    missing: Dict[str, List[int]] = {}
+    for i, text in enumerate(texts):
+        key = EmbeddingMemo.make_key(text)
+        vector = sentence_memo.get(key)
+        vectors.append(vector)
+        if vector is None:
+            missing.setdefault(key, []).append(i)
+
+    if missing:
+        first_index = [indexes[0] for indexes in missing.values()]
+        encoded = get_embedding_model().encode([texts[i] for i in first_index], batch_size=64)
+        for (key, indexes), row in zip(missing.items(), encoded):
+            row = row / max(float(np.linalg.norm(row)), 1e-12)
+            vector = sentence_memo.put(key, row)
+            for i in indexes:
+                vectors[i] = vector
+
+    if not vectors:
+        return np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
+    return np.stack(vectors)
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def _dedupe(vectors: np.ndarray, threshold: float) -> List[int]:
+    kept: List[int] = []
+    for i in range(len(vectors)):
+        if kept and float(np.max(vectors[kept] @ vectors[i])) >= threshold:
+            continue
+        kept.append(i)
+    return kept
+
+
+def pack_passages(
+    question: str,
+    passages: List[str],
+    token_budget: int,
+    question_vector: Optional[np.ndarray] = None,
+    label: str = "context",
+) -> PackedContext:
+    """
+    Packs rank-ordered `passages` into at most `token_budget` tokens (estimated).
+
+    Args:
+        question: The user's question; its embedding is reused from the memo.
+        passages: Retrieved passages, most relevant first.
+        token_budget: Maximum estimated tokens of packed context.
+        question_vector: The question embedding, if the caller already has it.
+        label: Name used in the per-request log line (e.g. "KB", "web").
+
+    Returns:
+        A PackedContext whose passages keep their input order. At least the
+        single most relevant sentence is always kept.
+    """
+    tokens_before = sum(estimate_tokens(p) for p in passages)
+    if not passages:
+        return PackedContext([], [], 0, 0)
+
+    try:
+        kept = _dedupe(embed_texts(passages), DEDUP_SIMILARITY)
+        duplicates = len(passages) - len(kept)
+
+        if sum(estimate_tokens(passages[i]) for i in kept) <= token_budget:
+            packed = PackedContext(
+                [passages[i] for i in kept], kept, tokens_before,
+                sum(estimate_tokens(passages[i]) for i in kept), duplicates,
+            )
+        else:
+            packed = _pack_sentences(question, passages, kept, token_budget, question_vector)
+            packed.tokens_before = tokens_before
+            packed.duplicates_dropped = duplicates
+    except Exception as e:
+        # Packing only saves tokens; an embedding failure must not fail the answer
+        logger.warning("Context packer failed, using unpacked context", extra={"error": str(e)})
+        return PackedContext(list(passages), list(range(len(passages))), tokens_before, tokens_before)
+
+    packer_stats.record(packed)
+    logger.info("Packed prompt context", extra={
+        "context": label,
+        "tokens_before": packed.tokens_before,
+        "tokens_after": packed.tokens_after,
+        "duplicates_dropped": packed.duplicates_dropped,
+        "sentences_dropped": packed.sentences_dropped,
+    })
+    return packed
+
+
+def _pack_sentences(
+    question: str,
+    passages: List[str],
+    kept: List[int],
+    token_budget: int,
+    question_vector: Optional[np.ndarray],
+) -> PackedContext:
+    # (passage index, sentence) in reading order
+    sentences = [(p, s) for p in kept for s in split_units(passages[p])]
+    if question_vector is None:
+        question_vector = embed_query(question)
+    scores = embed_texts([s for _, s in sentences]) @ _unit(question_vector)
+
+    selected, used = set(), 0
+    for i in np.argsort(-scores, kind="stable"):
+        cost = estimate_tokens(sentences[i][1]) + 1
+        if used + cost <= token_budget or not selected:
+            selected.add(int(i))
+            used += cost
+
+    by_passage: Dict[int, List[str]] = {}
+    for i, (p, sentence) in enumerate(sentences):
+        if i in selected:
+            by_passage.setdefault(p, []).append(sentence)
+
+    indexes = [p for p in kept if p in by_passage]
+    texts = [" ".join(by_passage[p]) for p in indexes]
+    return PackedContext(
+        texts, indexes, 0, sum(estimate_tokens(t) for t in texts),
+        sentences_dropped=len(sentences) - len(selected),
+    )
@@ -0,0 +1,186 @@
+import argparse
+import os
+from abc import ABC, abstractmethod
+from typing import List
+
+import numpy as np
+
+# CONFIGURATION
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIMENSION = 384
+
+# "sentence-transformers" (default, needs torch) or "onnx" (int8 ONNX Runtime, torch-free)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./models/all-MiniLM-L6-v2-onnx")
+ONNX_MODEL_FILE = "model_int8.onnx"
+ONNX_NUM_THREADS = int(os.getenv("ONNX_NUM_THREADS", "0"))  # 0 lets ONNX Runtime decide
+MAX_SEQUENCE_LENGTH = 256
+
+
+class EmbeddingBackend(ABC):
+    """
+    Interface for the sentence embedding model used by kb_search and path.py.
+
+    `encode` takes a list of texts and returns a float32 array of shape
+    (len(texts), dimension) holding L2-normalized embeddings.
+    """
+
+    name = "base"
+    dimension = EMBEDDING_DIMENSION
+
+    @abstractmethod
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Returns the L2-normalized float32 embeddings of `texts`."""
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """The original sentence-transformers (PyTorch) implementation."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self._model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return self._model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+        ).astype(np.float32, copy=False)
+
+
+class OnnxMiniLMBackend(EmbeddingBackend):
+    """
+    all-MiniLM-L6-v2 as an int8-quantized ONNX model on CPU.
+
+    Reproduces the sentence-transformers pipeline (WordPiece tokenization,
+    transformer, mean pooling, L2 normalization) with only `onnxruntime` and
+    `tokenizers`, so the serving image does not need torch. Build the model
+    directory once with `python embedding_backends.py export`.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, num_threads: int = ONNX_NUM_THREADS):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=MAX_SEQUENCE_LENGTH)
+        self._tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self._tokenizer.encode_batch(texts[start:start + batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+            token_embeddings = self._session.run(None, feeds)[0]
+
+            # Mean pooling over real tokens, then L2 normalization
+            mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            batches.append((pooled / np.clip(norms, 1e-12, None)).astype(np.float32))
+
+        return np.concatenate(batches)
+
+
+BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    OnnxMiniLMBackend.name: OnnxMiniLMBackend,
+}
+
+
+def load_embedding_backend(name: str = EMBEDDING_BACKEND) -> EmbeddingBackend:
+    """Builds the configured embedding backend."""
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{name}'. Choose one of: {', '.join(BACKENDS)}")
+    return backend_cls()
+
+
+def chroma_embedding_function(backend: EmbeddingBackend):
+    """Wraps an embedding backend as a Chroma embedding function (used by path.py)."""
+    from chromadb import Documents, EmbeddingFunction, Embeddings
+
+    class _BackendEmbeddingFunction(EmbeddingFunction):
+        def __call__(self, input: Documents) -> Embeddings:
+            return backend.encode(list(input)).tolist()
+
+    return _BackendEmbeddingFunction()
+
+
+# ONNX EXPORT (build-time only; needs torch, transformers and onnxruntime)
+
+def export_quantized_onnx(output_dir: str = ONNX_MODEL_DIR) -> str:
+    """
+    Exports all-MiniLM-L6-v2 to ONNX and applies dynamic int8 quantization.
+    Writes `tokenizer.json` and `model_int8.onnx` into `output_dir`.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    hub_name = f"sentence-transformers/{EMBEDDING_MODEL_NAME}"
+    os.makedirs(output_dir, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(hub_name)
+    tokenizer.save_pretrained(output_dir)
+    model = AutoModel.from_pretrained(hub_name).eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, "model_fp32.onnx")
+    dynamic = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": dynamic,
+            "attention_mask": dynamic,
+            "token_type_ids": dynamic,
+            "last_hidden_state": dynamic,
+        },
+        opset_version=14,
+    )
+
+    int8_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    print(f" Exported int8 ONNX model to {int8_path}")
+    return int8_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embedding backend utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="Export all-MiniLM-L6-v2 as an int8 ONNX model.")
+    export_cmd.add_argument("--output-dir", default=ONNX_MODEL_DIR)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_quantized_onnx(args.output_dir)
@@ -0,0 +1,153 @@
+"""
+Vector index over the refined few-shot examples.
+
+Example questions are embedded with the same model as the KB, and the index
+grows incrementally: a refresh only reads (and, if needed, embeds) examples
+appended since the last refresh. Embeddings are written back to the example
+store, so a restart reloads them instead of re-encoding every example.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from embedding_backends import EMBEDDING_DIMENSION
+from example_store import ExampleStore, example_store
+from kb_search import embed_query
+from resources import get_embedding_model
+from telemetry import get_logger
+
+logger = get_logger("example_index")
+
+# CONFIGURATION
+
+EXAMPLE_TOP_K = int(os.getenv("EXAMPLE_TOP_K", "2"))
+# Examples less similar than this to the question are never injected
+EXAMPLE_MIN_SIMILARITY = float(os.getenv("EXAMPLE_MIN_SIMILARITY", "0.55"))
+# Character budget for the whole examples section of the prompt
+EXAMPLE_PROMPT_CHAR_BUDGET = int(os.getenv("EXAMPLE_PROMPT_CHAR_BUDGET", "2400"))
+# New examples are picked up at most this often
+EXAMPLE_REFRESH_INTERVAL = float(os.getenv("EXAMPLE_REFRESH_INTERVAL", "10.0"))
+
+
+class ExampleIndex:
+    """
+    Exact cosine index of example questions.
+
+    Unit-normalized float32 embeddings sit in one (n, d) matrix that is grown
+    by appending rows; a lookup is a single matrix-vector product. Refreshes
+    are throttled to `refresh_interval` and serialized by a lock, while
+    lookups read an immutable snapshot of the matrix and example list.
+    """
+
+    def __init__(self, store: ExampleStore = example_store, refresh_interval: float = EXAMPLE_REFRESH_INTERVAL):
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self._unit = np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+        self._examples: List[Dict] = []
+        self._last_id = 0
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._examples)
+
+    def refresh(self, force: bool = False) -> int:
+        """Adds examples appended to the store since the last refresh. Returns how many were added."""
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return 0
+
+        with self._lock:
+            if not force and now - self._last_refresh < self.refresh_interval:
+                return 0
+            self._last_refresh = now
+            if self.store.last_id() <= self._last_id:
+                return 0
+
+            rows = list(self.store.iter_examples_with_vectors(after_id=self._last_id))
+            vectors = np.zeros((len(rows), EMBEDDING_DIMENSION), dtype=np.float32)
+            to_embed = []
+            for i, (_, _, blob) in enumerate(rows):
+                if blob is not None and len(blob) == EMBEDDING_DIMENSION * 4:
+                    vectors[i] = np.frombuffer(blob, dtype=np.float32)
+                else:
+                    to_embed.append(i)
+
+            if to_embed:
+                encoded = get_embedding_model().encode([rows[i][1].get("question", "") for i in to_embed])
+                vectors[to_embed] = encoded
+                self.store.put_vectors([(rows[i][0], vectors[i].tobytes()) for i in to_embed])
+
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            unit = vectors / np.clip(norms, 1e-12, None)
+            self._unit = np.vstack([self._unit, unit]).astype(np.float32)
+            self._examples = self._examples + [example for _, example, _ in rows]
+            self._last_id = rows[-1][0]
+            logger.info("Example index refreshed", extra={"added": len(rows), "embedded": len(to_embed)})
+            return len(rows)
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        k: int = EXAMPLE_TOP_K,
+        min_similarity: float = EXAMPLE_MIN_SIMILARITY,
+    ) -> List[Tuple[Dict, float]]:
+        """Returns up to k (example, cosine similarity) pairs, most similar first."""
+        unit, examples = self._unit, self._examples
+        if not examples or k <= 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        similarities = unit @ query
+
+        results, seen = [], set()
+        for i in np.argsort(-similarities):
+            if similarities[i] < min_similarity or len(results) == k:
+                break
+            # Duplicates linger until the store is compacted
+            question = examples[i].get("question")
+            if question in seen:
+                continue
+            seen.add(question)
+            results.append((examples[i], float(similarities[i])))
+        return results
+
+
+def fit_examples_to_budget(examples: List[Dict], char_budget: int = EXAMPLE_PROMPT_CHAR_BUDGET) -> List[Dict]:
+    """
+    Keeps examples in rank order while their formatted text fits in `char_budget`.
+    An example that does not fit is skipped so a shorter, lower-ranked one can
+    still be used.
+    """
+    kept, used = [], 0
+    for example in examples:
+        size = len(example.get("question", "")) + len(example.get("ideal_answer", ""))
+        if used + size <= char_budget:
+            kept.append(example)
+            used += size
+    return kept
+
+
+# Process-wide example index used by the KB Response Agent
+example_index = ExampleIndex()
+
+
+def few_shot_examples(question: str) -> List[Dict]:
+    """
+    Returns the refined examples most similar to `question`, within the prompt
+    budget. The question embedding comes from the shared memo, so this does
+    not encode the question again. Never raises; examples are optional.
+    """
+    try:
+        example_index.refresh()
+        if not len(example_index):
+            return []
+        hits = example_index.search(embed_query(question))
+        return fit_examples_to_budget([example for example, _ in hits])
+    except Exception as e:
+        logger.warning("Few-shot example lookup failed", extra={"error": str(e)})
+        return []
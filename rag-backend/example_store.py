@@ -0,0 +1,192 @@
+"""
+Append-only store for the refined few-shot examples produced by the
+Self-Learning Refinement Agent.
+
+    python example_store.py import optimized_examples.json
+    python example_store.py compact
+    python example_store.py count
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# CONFIGURATION
+
+EXAMPLE_STORE_PATH = os.getenv("EXAMPLE_STORE_PATH", "./optimized_examples.sqlite3")
+STREAM_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS examples (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS examples_content_hash ON examples(content_hash);
+CREATE TABLE IF NOT EXISTS example_vectors (
+    id INTEGER PRIMARY KEY,
+    vector BLOB NOT NULL
+);
+"""
+
+
+def example_hash(example: Dict) -> str:
+    """Identity of an example: its question and ideal answer."""
+    raw = json.dumps([example.get("question", ""), example.get("ideal_answer", "")])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ExampleStore:
+    """
+    Append-only, concurrency-safe example log in an embedded sqlite table.
+
+    Each append is one INSERT in its own transaction, so write cost stays
+    constant as the store grows and concurrent writers (threads or uvicorn
+    workers) never lose each other's examples. Rows get increasing ids, which
+    readers use to stream the log in order or to pick up only new examples.
+    Duplicates are tolerated on write and removed by `compact()`.
+    """
+
+    def __init__(self, path: str = EXAMPLE_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    # Writes
+
+    def append(self, example: Dict) -> int:
+        """Atomically appends one example and returns its id."""
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO examples (content_hash, payload, created_at) VALUES (?, ?, ?)",
+                (example_hash(example), json.dumps(example), time.time()),
+            )
+        return cursor.lastrowid
+
+    def append_many(self, examples: Iterable[Dict]) -> int:
+        """Appends several examples in one transaction. Returns how many were written."""
+        now = time.time()
+        rows = [(example_hash(e), json.dumps(e), now) for e in examples]
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO examples (content_hash, payload, created_at) VALUES (?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    # Reads
+
+    def iter_examples(self, after_id: int = 0) -> Iterator[Tuple[int, Dict]]:
+        """
+        Streams (id, example) pairs in append order, starting after `after_id`.
+        Reads in fixed-size pages, so memory does not grow with the store.
+        """
+        conn = self._conn()
+        last_id = after_id
+        while True:
+            rows = conn.execute(
+                "SELECT id, payload FROM examples WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, STREAM_BATCH_SIZE),
+            ).fetchall()
+            if not rows:
+                return
+            for row_id, payload in rows:
+                yield row_id, json.loads(payload)
+            last_id = rows[-1][0]
+
+    def iter_examples_with_vectors(self, after_id: int = 0) -> Iterator[Tuple[int, Dict, Optional[bytes]]]:
+        """Like `iter_examples`, plus the stored embedding bytes of each example (None if not embedded yet)."""
+        conn = self._conn()
+        last_id = after_id
+        while True:
+            rows = conn.execute(
+                "SELECT e.id, e.payload, v.vector FROM examples e"
+                " LEFT JOIN example_vectors v ON v.id = e.id"
+                " WHERE e.id > ? ORDER BY e.id LIMIT ?",
+                (last_id, STREAM_BATCH_SIZE),
+            ).fetchall()
+            if not rows:
+                return
+            for row_id, payload, vector in rows:
+                yield row_id, json.loads(payload), vector
+            last_id = rows[-1][0]
+
+    def put_vectors(self, vectors: List[Tuple[int, bytes]]) -> None:
+        """Stores (example id, float32 embedding bytes) pairs so restarts do not re-embed."""
+        conn = self._conn()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO example_vectors (id, vector) VALUES (?, ?)", vectors)
+
+    def last_id(self) -> int:
+        return self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM examples").fetchone()[0]
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM examples").fetchone()[0]
+
+    # Maintenance
+
+    def compact(self) -> int:
+        """Removes duplicate examples (keeping the newest of each) and reclaims space."""
+        conn = self._conn()
+        with conn:
+            removed = conn.execute(
+                "DELETE FROM examples WHERE id NOT IN ("
+                " SELECT MAX(id) FROM examples GROUP BY content_hash)"
+            ).rowcount
+            conn.execute("DELETE FROM example_vectors WHERE id NOT IN (SELECT id FROM examples)")
+        conn.execute("VACUUM")
+        return removed
+
+    def import_json(self, json_path: str) -> int:
+        """
+        Migrates a legacy `optimized_examples.json` list into the store.
+        Examples already present are skipped, so the import can be re-run.
+        """
+        with open(json_path, "r") as f:
+            examples = json.load(f)
+
+        conn = self._conn()
+        known = {row[0] for row in conn.execute("SELECT content_hash FROM examples")}
+        new_examples = []
+        for example in examples:
+            h = example_hash(example)
+            if h not in known:
+                known.add(h)
+                new_examples.append(example)
+        return self.append_many(new_examples)
+
+
+# Process-wide example store
+example_store = ExampleStore()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refined example store utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    import_cmd = sub.add_parser("import", help="Migrate a legacy optimized_examples.json file.")
+    import_cmd.add_argument("json_path", nargs="?", default="optimized_examples.json")
+    sub.add_parser("compact", help="Remove duplicate examples and reclaim space.")
+    sub.add_parser("count", help="Print the number of stored examples.")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        print(f" Imported {example_store.import_json(args.json_path)} examples from {args.json_path}.")
+    elif args.command == "compact":
+        print(f" Compaction removed {example_store.compact()} duplicate examples.")
+    elif args.command == "count":
+        print(example_store.count())
@@ -0,0 +1,190 @@
+"""
+Offline stand-ins for the Gemini and Tavily clients.
+
+They implement the subset of the client APIs the agents use, with latency
+drawn from a log-normal distribution and a configurable error rate, so the
+full request path can be exercised (and load-tested) without network access
+or API quota. Select them with:
+
+    LLM_PROVIDER=fake SEARCH_PROVIDER=fake uvicorn main_api_app:app
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import AsyncIterator, Dict, List, Optional
+
+# CONFIGURATION
+
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "800"))
+FAKE_LLM_LATENCY_SIGMA = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.35"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0.0"))
+FAKE_LLM_STREAM_CHUNKS = int(os.getenv("FAKE_LLM_STREAM_CHUNKS", "8"))
+
+FAKE_SEARCH_LATENCY_MS = float(os.getenv("FAKE_SEARCH_LATENCY_MS", "600"))
+FAKE_SEARCH_LATENCY_SIGMA = float(os.getenv("FAKE_SEARCH_LATENCY_SIGMA", "0.4"))
+FAKE_SEARCH_ERROR_RATE = float(os.getenv("FAKE_SEARCH_ERROR_RATE", "0.0"))
+
+FAKE_PROVIDER_SEED = os.getenv("FAKE_PROVIDER_SEED")
+
+
+class FakeProviderError(RuntimeError):
+    """Injected failure of a fake provider call."""
+
+
+class LatencyModel:
+    """
+    Log-normal latency with the given median (ms) and shape `sigma`, plus an
+    independent per-call failure probability. sigma=0.35 puts p99 at about
+    2.3x the median, in line with hosted LLM APIs.
+    """
+
+    def __init__(self, name: str, median_ms: float, sigma: float, error_rate: float, seed: Optional[str] = FAKE_PROVIDER_SEED):
+        self.name = name
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._rng = random.Random(f"{seed}:{name}" if seed is not None else None)
+
+    def sample_seconds(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return self._rng.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+    def maybe_fail(self) -> None:
+        if self.error_rate and self._rng.random() < self.error_rate:
+            raise FakeProviderError(f"Injected {self.name} failure")
+
+
+def _seed_for(text: str) -> int:
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+# FAKE LLM (google-genai client surface)
+
+_USER_QUESTION = re.compile(r"\[USER QUESTION\]:?\s*(.+)", re.DOTALL)
+_JSON_ARRAY_SIZE = re.compile(r"JSON array with exactly (\d+) objects")
+
+
+def fake_generate(prompt: str) -> str:
+    """A deterministic answer shaped like what the prompt asks for."""
+    if "REQUIRED JSON OUTPUT" in prompt:
+        example = {
+            "question": "Offline refinement question",
+            "ideal_answer": "1. Offline refinement step.\n$$ x = 1 $$",
+        }
+        size = _JSON_ARRAY_SIZE.search(prompt)
+        if size:
+            return json.dumps([example] * int(size.group(1)))
+        return json.dumps(example)
+
+    match = _USER_QUESTION.search(prompt)
+    question = " ".join((match.group(1) if match else prompt[-200:]).split())[:200]
+    return (
+        "### Step 1: Identify the Concept\n"
+        f"This is an offline answer generated for: {question}\n"
+        "### Step 2: Apply the Formula\n"
+        "$$ f(x) = \\int_0^x t \\, dt = \\frac{x^2}{2} $$\n"
+        "### Step 3: State the Result\n"
+        "**Result:** the expression above."
+    )
+
+
+def _prompt_text(contents) -> str:
+    if isinstance(contents, str):
+        return contents
+    return "\n".join(str(part) for part in contents)
+
+
+class _FakeModels:
+    def __init__(self, latency: LatencyModel):
+        self._latency = latency
+
+    def generate_content(self, model: str, contents, config=None):
+        time.sleep(self._latency.sample_seconds())
+        self._latency.maybe_fail()
+        return SimpleNamespace(text=fake_generate(_prompt_text(contents)))
+
+
+class _FakeAsyncModels:
+    def __init__(self, latency: LatencyModel):
+        self._latency = latency
+
+    async def generate_content(self, model: str, contents, config=None):
+        await asyncio.sleep(self._latency.sample_seconds())
+        self._latency.maybe_fail()
+        return SimpleNamespace(text=fake_generate(_prompt_text(contents)))
+
+    async def generate_content_stream(self, model: str, contents, config=None) -> AsyncIterator:
+        total = self._latency.sample_seconds()
+        self._latency.maybe_fail()
+        text = fake_generate(_prompt_text(contents))
+
+        async def chunks():
+            size = -(-len(text) // FAKE_LLM_STREAM_CHUNKS)
+            for i in range(0, len(text), size):
+                await asyncio.sleep(total / FAKE_LLM_STREAM_CHUNKS)
+                yield SimpleNamespace(text=text[i:i + size])
+
+        return chunks()
+
+
+class FakeGenAIClient:
+    """Drop-in for `genai.Client()`: `.models` (sync) and `.aio.models` (async, streaming)."""
+
+    def __init__(self):
+        latency = LatencyModel("llm", FAKE_LLM_LATENCY_MS, FAKE_LLM_LATENCY_SIGMA, FAKE_LLM_ERROR_RATE)
+        self.models = _FakeModels(latency)
+        self.aio = SimpleNamespace(models=_FakeAsyncModels(latency))
+
+# FAKE SEARCH (Tavily client surface)
+
+_TOPIC_SENTENCES = [
+    "The standard approach is to rewrite the expression in a form where a known identity applies.",
+    "Using the definition, we substitute the given values and simplify step by step.",
+    "A common mistake is to forget the constant term when integrating.",
+    "The result can be verified by differentiating both sides.",
+    "For JEE problems, drawing a quick sketch of the graph often reveals the answer.",
+    "The formula follows directly from the binomial theorem $$ (1+x)^n = \\sum_{k=0}^n \\binom{n}{k} x^k $$.",
+    "Applying the chain rule gives $$ \\frac{dy}{dx} = \\frac{dy}{du} \\cdot \\frac{du}{dx} $$.",
+    "Subscribe to our newsletter for more solved examples.",
+]
+
+
+def fake_search_results(query: str, max_results: int) -> List[Dict]:
+    rng = random.Random(_seed_for(query))
+    results = []
+    for i in range(max_results):
+        sentences = [f"This page discusses: {query}."] + rng.sample(_TOPIC_SENTENCES, 5)
+        results.append({
+            "title": f"Solved example {i + 1}",
+            "url": f"https://example.org/solutions/{_seed_for(query) % 10_000}/{i + 1}",
+            "content": " ".join(sentences),
+            "score": round(0.9 - i * 0.05, 2),
+        })
+    return results
+
+
+class FakeTavilyClient:
+    """Drop-in for `TavilyClient()`; returns deterministic results per query."""
+
+    def __init__(self):
+        self._latency = LatencyModel("search", FAKE_SEARCH_LATENCY_MS, FAKE_SEARCH_LATENCY_SIGMA, FAKE_SEARCH_ERROR_RATE)
+
+    def search(self, query: str, search_depth: str = "basic", max_results: int = 5, **kwargs) -> Dict:
+        time.sleep(self._latency.sample_seconds())
+        self._latency.maybe_fail()
+        return {"query": query, "results": fake_search_results(query, max_results)}
+
+
+class FakeAsyncTavilyClient(FakeTavilyClient):
+    """Drop-in for `AsyncTavilyClient()`."""
+
+    async def search(self, query: str, search_depth: str = "basic", max_results: int = 5, **kwargs) -> Dict:
+        await asyncio.sleep(self._latency.sample_seconds())
+        self._latency.maybe_fail()
+        return {"query": query, "results": fake_search_results(query, max_results)}
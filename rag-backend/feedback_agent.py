@@ -1,8 +1,8 @@
 from guardrails import input_guardrail, output_guardrail
 from kb_response_agent import KBResponseAgent
 from model_context_protocol import WebSearchAgent_MCP
-from kb_search import kb_similarity_search 
-from router_agent import HIGH_CONFIDENCE_THRESHOLD, KB_RESPONSE, WEB_SEARCH 
+from kb_search import best_distance, kb_similarity_search 
+from router_agent import HIGH_CONFIDENCE_THRESHOLD, KB_RESPONSE, WEB_SEARCH, lexical_route
 
 
 def process_query_through_gateway(query: str, level: str = "unspecified") -> dict:
@@ -30,9 +30,9 @@ def process_query_through_gateway(query: str, level: str = "unspecified") -> dic
     confidence = 0.0
 
     if kb_hits_for_routing:
-        top_distance = kb_hits_for_routing[0][1]
+        top_distance = best_distance(kb_hits_for_routing)
         confidence = 1.0 - top_distance 
-        if top_distance < HIGH_CONFIDENCE_THRESHOLD:
+        if top_distance < HIGH_CONFIDENCE_THRESHOLD or lexical_route(kb_hits_for_routing.lexical_score):
             mode = KB_RESPONSE
             context_for_llm = kb_hits_for_routing 
             
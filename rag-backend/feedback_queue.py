@@ -0,0 +1,239 @@
+"""
+Durable feedback queue and the background worker that drains it.
+
+`/api/feedback` enqueues and returns immediately. `RefinementWorker` claims
+pending feedback in micro-batches and turns each batch into few-shot examples
+with one `run_refinement_batch` call. Failed batches are retried with
+exponential backoff; items that keep failing are parked as dead letters.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from self_learning_agent import run_refinement_batch
+from telemetry import get_logger
+
+logger = get_logger("feedback_queue")
+
+# CONFIGURATION
+
+FEEDBACK_QUEUE_PATH = os.getenv("FEEDBACK_QUEUE_PATH", "./feedback_queue.sqlite3")
+REFINEMENT_BATCH_SIZE = int(os.getenv("REFINEMENT_BATCH_SIZE", "8"))
+# A partial batch is processed once its oldest item has waited this long
+REFINEMENT_BATCH_MAX_WAIT = float(os.getenv("REFINEMENT_BATCH_MAX_WAIT", "5.0"))
+REFINEMENT_POLL_INTERVAL = float(os.getenv("REFINEMENT_POLL_INTERVAL", "1.0"))
+REFINEMENT_MAX_ATTEMPTS = int(os.getenv("REFINEMENT_MAX_ATTEMPTS", "5"))
+REFINEMENT_RETRY_BASE_SECONDS = 2.0
+# A claimed batch is handed out again if its worker has not finished it by then
+CLAIM_LEASE_SECONDS = 300.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    enqueued_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS feedback_queue_available ON feedback_queue(dead, available_at);
+"""
+
+
+class FeedbackQueue:
+    """
+    Durable FIFO of feedback items in a sqlite table (WAL mode).
+
+    Claiming a batch leases its rows for `CLAIM_LEASE_SECONDS` inside one
+    write transaction, so several uvicorn workers can drain the same queue
+    without processing an item twice, and items claimed by a worker that died
+    become available again once the lease runs out. Acked rows are deleted.
+    """
+
+    def __init__(self, path: str = FEEDBACK_QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite connections are not shared across threads."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, item: Dict) -> int:
+        now = time.time()
+        cursor = self._conn().execute(
+            "INSERT INTO feedback_queue (payload, enqueued_at, available_at) VALUES (?, ?, ?)",
+            (json.dumps(item), now, now),
+        )
+        return cursor.lastrowid
+
+    def ready(self, batch_size: int, max_wait: float) -> bool:
+        """True once a full batch is available or the oldest available item has waited `max_wait`."""
+        now = time.time()
+        count, oldest = self._conn().execute(
+            "SELECT COUNT(*), MIN(enqueued_at) FROM feedback_queue WHERE dead = 0 AND available_at <= ?",
+            (now,),
+        ).fetchone()
+        return count >= batch_size or (count > 0 and now - oldest >= max_wait)
+
+    def claim(self, batch_size: int) -> List[Tuple[int, int, Dict]]:
+        """Leases up to `batch_size` available items. Returns (id, attempts, item) tuples."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT id, attempts, payload FROM feedback_queue"
+                " WHERE dead = 0 AND available_at <= ? ORDER BY id LIMIT ?",
+                (now, batch_size),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE feedback_queue SET available_at = ? WHERE id = ?",
+                [(now + CLAIM_LEASE_SECONDS, row[0]) for row in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [(row_id, attempts, json.loads(payload)) for row_id, attempts, payload in rows]
+
+    def ack(self, ids: List[int]) -> None:
+        self._conn().executemany("DELETE FROM feedback_queue WHERE id = ?", [(i,) for i in ids])
+
+    def retry(self, claimed: List[Tuple[int, int, Dict]], error: str) -> int:
+        """
+        Releases a failed batch with exponential backoff. Items that reached
+        `REFINEMENT_MAX_ATTEMPTS` are marked dead. Returns how many died.
+        """
+        now = time.time()
+        updates, dead = [], 0
+        for row_id, attempts, _ in claimed:
+            attempts += 1
+            is_dead = attempts >= REFINEMENT_MAX_ATTEMPTS
+            dead += is_dead
+            delay = REFINEMENT_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+            updates.append((attempts, int(is_dead), now + delay, error[:500], row_id))
+        self._conn().executemany(
+            "UPDATE feedback_queue SET attempts = ?, dead = ?, available_at = ?, last_error = ? WHERE id = ?",
+            updates,
+        )
+        return dead
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        depth, oldest = self._conn().execute(
+            "SELECT COUNT(*), MIN(enqueued_at) FROM feedback_queue WHERE dead = 0"
+        ).fetchone()
+        dead = self._conn().execute("SELECT COUNT(*) FROM feedback_queue WHERE dead = 1").fetchone()[0]
+        return {
+            "depth": depth,
+            "dead": dead,
+            "lag_seconds": round(time.time() - oldest, 3) if oldest is not None else 0.0,
+        }
+
+
+class RefinementWorker:
+    """
+    Background task that drains the feedback queue in micro-batches.
+
+    The LLM call runs in a thread so the event loop keeps serving requests.
+    `stop()` lets the batch in progress finish before returning; anything not
+    yet claimed stays in the queue for the next start.
+    """
+
+    def __init__(
+        self,
+        queue: FeedbackQueue,
+        batch_size: int = REFINEMENT_BATCH_SIZE,
+        max_wait: float = REFINEMENT_BATCH_MAX_WAIT,
+        poll_interval: float = REFINEMENT_POLL_INTERVAL,
+    ):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.counters: Counter = Counter()
+        self.last_batch_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        if not self.running:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            # The claimed batch is re-leased after CLAIM_LEASE_SECONDS
+            logger.warning("Refinement worker did not finish its batch before shutdown")
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                if not await asyncio.to_thread(self.queue.ready, self.batch_size, self.max_wait):
+                    await self._sleep(self.poll_interval)
+                    continue
+                claimed = await asyncio.to_thread(self.queue.claim, self.batch_size)
+                if claimed:
+                    await self.process(claimed)
+            except Exception as e:
+                logger.error("Refinement worker error", extra={"error": str(e)})
+                await self._sleep(self.poll_interval)
+
+    async def process(self, claimed: List[Tuple[int, int, Dict]]) -> None:
+        ids = [row_id for row_id, _, _ in claimed]
+        start = time.perf_counter()
+        try:
+            examples = await asyncio.to_thread(run_refinement_batch, [item for _, _, item in claimed])
+        except Exception as e:
+            dead = await asyncio.to_thread(self.queue.retry, claimed, str(e))
+            self.counters["failed_batches"] += 1
+            self.counters["retried"] += len(claimed) - dead
+            self.counters["dead_lettered"] += dead
+            logger.warning("Refinement batch failed, will retry", extra={"items": len(claimed), "dead": dead, "error": str(e)})
+            return
+        finally:
+            self.last_batch_seconds = round(time.perf_counter() - start, 3)
+
+        await asyncio.to_thread(self.queue.ack, ids)
+        self.counters["batches"] += 1
+        self.counters["processed"] += len(claimed)
+        self.counters["examples_added"] += len(examples)
+
+    def stats(self) -> Dict[str, object]:
+        stats = self.queue.stats()
+        stats.update(self.counters)
+        stats["running"] = self.running
+        stats["last_batch_seconds"] = self.last_batch_seconds
+        return stats
+
+
+# Process-wide queue and worker used by the API
+feedback_queue = FeedbackQueue()
+refinement_worker = RefinementWorker(feedback_queue)
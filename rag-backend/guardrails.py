@@ -1,40 +1,192 @@
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from telemetry import get_logger
+
+logger = get_logger("guardrails")
+
+
+# Allowed keywords: a query passes the input guardrail if a word starts with any
+# of them ("mathematical", "algebraic", "rationalize"), optionally after one of
+# KEYWORD_PREFIXES ("subset", "cotangent"). Words that merely contain a keyword
+# ("reset", "assume") do not count.
+MATH_KEYWORDS = [
+"math", "mathematics", "algebra", "geometry", "calculus",
+"trigonometry", "probability", "statistics", "integral", "derivative",
+"equation", "formula", "function", "sum", "solve", "proof",
+"differential", "limit", "series", "logarithm", "matrix", "vector",
+"quadratic", "set", "relation", "permutation", "combination", "sequence",
+"progression", "definite", "indefinite", "area", "volume", "complex",
+"number", "domain", "range", "inverse", "linear", "polynomial",
+"rational", "exponent", "continuity", "maxima", "minima", "tangent",
+"normal", "locus", "partial", "system", "scalar", "modulus",
+"argument", "identity", "inequality", "ellipse", "parabola",
+"hyperbola", "circle", "coordinate", "jacobian", "fourier",
+"laplace", "sinc", "cosh", "sinh", "calculate", "find", "prove",
+"explain", "concept", "theorem", "principle", "law", "graph",
+"diagram", "approximately",
+# Word forms that do not start with a keyword above
+"matrices", "vertices", "integrat", "differentiat", "solving", "proving",
+"calculating", "calculation", "trigonometric", "geometric", "statistical",
+"probable", "arithmetic",
+]
+
+# Math prefixes accepted before a keyword ("subset", "cotangent", "antiderivative",
+# "nonlinear", "eigenvector"); substring matching used to accept these too
+KEYWORD_PREFIXES = ["anti", "arc", "bi", "co", "eigen", "multi", "non", "semi", "sub", "super", "tri"]
+
+# Output block rules: rule name -> regex (case-insensitive). Rules match word
+# forms themselves ("malicious\w*" also blocks "maliciously").
+OUTPUT_BLOCK_RULES = {
+    "url": r"\bhttps?\b",
+    "malicious": r"\bmalicious\w*",
+}
+
+OUTPUT_BLOCKED_MESSAGE = " Output blocked for safety reasons."
+
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """
+    Compiles terms into a prefix-trie regex, e.g. ["sum", "summation", "set"] ->
+    "s(?:et|um(?:mation)?)". Shared prefixes are matched once, so the pattern
+    stays fast as the term list grows to thousands of entries.
+    """
+    trie: Dict[str, dict] = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        is_end = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if is_end else group
+
+    return build(trie)
+
+
+class GuardrailEngine:
+    """
+    Compiled input/output guardrails.
+
+    Allowed keywords are compiled once into a single regex that matches them
+    at the start of a word (so "set" no longer matches "reset" and "sum" no
+    longer matches "assume", but "math" still matches "mathematical"), and
+    block rules are compiled into one alternation of named groups. Each check is
+    a single regex scan regardless of how many rules there are. Every decision
+    is attributed to the rule that fired in `hit_report()`.
+    """
+
+    def __init__(
+        self,
+        allow_terms: Iterable[str] = MATH_KEYWORDS,
+        block_rules: Optional[Dict[str, str]] = None,
+        prefixes: Iterable[str] = KEYWORD_PREFIXES,
+    ):
+        self.allow_terms = sorted({t.lower() for t in allow_terms})
+        self._allow_regex = re.compile(
+            rf"\b(?:{_trie_pattern(p.lower() for p in prefixes)})?(?P<keyword>{_trie_pattern(self.allow_terms)})\w*",
+            re.IGNORECASE,
+        )
+
+        self.block_rules = dict(OUTPUT_BLOCK_RULES if block_rules is None else block_rules)
+        self._block_group_names = {f"r{i}": name for i, name in enumerate(self.block_rules)}
+        self._block_regex = re.compile(
+            "|".join(
+                f"(?P<{group}>{self.block_rules[name]})"
+                for group, name in self._block_group_names.items()
+            ) or r"(?!)",
+            re.IGNORECASE,
+        )
+
+        self._hits: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def _record(self, rule: str) -> None:
+        with self._lock:
+            self._hits[rule] += 1
+
+    # Single-item checks
+
+    def matched_keyword(self, user_input: str) -> Optional[str]:
+        """Returns the first allowed keyword found in the input, or None."""
+        match = self._allow_regex.search(user_input)
+        return match.group("keyword").lower() if match else None
+
+    def check_input(self, user_input: str) -> bool:
+        keyword = self.matched_keyword(user_input)
+        self._record(f"allow:{keyword}" if keyword else "input:rejected")
+        return keyword is not None
+
+    def blocking_rule(self, answer: str) -> Optional[str]:
+        """Returns the name of the first block rule the answer triggers, or None."""
+        match = self._block_regex.search(answer)
+        return self._block_group_names[match.lastgroup] if match else None
+
+    def check_output(self, answer: str) -> str:
+        rule = self.blocking_rule(answer)
+        if rule is None:
+            self._record("output:passed")
+            return answer
+        self._record(f"block:{rule}")
+        return OUTPUT_BLOCKED_MESSAGE
+
+    # Batch checks
+
+    def check_inputs(self, user_inputs: Iterable[str]) -> List[bool]:
+        return [self.check_input(text) for text in user_inputs]
+
+    def check_outputs(self, answers: Iterable[str]) -> List[str]:
+        return [self.check_output(text) for text in answers]
+
+    # Reporting
+
+    def hit_report(self) -> Dict[str, int]:
+        """Counts of decisions per rule: allow:<keyword>, block:<rule>, input:rejected, output:passed."""
+        with self._lock:
+            return dict(self._hits.most_common())
+
+    def reset_hits(self) -> None:
+        with self._lock:
+            self._hits.clear()
+
+
+# Process-wide engine used by the gateway
+guardrail_engine = GuardrailEngine()
+
+
 def input_guardrail(user_input: str) -> bool:
     """
     Checks if the user input is strictly related to Math, JEE, or core Science concepts.
     Rejects the input if no relevant keywords are found.
     """
-    
-    # Define list of allowed keywords
-    math_keywords = [
- "math", "mathematics", "algebra", "geometry", "calculus", 
-"trigonometry", "probability", "statistics", "integral", "derivative", 
-"equation", "formula", "function", "sum", "solve", "proof", 
-"differential", "limit", "series", "logarithm", "matrix", "vector", 
-"quadratic", "set", "relation", "permutation", "combination", "sequence", 
-"progression", "definite", "indefinite", "area", "volume", "complex", 
-"number", "domain", "range", "inverse", "linear", "polynomial", 
-"rational", "exponent", "continuity", "maxima", "minima", "tangent", 
-"normal", "locus", "partial", "system", "scalar", "modulus", 
-"argument", "identity", "inequality", "ellipse", "parabola", 
-"hyperbola", "circle", "coordinate", "jacobian", "fourier", 
-"laplace", "sinc", "cosh", "sinh", "calculate", "find", "prove", 
-"explain", "concept", "theorem", "principle", "law", "graph", 
-"diagram","approximately","calculate"
-    ]
-    
-    # Check if ANY of the allowed keywords are present in the input
-    if any(word in user_input.lower() for word in math_keywords):
+    if guardrail_engine.check_input(user_input):
         return True
     else:
         # If no math keyword is found, reject the input.
-        print("Input Rejected: Query is not recognized as Math related.")
+        logger.info("Input rejected: query is not recognized as Math related")
         return False
 
 
+def input_guardrail_batch(user_inputs: List[str]) -> List[bool]:
+    """Batch variant of `input_guardrail`; returns one decision per input, in order."""
+    decisions = guardrail_engine.check_inputs(user_inputs)
+    rejected = decisions.count(False)
+    if rejected:
+        logger.info("Input rejected: queries are not recognized as Math related", extra={"rejected": rejected, "total": len(decisions)})
+    return decisions
+
+
 def output_guardrail(answer: str) -> str:
     """
-    Current basic output guardrail (retaining original logic for safety checks).
+    Blocks answers that trigger any output block rule (links, malicious content).
     """
-    if "http" in answer or "malicious" in answer:
-        return " Output blocked for safety reasons."
-    return answer
+    return guardrail_engine.check_output(answer)
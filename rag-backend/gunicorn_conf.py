@@ -0,0 +1,90 @@
+"""
+Gunicorn configuration for multi-worker serving.
+
+    gunicorn -c gunicorn_conf.py "main_api_app:create_app()"
+
+The app is imported once in the master (`preload_app`), which then loads the
+embedding model's weights and the read-only NumPy KB and lexical indexes
+before forking (`resources.preload`). Workers share those pages copy-on-write instead of each
+holding its own model and vector store. Each worker still runs its own
+warm-up encode, HTTP clients, caches, admission limits and refinement worker.
+
+Multi-worker mode serves the KB from the memory-mapped NumPy index: a Chroma
+PersistentClient per worker duplicates its HNSW index in every process and is
+not safe for concurrent writers. The NumPy and lexical indexes are built from
+Chroma at startup if they do not exist yet.
+"""
+import glob
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+
+# CONFIGURATION
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+# PRELOAD_APP=0 imports the app in each worker instead (one model copy per worker)
+preload_app = os.getenv("PRELOAD_APP", "1") == "1"
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WORKER_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Intra-op threads per worker for torch / ONNX Runtime, so N workers do not
+# each start one thread per core
+WORKER_INFERENCE_THREADS = int(os.getenv(
+    "WORKER_INFERENCE_THREADS", str(max(1, multiprocessing.cpu_count() // max(workers, 1)))))
+
+# Read by the app modules at import, so set before gunicorn loads the app
+os.environ.setdefault("VECTOR_BACKEND", "numpy")
+os.environ.setdefault("ONNX_NUM_THREADS", str(WORKER_INFERENCE_THREADS))
+
+# prometheus_client sums counters and histograms across workers through files
+# in this directory; stale files from an earlier run must not be counted
+if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+    for path in glob.glob(os.path.join(os.environ["PROMETHEUS_MULTIPROC_DIR"], "*.db")):
+        os.remove(path)
+else:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="math_agent_metrics_")
+
+# SERVER HOOKS
+
+def on_starting(server):
+    # Index builds run in a subprocess, so no Chroma client or threads are left in the master
+    if os.environ.get("HYBRID_SEARCH", "1") == "1":
+        from lexical_index import LEXICAL_INDEX_DIR
+        from numpy_index import index_exists
+
+        if not index_exists(LEXICAL_INDEX_DIR):
+            server.log.info("Building the lexical index in %s", LEXICAL_INDEX_DIR)
+            build = [sys.executable, "lexical_index.py", "build", "--output-dir", LEXICAL_INDEX_DIR]
+            if subprocess.run(build).returncode != 0:
+                # Hybrid search is an enhancement; the KB is then searched by vector only
+                server.log.warning("Could not build the lexical index; serving vector-only search")
+
+    if os.environ["VECTOR_BACKEND"] != "numpy":
+        server.log.warning(
+            "VECTOR_BACKEND=%s opens a Chroma client per worker; use VECTOR_BACKEND=numpy for multi-worker serving",
+            os.environ["VECTOR_BACKEND"],
+        )
+        return
+
+    from numpy_index import NUMPY_INDEX_DIR, index_exists
+
+    if not index_exists(NUMPY_INDEX_DIR):
+        server.log.info("Exporting the KB to a NumPy index in %s", NUMPY_INDEX_DIR)
+        subprocess.run([sys.executable, "numpy_index.py", "export", "--output-dir", NUMPY_INDEX_DIR], check=True)
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before the first fork
+    if preload_app:
+        from resources import preload
+        preload()
+
+
+def post_fork(server, worker):
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(WORKER_INFERENCE_THREADS)
@@ -0,0 +1,312 @@
+"""
+Streaming bulk ingestion into the KB collection.
+
+    python ingest.py knowledge_base/ notes/ --batch-size 256 --workers 4
+
+Documents are streamed from JSONL files (one {"text", "id"?, "metadata"?}
+object per line) and Markdown files, split into LaTeX-aware chunks, embedded
+in batches and upserted by a hash of their source and content. Only a
+bounded batch of chunks is held in memory at a time, so memory stays flat
+regardless of corpus size. Re-runs skip chunks whose hash is already stored
+and prune chunks that no longer belong to a source document. A passage that
+two sources share is stored once per source, so pruning one source never
+deletes the other's copy.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from multiprocessing import Pool
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from kb_search import COLLECTION_NAME, VECTOR_DB_PATH
+
+# CONFIGURATION
+
+DEFAULT_CHUNK_CHARS = 1200
+DEFAULT_BATCH_SIZE = 128
+SUPPORTED_SUFFIXES = (".jsonl", ".md", ".markdown")
+
+# Math spans that must never be split: $$..$$, \[..\], \(..\), \begin{env}..\end{env}, $..$
+_MATH_SPAN = re.compile(
+    r"\$\$.+?\$\$"
+    r"|\\\[.+?\\\]"
+    r"|\\\(.+?\\\)"
+    r"|\\begin\{(?P<env>[^}]+)\}.+?\\end\{(?P=env)\}"
+    r"|(?<!\\)\$(?:\\\$|[^$])+?(?<!\\)\$",
+    re.DOTALL,
+)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z\\$*#\x00])")
+
+
+@dataclass
+class Chunk:
+    id: str
+    text: str
+    metadata: Dict[str, object] = field(default_factory=dict)
+
+
+@dataclass
+class IngestStats:
+    documents: int = 0
+    chunks: int = 0
+    embedded: int = 0
+    skipped: int = 0
+    pruned: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def report(self, final: bool = False) -> str:
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        label = "Done" if final else "Progress"
+        return (
+            f" {label}: {self.documents} docs ({self.documents / elapsed:.1f} docs/sec), "
+            f"{self.chunks} chunks, {self.embedded} embedded, {self.skipped} unchanged, "
+            f"{self.pruned} pruned in {elapsed:.1f}s"
+        )
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def chunk_id(source: str, text: str) -> str:
+    """Id of a chunk: scoped to its source, since `_prune_source` deletes by id."""
+    return content_hash(f"{source}\x1f{text}")
+
+# LATEX-AWARE CHUNKING
+
+def split_units(text: str) -> List[str]:
+    """
+    Splits text into paragraph/sentence units. Math spans are masked first so
+    sentence and paragraph boundaries inside an equation are never used.
+    """
+    spans = []
+
+    def mask(match):
+        spans.append(match.group(0))
+        return f"\x00{len(spans) - 1}\x00"
+
+    masked = _MATH_SPAN.sub(mask, text)
+    units = []
+    for paragraph in _PARAGRAPH_BREAK.split(masked):
+        for sentence in _SENTENCE_END.split(paragraph.strip()):
+            if sentence:
+                units.append(re.sub(r"\x00(\d+)\x00", lambda m: spans[int(m.group(1))], sentence))
+    return units
+
+
+def chunk_text(text: str, max_chars: int = DEFAULT_CHUNK_CHARS) -> List[str]:
+    """
+    Packs paragraph/sentence units greedily into chunks of at most `max_chars`.
+    A single unit longer than `max_chars` (e.g. a long derivation) is kept whole
+    rather than cut through its LaTeX.
+    """
+    chunks, current = [], ""
+    for unit in split_units(text):
+        candidate = f"{current} {unit}" if current else unit
+        if current and len(candidate) > max_chars:
+            chunks.append(current)
+            current = unit
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+# DOCUMENT STREAMING
+
+def iter_source_files(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(SUPPORTED_SUFFIXES):
+                        yield os.path.normpath(os.path.join(root, name))
+        elif path.endswith(SUPPORTED_SUFFIXES):
+            yield os.path.normpath(path)
+
+
+def iter_documents(paths: Iterable[str]) -> Iterator[Tuple[str, str, Dict[str, object]]]:
+    """Yields (source_id, text, metadata) one document at a time."""
+    for file_path in iter_source_files(paths):
+        if file_path.endswith(".jsonl"):
+            with open(file_path, encoding="utf-8") as f:
+                for line_no, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    text = record.get("text") or record.get("content")
+                    if not text:
+                        continue
+                    source = f"{file_path}#{record.get('id', line_no)}"
+                    yield source, text, dict(record.get("metadata") or {})
+        else:
+            with open(file_path, encoding="utf-8") as f:
+                yield file_path, f.read(), {}
+
+
+def iter_chunked_documents(
+    paths: Iterable[str],
+    max_chars: int = DEFAULT_CHUNK_CHARS,
+) -> Iterator[Tuple[str, List[Chunk]]]:
+    for source, text, metadata in iter_documents(paths):
+        chunks = []
+        for i, piece in enumerate(chunk_text(text, max_chars)):
+            meta = {k: v for k, v in metadata.items() if isinstance(v, (str, int, float, bool))}
+            meta.update({"source": source, "chunk": i})
+            chunks.append(Chunk(chunk_id(source, piece), piece, meta))
+        yield source, chunks
+
+# EMBEDDING (optionally in worker processes)
+
+_worker_backend = None
+
+
+def _init_worker() -> None:
+    global _worker_backend
+    from embedding_backends import load_embedding_backend
+    _worker_backend = load_embedding_backend()
+
+
+def _embed_in_worker(texts: List[str]) -> np.ndarray:
+    return _worker_backend.encode(texts)
+
+
+class Embedder:
+    """Embeds batches in-process, or split across a process pool when workers > 1."""
+
+    def __init__(self, workers: int = 1):
+        self.workers = workers
+        self._pool: Optional[Pool] = None
+        if workers > 1:
+            self._pool = Pool(workers, initializer=_init_worker)
+        else:
+            from resources import get_embedding_model
+            self._backend = get_embedding_model()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if self._pool is None:
+            return self._backend.encode(texts)
+        size = -(-len(texts) // self.workers)
+        parts = [texts[i:i + size] for i in range(0, len(texts), size)]
+        return np.concatenate(self._pool.map(_embed_in_worker, parts))
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+# UPSERT PIPELINE
+
+def _flush(collection, pending: Dict[str, Chunk], embedder: Embedder, stats: IngestStats) -> None:
+    ids = list(pending)
+    existing = set(collection.get(ids=ids, include=[])["ids"])
+    new_chunks = [pending[i] for i in ids if i not in existing]
+    stats.skipped += len(existing)
+
+    if new_chunks:
+        embeddings = embedder.encode([c.text for c in new_chunks])
+        collection.upsert(
+            ids=[c.id for c in new_chunks],
+            documents=[c.text for c in new_chunks],
+            embeddings=embeddings.tolist(),
+            metadatas=[c.metadata for c in new_chunks],
+        )
+        stats.embedded += len(new_chunks)
+    pending.clear()
+
+
+def _prune_source(collection, source: str, keep_ids: List[str]) -> int:
+    """Deletes chunks previously stored for `source` that are no longer part of it."""
+    stored = collection.get(where={"source": source}, include=[])["ids"]
+    stale = sorted(set(stored) - set(keep_ids))
+    if stale:
+        collection.delete(ids=stale)
+    return len(stale)
+
+
+def ingest(
+    paths: Iterable[str],
+    collection,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    max_chars: int = DEFAULT_CHUNK_CHARS,
+    workers: int = 1,
+    prune: bool = True,
+    progress_every: int = 1000,
+) -> IngestStats:
+    """
+    Streams documents from `paths` into `collection`, upserting chunks by
+    source and content hash. Returns ingestion statistics.
+    """
+    stats = IngestStats()
+    embedder = Embedder(workers)
+    pending: Dict[str, Chunk] = {}
+
+    try:
+        for source, chunks in iter_chunked_documents(paths, max_chars):
+            stats.documents += 1
+            stats.chunks += len(chunks)
+            if prune:
+                stats.pruned += _prune_source(collection, source, [c.id for c in chunks])
+
+            for chunk in chunks:
+                pending[chunk.id] = chunk
+                if len(pending) >= batch_size:
+                    _flush(collection, pending, embedder, stats)
+
+            if progress_every and stats.documents % progress_every == 0:
+                print(stats.report())
+
+        if pending:
+            _flush(collection, pending, embedder, stats)
+    finally:
+        embedder.close()
+
+    print(stats.report(final=True))
+    return stats
+
+
+def get_or_create_kb_collection(path: str = VECTOR_DB_PATH, name: str = COLLECTION_NAME):
+    import chromadb
+
+    client = chromadb.PersistentClient(path=path)
+    return client.get_or_create_collection(name=name, embedding_function=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream JSONL/Markdown documents into the KB collection.")
+    parser.add_argument("paths", nargs="+", help="Files or directories containing .jsonl / .md documents.")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Chunks embedded per batch.")
+    parser.add_argument("--chunk-chars", type=int, default=DEFAULT_CHUNK_CHARS, help="Maximum characters per chunk.")
+    parser.add_argument("--workers", type=int, default=1, help="Embedding worker processes (1 = in-process).")
+    parser.add_argument("--no-prune", action="store_true", help="Keep chunks that no longer belong to their source.")
+    parser.add_argument("--db-path", default=VECTOR_DB_PATH)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--export-numpy", action="store_true", help="Refresh the NumPy index after ingestion.")
+    parser.add_argument("--no-lexical", action="store_true", help="Skip rebuilding the lexical (BM25) index.")
+    args = parser.parse_args()
+
+    kb_collection = get_or_create_kb_collection(args.db_path, args.collection)
+    ingest(
+        args.paths,
+        kb_collection,
+        batch_size=args.batch_size,
+        max_chars=args.chunk_chars,
+        workers=args.workers,
+        prune=not args.no_prune,
+    )
+
+    if args.export_numpy:
+        from numpy_index import export_from_chroma
+        export_from_chroma(kb_collection)
+
+    if not args.no_lexical:
+        from lexical_index import build_from_chroma
+        build_from_chroma(kb_collection)
@@ -1,17 +1,27 @@
-from google import genai
-from typing import List, Tuple
-from dotenv import load_dotenv
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from resources import get_genai_client
+from example_index import few_shot_examples
+from kb_search import run_in_search_executor
+from context_packer import KB_CONTEXT_TOKEN_BUDGET, pack_passages
+from resilience import gemini_dependency
+from telemetry import get_logger, span
 
-load_dotenv()
-
-# Configuration
-client = genai.Client()
+# Configuration (the Gemini client is created lazily on first use)
 LLM_MODEL = 'gemini-2.5-flash'
 
+logger = get_logger("kb_agent")
+
 
-def create_rag_prompt(question: str, retrieved_data: List[Tuple[str, float]]) -> str:
+def create_rag_prompt(
+    question: str,
+    retrieved_data: List[Tuple[str, float]],
+    examples: Optional[List[Dict]] = None
+) -> str:
     """
-    Constructs the final, structured prompt for the LLM.
+    Constructs the final, structured prompt for the LLM. `examples` are
+    reviewer-refined solutions to similar questions, already trimmed to the
+    prompt budget by `few_shot_examples`. Retrieved documents are deduplicated
+    and packed into KB_CONTEXT_TOKEN_BUDGET tokens.
     """
     
     # System/Role Instruction
@@ -36,16 +46,33 @@ def create_rag_prompt(question: str, retrieved_data: List[Tuple[str, float]]) ->
         "..."
     )
     
+    # Few-Shot Examples Section Construction
+    examples_text = ""
+    if examples:
+        examples_text = (
+            "\n\n[SOLVED EXAMPLES]\n"
+            "Reviewed solutions to similar questions. Follow their method and format; "
+            "take facts only from [CONTEXT].\n"
+        )
+        for i, example in enumerate(examples):
+            examples_text += f"Example {i+1}:\nQuestion: {example['question']}\nSolution: {example['ideal_answer']}\n"
+
     # Context Section Construction
+    packed = pack_passages(question, [doc for doc, _ in retrieved_data], KB_CONTEXT_TOKEN_BUDGET, label="KB")
     context_text = "\n\n[CONTEXT]\n"
-    for i, (doc_content, distance) in enumerate(retrieved_data):
+    for i, (doc_index, doc_content) in enumerate(zip(packed.indexes, packed.passages)):
+        distance = retrieved_data[doc_index][1]
         context_text += f"Document {i+1} (Distance: {distance:.4f}): {doc_content}\n"
 
     # Final Prompt
-    final_prompt = f"{system_instruction}\n\n{context_text}\n\n[USER QUESTION]: {question}"
+    final_prompt = f"{system_instruction}{examples_text}\n\n{context_text}\n\n[USER QUESTION]: {question}"
     
     return final_prompt
 
+def build_rag_prompt(question: str, retrieved_data: List[Tuple[str, float]]) -> str:
+    """Looks up few-shot examples and builds the packed prompt (embedding work included)."""
+    return create_rag_prompt(question, retrieved_data, few_shot_examples(question))
+
 # Main KB Response Agent Function
 def KBResponseAgent(
     question: str, 
@@ -60,25 +87,76 @@ def KBResponseAgent(
 
     Returns:
         The generated final answer string.
+
+    Raises:
+        DependencyError: Gemini failed, timed out or its circuit is open.
     """
     if not retrieved_data:
         return "KB Response Agent failed: No relevant context was provided."
 
     # Construct the RAG Prompt
-    rag_prompt = create_rag_prompt(question, retrieved_data)
+    rag_prompt = build_rag_prompt(question, retrieved_data)
 
-    print(" KB Response Agent generating answer...")
+    logger.info("KB Response Agent generating answer", extra={"documents": len(retrieved_data)})
     
-    try:
-        # Call the Gemini API
-        response = client.models.generate_content(
+    # Call the Gemini API (timeout, retries and circuit breaker in resilience.py)
+    with span("llm_generation"):
+        response = gemini_dependency.call_sync(lambda: get_genai_client().models.generate_content(
             model=LLM_MODEL,
             contents=[rag_prompt],
-        )
-        
-        # Return the generated text
-        return response.text
+        ))
     
-    except Exception as e:
-        return f" LLM Generation Error: Could not connect to the model or process the request. Details: {e}"
+    # Return the generated text
+    return response.text
 
+
+
+async def KBResponseAgentAsync(
+    question: str, 
+    retrieved_data: List[Tuple[str, float]]
+) -> str:
+    """
+    Async variant of `KBResponseAgent`. Uses the non-blocking Gemini client so a
+    slow generation does not stall the event loop. Raises `DependencyError`
+    like the sync variant.
+    """
+    if not retrieved_data:
+        return "KB Response Agent failed: No relevant context was provided."
+
+    rag_prompt = await run_in_search_executor(build_rag_prompt, question, retrieved_data)
+
+    logger.info("KB Response Agent generating answer", extra={"documents": len(retrieved_data)})
+
+    with span("llm_generation"):
+        response = await gemini_dependency.call(lambda: get_genai_client().aio.models.generate_content(
+            model=LLM_MODEL,
+            contents=[rag_prompt],
+        ))
+    return response.text
+
+
+async def KBResponseAgentStream(
+    question: str, 
+    retrieved_data: List[Tuple[str, float]]
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of `KBResponseAgent`. Yields text chunks as Gemini
+    generates them instead of waiting for the full response. Opening the stream
+    is retried; a stall between chunks raises `DependencyTimeout`.
+    """
+    if not retrieved_data:
+        yield "KB Response Agent failed: No relevant context was provided."
+        return
+
+    rag_prompt = await run_in_search_executor(build_rag_prompt, question, retrieved_data)
+
+    logger.info("KB Response Agent streaming answer", extra={"documents": len(retrieved_data)})
+
+    with span("llm_generation"):
+        stream = await gemini_dependency.call(lambda: get_genai_client().aio.models.generate_content_stream(
+            model=LLM_MODEL,
+            contents=[rag_prompt],
+        ))
+        async for chunk in gemini_dependency.iterate(stream):
+            if chunk.text:
+                yield chunk.text
@@ -1,40 +1,479 @@
-from sentence_transformers import SentenceTransformer
-import chromadb
-from typing import List, Tuple, Dict
+import numpy as np
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Tuple, Dict, Optional
 
-# Initialize the embedding model
-EMBEDDING_MODEL = SentenceTransformer('all-MiniLM-L6-v2') 
-EMBEDDING_DIMENSION = 384 
+# The embedding backend is loaded lazily (see resources.get_embedding_model)
+from embedding_backends import EMBEDDING_DIMENSION
+from lexical_index import LexicalIndexService
+from resources import get_embedding_model
+from telemetry import get_logger, span
+
+logger = get_logger("kb_search")
 
 # Define the VectorDB path and collection name
 VECTOR_DB_PATH = "./chromadb_math_jee" 
 COLLECTION_NAME = "math_jee_collection" 
 
+# Vector store behind kb_similarity_search: "chroma" (default) or "numpy" (see numpy_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+
+# How often (seconds) the retrieval service checks the on-disk collection for changes
+RECONNECT_CHECK_INTERVAL = float(os.getenv("KB_RECONNECT_CHECK_INTERVAL", "5.0"))
+
+# Bounded pool for the CPU-bound stages (embedding, vector search) of async requests
+KB_EXECUTOR_WORKERS = int(os.getenv("KB_EXECUTOR_WORKERS", "4"))
+SEARCH_EXECUTOR = ThreadPoolExecutor(
+    max_workers=KB_EXECUTOR_WORKERS,
+    thread_name_prefix="kb-search"
+)
+
+# Hybrid retrieval: the vector hits are fused with BM25 hits over math-aware
+# tokens (lexical_index.py) by reciprocal rank fusion
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# RRF damping constant: a document scores sum(1 / (RRF_K + rank)) over the rankings
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Upper bound on memoized query embeddings (384 float32 values = 1.5 KB each)
+EMBEDDING_MEMO_MAX_ENTRIES = int(os.getenv("EMBEDDING_MEMO_MAX_ENTRIES", "4096"))
+
 
 def get_chroma_collection(collection_name: str):
     """Initializes the Chroma client and gets the target collection."""
+    import chromadb
+
     try:
         chroma_client = chromadb.PersistentClient(path=VECTOR_DB_PATH)
-        
+
         collection = chroma_client.get_collection(
             name=collection_name, 
             embedding_function=None 
         )
-        print(f" Successfully connected to collection: {collection_name}")
+        logger.info("Connected to collection", extra={"collection": collection_name})
         return collection
     except Exception as e:
-        print(f" Error connecting to ChromaDB or collection: {e}")
-        print("Ensure the collection exists and the path is correct.")
+        logger.error("Error connecting to ChromaDB or collection. Ensure the collection exists and the path is correct.", extra={"error": str(e)})
         return None
 
+# Retrieval Service
+
+class RetrievalService:
+    """
+    Owns a single Chroma client and collection handle for the life of the process.
+
+    The handle is opened once in `start()` and shared by every query. The service
+    periodically fingerprints the on-disk sqlite file and reopens the collection
+    when it has been rewritten (e.g. after re-running `path.py`). Queries are
+    counted while they run; a reconnect waits for the ones on the old handle to
+    finish before it drops Chroma's cached system under them.
+    """
+
+    def __init__(
+        self,
+        path: str = VECTOR_DB_PATH,
+        collection_name: str = COLLECTION_NAME,
+        check_interval: float = RECONNECT_CHECK_INTERVAL,
+    ):
+        self.path = path
+        self.collection_name = collection_name
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._collection = None
+        self._fingerprint: Optional[Tuple[int, int]] = None
+        self._last_check = 0.0
+        # Queries running on the current handle; guarded by its own condition
+        self._readers = 0
+        self._readers_done = threading.Condition()
+
+    def _disk_fingerprint(self) -> Optional[Tuple[int, int]]:
+        """Returns (mtime_ns, size) of the Chroma sqlite file, or None if it is missing."""
+        try:
+            st = os.stat(os.path.join(self.path, "chroma.sqlite3"))
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _drop_client(self) -> None:
+        """
+        Unpublishes the client and collection, waits for the queries still
+        running on them, then drops Chroma's cached system so a reopened client
+        re-reads the files on disk. Caller must hold the lock.
+        """
+        with self._readers_done:
+            client = self._client
+            self._client = None
+            self._collection = None
+            while self._readers:
+                self._readers_done.wait()
+        if client is not None:
+            client.clear_system_cache()
+
+    def _connect(self) -> None:
+        """Opens (or reopens) the client and collection. Caller must hold the lock."""
+        self._drop_client()
+        self._fingerprint = self._disk_fingerprint()
+        self._last_check = time.monotonic()
+
+        import chromadb
+
+        try:
+            self._client = chromadb.PersistentClient(path=self.path)
+            self._collection = self._client.get_collection(
+                name=self.collection_name,
+                embedding_function=None
+            )
+            logger.info("Retrieval service connected to collection", extra={"collection": self.collection_name})
+        except Exception as e:
+            self._collection = None
+            logger.error("Error connecting to ChromaDB or collection. Ensure the collection exists and the path is correct.", extra={"error": str(e)})
+
+    def start(self) -> None:
+        """Opens the client and collection. Called once on application startup."""
+        with self._lock:
+            self._connect()
+
+    def close(self) -> None:
+        """Releases the client and collection. Called on application shutdown."""
+        with self._lock:
+            self._drop_client()
+            self._fingerprint = None
+            logger.info("Retrieval service closed")
+
+    def get_collection(self):
+        """
+        Returns the shared collection handle, reconnecting if the on-disk
+        collection has changed or a previous connection attempt failed.
+        """
+        now = time.monotonic()
+        collection = self._collection
+        if collection is not None and now - self._last_check < self.check_interval:
+            return collection
+
+        with self._lock:
+            if self._collection is None or now - self._last_check >= self.check_interval:
+                self._last_check = now
+                if self._collection is None or self._disk_fingerprint() != self._fingerprint:
+                    self._connect()
+            return self._collection
+
+    def is_available(self) -> bool:
+        return self.get_collection() is not None
+
+    def _acquire(self):
+        """The current collection, counted as in use until `_release()`; None if unavailable."""
+        while True:
+            collection = self.get_collection()
+            if collection is None:
+                return None
+            with self._readers_done:
+                if collection is self._collection:
+                    self._readers += 1
+                    return collection
+            # Reconnected in between: take the new handle
+
+    def _release(self) -> None:
+        with self._readers_done:
+            self._readers -= 1
+            if not self._readers:
+                self._readers_done.notify_all()
+
+    def query(self, query_vectors: np.ndarray, k: int = 5) -> List[List[Tuple[str, float]]]:
+        """Runs one multi-query search and returns [(document, distance), ...] per query."""
+        collection = self._acquire()
+        if collection is None:
+            return [[] for _ in range(len(query_vectors))]
+
+        try:
+            results = collection.query(
+                query_embeddings=np.asarray(query_vectors, dtype=np.float32).tolist(),
+                n_results=k,
+                include=['documents', 'distances']
+            )
+        finally:
+            self._release()
+
+        if not (results and results['documents'] and results['distances']):
+            return [[] for _ in range(len(query_vectors))]
+
+        return [
+            list(zip(documents, distances))
+            for documents, distances in zip(results['documents'], results['distances'])
+        ]
+
+
+def _build_retrieval_service():
+    if VECTOR_BACKEND == "numpy":
+        from numpy_index import NumpyRetrievalService
+        return NumpyRetrievalService()
+    return RetrievalService()
+
+
+# Process-wide retrieval service used by the gateway
+retrieval_service = _build_retrieval_service()
+# Process-wide lexical index, built by ingest.py / path.py (see lexical_index.py)
+lexical_service = LexicalIndexService()
+
+# Query Embedding Memo
+
+class EmbeddingMemo:
+    """
+    Bounded LRU memo of query embeddings stored as read-only float32 arrays.
+
+    Keys are the lowercased, whitespace-collapsed question. all-MiniLM-L6-v2 is
+    an uncased model, so questions that share a key encode to the same vector.
+    """
+
+    def __init__(self, max_entries: int = EMBEDDING_MEMO_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(question: str) -> str:
+        return " ".join(question.lower().split())
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key: str, vector: np.ndarray) -> np.ndarray:
+        vector = np.ascontiguousarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return vector
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(v.nbytes for v in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+embedding_memo = EmbeddingMemo()
+
 # KB Search 
 
+def embed_query(question: str) -> np.ndarray:
+    """
+    Embeds a single question with the shared embedding model, reusing the
+    memoized float32 vector when the same (normalized) text was seen recently.
+    """
+    key = EmbeddingMemo.make_key(question)
+    vector = embedding_memo.get(key)
+    if vector is not None:
+        return vector
+
+    logger.debug("Embedding question")
+    return embedding_memo.put(key, get_embedding_model().encode([question])[0])
+
+
+def embed_queries(questions: List[str]) -> np.ndarray:
+    """
+    Embeds many questions at once. Memoized vectors are reused and the rest are
+    encoded in a single batched call to the embedding model.
+
+    Returns:
+        A float32 array of shape (len(questions), EMBEDDING_DIMENSION).
+    """
+    vectors: List[Optional[np.ndarray]] = []
+    missing: Dict[str, List[int]] = {}
+    for i, question in enumerate(questions):
+        key = EmbeddingMemo.make_key(question)
+        vector = embedding_memo.get(key)
+        vectors.append(vector)
+        if vector is None:
+            missing.setdefault(key, []).append(i)
+
+    if missing:
+        logger.debug("Batch embedding questions", extra={"questions": len(missing)})
+        first_index = [indexes[0] for indexes in missing.values()]
+        encoded = get_embedding_model().encode([questions[i] for i in first_index], batch_size=64)
+        for (key, indexes), row in zip(missing.items(), encoded):
+            vector = embedding_memo.put(key, row)
+            for i in indexes:
+                vectors[i] = vector
+
+    if not vectors:
+        return np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
+    return np.stack(vectors)
+
+
+class SearchHits(list):
+    """
+    [(document, vector distance), ...] for one question, plus the best BM25
+    coverage score among its lexical hits (`lexical_score`: 0.0 when nothing
+    matched, None when the lexical index was not queried). The router uses
+    the two signals separately. Slices are plain lists.
+    """
+
+    def __init__(self, hits: Iterable[Tuple[str, float]] = (), lexical_score: Optional[float] = None):
+        super().__init__(hits)
+        self.lexical_score = lexical_score
+
+
+def fuse_rankings(
+    vector_ranking: List[Tuple[str, float]],
+    lexical_ranking: List[Tuple[str, float]],
+    k: int = 5,
+    rrf_k: int = RRF_K,
+) -> List[Tuple[str, float]]:
+    """
+    Reciprocal rank fusion of a vector ranking [(document, distance), ...]
+    and a lexical ranking [(document, score), ...].
+
+    Documents are ordered by sum(1 / (rrf_k + rank)) over the rankings that
+    contain them, so agreement between rankings wins over a single strong
+    rank. Only ranks are fused; BM25 scores never stand in for distances.
+    Every hit carries its vector distance. A document only the lexical
+    ranking found lies outside the vector candidates, so it gets the
+    farthest candidate's distance, a lower bound on its own. Without vector
+    hits there is no distance to report and nothing is returned. The list is
+    ordered by fused rank, not by distance (see `best_distance`).
+    """
+    if not vector_ranking:
+        return []
+    scores: Dict[str, float] = {}
+    distances: Dict[str, float] = {}
+    for document, distance in vector_ranking:
+        distances.setdefault(document, distance)
+    for ranking in (vector_ranking, lexical_ranking):
+        for rank, (document, _) in enumerate(ranking, start=1):
+            scores[document] = scores.get(document, 0.0) + 1.0 / (rrf_k + rank)
+
+    farthest = vector_ranking[-1][1]
+    fused = sorted(scores, key=lambda document: (-scores[document], distances.get(document, farthest)))
+    return [(document, distances.get(document, farthest)) for document in fused[:k]]
+
+
+def best_distance(hits: List[Tuple[str, float]]) -> float:
+    """Smallest vector distance among the hits; with hybrid search the first hit is not necessarily the closest."""
+    return min(distance for _, distance in hits)
+
+
+# Queries fused with lexical hits, and fused hits the vector ranking alone would not have returned
+hybrid_stats = {"queries": 0, "lexical_only_hits": 0}
+
+
+def _hybrid_query(
+    query_vectors: np.ndarray,
+    queries: List[str],
+    k: int,
+) -> List[SearchHits]:
+    candidates = max(k, HYBRID_CANDIDATES)
+    vector_hits = retrieval_service.query(query_vectors, candidates)
+    with span("lexical_query"):
+        lexical_hits = lexical_service.query(queries, candidates)
+
+    fused = []
+    for vector_ranking, lexical_ranking in zip(vector_hits, lexical_hits):
+        hits = fuse_rankings(vector_ranking, lexical_ranking, k)
+        fused.append(SearchHits(hits, lexical_ranking[0][1] if lexical_ranking else 0.0))
+        if not lexical_ranking:
+            continue
+        hybrid_stats["queries"] += 1
+        vector_documents = {document for document, _ in vector_ranking[:k]}
+        hybrid_stats["lexical_only_hits"] += sum(document not in vector_documents for document, _ in hits)
+    return fused
+
+
+def search_by_vectors(
+    query_vectors: np.ndarray,
+    k: int = 5,
+    queries: Optional[List[str]] = None,
+) -> List[SearchHits]:
+    """
+    Performs one multi-query similarity search on the VectorDB.
+
+    Args:
+        query_vectors: Question embeddings, one row per question.
+        k: The number of top-k most relevant results to retrieve per question.
+        queries: The question texts. When given (and HYBRID_SEARCH is on and
+            the lexical index is built) the vector hits are fused with BM25
+            hits over math-aware tokens.
+
+    Returns:
+        One SearchHits list of (document_content, distance_score) tuples per
+        query vector. Vector-only results are sorted by distance; hybrid
+        results are sorted by fused rank and also carry the best lexical score.
+    """
+    empty = [SearchHits() for _ in range(len(query_vectors))]
+    if not len(query_vectors):
+        return empty
+
+    # Perform the similarity search on the configured vector store
+    try:
+        if queries is not None and HYBRID_SEARCH and lexical_service.is_available():
+            retrieved = _hybrid_query(query_vectors, queries, k)
+        else:
+            retrieved = [SearchHits(hits) for hits in retrieval_service.query(query_vectors, k)]
+        logger.debug("Retrieved results", extra={"queries": len(retrieved)})
+        return retrieved
+
+    except Exception as e:
+        logger.error("Error during similarity search", extra={"error": str(e)})
+        return empty
+
+
+def search_by_vector(
+    query_vector: np.ndarray,
+    k: int = 5,
+    query: Optional[str] = None,
+) -> SearchHits:
+    """
+    Performs a similarity search on the VectorDB for an already-embedded question.
+
+    Args:
+        query_vector: The question embedding produced by `embed_query`.
+        k: The number of top-k most relevant results to retrieve.
+        query: The question text, for hybrid search (see `search_by_vectors`).
+
+    Returns:
+        A list of tuples: [(document_content, distance_score), ...] 
+        Sorted by relevance.
+    """
+    queries = None if query is None else [query]
+    return search_by_vectors(np.asarray(query_vector)[np.newaxis, :], k, queries)[0]
+
+
 def kb_similarity_search(
     question: str, 
     k: int = 5, 
-) -> List[Tuple[str, float]]:
+) -> SearchHits:
     """
-    Embeds the user's question and performs a similarity search on the VectorDB.
+    Embeds the user's question and performs a similarity search on the VectorDB,
+    fused with the lexical index when hybrid search is on.
 
     Args:
         question: The user's question (e.g., "What is the formula for integration by parts?").
@@ -42,39 +481,29 @@ def kb_similarity_search(
 
     Returns:
         A list of tuples: [(document_content, distance_score), ...] 
-        Sorted by relevance (lowest distance first).
+        Sorted by relevance.
     """
-    
-    # Get the VectorDB collection
-    collection = get_chroma_collection(COLLECTION_NAME)
-    if collection is None:
-        return []
+    if not retrieval_service.is_available():
+        return SearchHits()
 
-    # Embed the user's question
-    print(f"⚙️ Embedding question: '{question[:30]}...'")
-    query_vector = EMBEDDING_MODEL.encode([question]).tolist()
-    
-    # Perform the similarity search
-    try:
-        results = collection.query(
-            query_embeddings=query_vector,
-            n_results=k,
-            include=['documents', 'distances']
-        )
-        
-        retrieved_documents = []
-        if results and results['documents'] and results['distances']:
-            documents = results['documents'][0]
-            distances = results['distances'][0]
-            
-            for doc, dist in zip(documents, distances):
-                retrieved_documents.append((doc, dist))
-        
-        print(f" Retrieved {len(retrieved_documents)} results.")
-        return retrieved_documents
-        
-    except Exception as e:
-        print(f" Error during similarity search: {e}")
-        return []
+    return search_by_vector(embed_query(question), k, question)
+
+# Async KB Search
+
+async def run_in_search_executor(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs a CPU-bound KB stage on the bounded search executor without blocking
+    the event loop. The caller's context (request id, open spans) is carried
+    into the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(SEARCH_EXECUTOR, functools.partial(ctx.run, func, *args, **kwargs))
 
 
+async def kb_similarity_search_async(
+    question: str,
+    k: int = 5,
+) -> SearchHits:
+    """Async variant of `kb_similarity_search`; embedding and search run on the search executor."""
+    return await run_in_search_executor(kb_similarity_search, question, k)
@@ -0,0 +1,372 @@
+"""
+BM25 inverted index over the KB documents with math-aware tokens.
+
+MiniLM embeddings blur LaTeX: `\\int x \\cos(x) dx` or `S_n = n(n+1)/2` land
+far from the passage that contains exactly those symbols. The tokenizer here
+keeps LaTeX commands (`\\int`, `\\frac`, `\\binom`), sub/superscripts (`s_n`,
+`x^2`, `e^x`), numbers and operators as terms, maps Unicode math symbols to
+their LaTeX names, and lowercases and lightly stems words. kb_search fuses the
+BM25 ranking with the vector ranking (reciprocal rank fusion), and the gateway
+routes a query to the KB when its best BM25 match covers the query well
+enough (LEXICAL_ROUTE_SCORE in router_agent.py).
+
+The index is built from the KB collection after ingestion and published with
+the same snapshot layout as numpy_index.py. Postings are stored CSR-style:
+an (V + 1) term pointer array into one int32 doc-id array and one float32
+array of precomputed BM25 term weights, all memory-mapped on load, so a query
+is a handful of slice lookups and one scatter-add per query term.
+
+    python lexical_index.py build
+"""
+import argparse
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+from numpy_index import (
+    NUMPY_INDEX_MMAP,
+    NumpyRetrievalService,
+    load_documents,
+    pack_documents,
+    read_snapshot_meta,
+    save_documents,
+    unpack_document,
+    write_snapshot,
+)
+
+# CONFIGURATION
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "./lexical_index_math_jee")
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# A query must carry at least this many rare terms' worth of idf before a
+# full match counts as a confident (score 1.0) hit; see `LexicalIndex.scores`
+LEXICAL_MIN_EVIDENCE_TERMS = float(os.getenv("LEXICAL_MIN_EVIDENCE_TERMS", "2.0"))
+# Documents read from Chroma per page while building
+_BUILD_PAGE_SIZE = 5000
+
+_TERMS_FILE = "terms.json"
+_POINTERS_FILE = "term_pointers.npy"
+_POSTING_DOCS_FILE = "posting_docs.npy"
+_POSTING_WEIGHTS_FILE = "posting_weights.npy"
+_IDF_FILE = "idf.npy"
+
+# MATH-AWARE TOKENIZER
+
+# Unicode math symbols are indexed under their LaTeX names
+_UNICODE_MATH = {
+    "∫": r"\int", "∑": r"\sum", "∏": r"\prod", "√": r"\sqrt", "∞": r"\infty", "∂": r"\partial",
+    "∇": r"\nabla", "≤": r"\le", "≥": r"\ge", "≠": r"\neq", "≈": r"\approx", "±": r"\pm",
+    "×": r"\times", "·": r"\cdot", "→": r"\to", "∈": r"\in", "∪": r"\cup", "∩": r"\cap",
+    "π": r"\pi", "θ": r"\theta", "α": r"\alpha", "β": r"\beta", "γ": r"\gamma", "δ": r"\delta",
+    "λ": r"\lambda", "μ": r"\mu", "σ": r"\sigma", "φ": r"\phi", "ω": r"\omega", "Δ": r"\delta",
+}
+_UNICODE_MATH_TABLE = str.maketrans({
+    **{symbol: f" {name} " for symbol, name in _UNICODE_MATH.items()},
+    "²": "^2", "³": "^3", "ⁿ": "^n", "₁": "_1", "₂": "_2", "ₙ": "_n",
+})
+
+# Spellings of the same command
+_COMMAND_ALIASES = {
+    r"\leq": r"\le", r"\geq": r"\ge", r"\ne": r"\neq", r"\dfrac": r"\frac", r"\tfrac": r"\frac",
+    r"\choose": r"\binom", r"\dbinom": r"\binom", r"\varphi": r"\phi", r"\rightarrow": r"\to",
+}
+# Layout commands that say nothing about the content
+_IGNORED_COMMANDS = {
+    r"\left", r"\right", r"\big", r"\bigg", r"\mathbf", r"\mathrm", r"\mathit", r"\text",
+    r"\textbf", r"\displaystyle", r"\quad", r"\qquad", r"\limits",
+}
+_STOPWORDS = {
+    "a", "an", "the", "of", "and", "or", "to", "in", "is", "are", "be", "for", "on", "at", "by",
+    "with", "as", "that", "this", "it", "its", "if", "then", "than", "from", "what", "how",
+    "which", "when", "where", "can", "do", "does", "we", "you", "me", "my", "find",
+    "given", "use", "using", "also", "any", "all", "there", "some", "such", "not", "s",
+}
+
+_TOKEN = re.compile(
+    # Sub/superscripted symbols: S_n, x^2, e^{x}, a_{n+1}, S_{\infty}
+    r"(?P<script>[^\W_]+(?:\s*[_^]\s*(?:\{[^{}]*\}|\\[A-Za-z]+|[^\W_]))+)"
+    # LaTeX commands: \int, \frac, \sqrt
+    r"|(?P<command>\\[A-Za-z]+)"
+    r"|(?P<number>\d+(?:\.\d+)?)"
+    r"|(?P<word>[^\W\d_]+)"
+    r"|(?P<operator>[=+\-/<>!|])"
+)
+_SCRIPT_NOISE = re.compile(r"[\s{}]")
+
+
+def _stem(word: str) -> str:
+    """Folds regular plurals, so 'roots' matches 'root' and 'series' matches itself."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase index terms. Scripted symbols are kept whole
+    (`s_n`) and their base is emitted too (`s`), so a query written with or
+    without the subscript still matches.
+    """
+    terms = []
+    for match in _TOKEN.finditer(text.translate(_UNICODE_MATH_TABLE)):
+        kind = match.lastgroup
+        token = match.group(kind).lower()
+        if kind == "script":
+            token = _SCRIPT_NOISE.sub("", token)
+            terms.append(token)
+            terms.append(re.split(r"[_^]", token, 1)[0])
+        elif kind == "command":
+            if token not in _IGNORED_COMMANDS:
+                terms.append(_COMMAND_ALIASES.get(token, token))
+        elif kind == "word":
+            if token not in _STOPWORDS:
+                terms.append(_stem(token))
+        else:
+            terms.append(token)
+    return terms
+
+# INDEX
+
+class LexicalIndex:
+    """
+    Read-only BM25 index. Each posting stores the BM25 term-frequency factor
+    tf * (k1 + 1) / (tf + k1 * (1 - b + b * len / avg_len)), so scoring a
+    document is sum(idf[t] * weight[t, doc]) over the query terms.
+
+    Results are reported as coverage scores in [0, 1], not distances: a
+    document whose BM25 score covers the whole query's idf mass scores 1.0.
+    They are on a different scale from vector distances, so kb_search only
+    uses their ranks for fusion and the router has a separate threshold.
+    """
+
+    def __init__(
+        self,
+        terms: Sequence[str],
+        pointers: np.ndarray,
+        posting_docs: np.ndarray,
+        posting_weights: np.ndarray,
+        idf: np.ndarray,
+        documents: np.ndarray,
+        offsets: np.ndarray,
+        ids: Sequence[str],
+    ):
+        if len(pointers) != len(terms) + 1 or len(idf) != len(terms):
+            raise ValueError("pointers and idf must match the vocabulary.")
+        if len(offsets) != len(ids) + 1:
+            raise ValueError("offsets must have one more entry than there are documents.")
+
+        self.terms = list(terms)
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(self.terms)}
+        self.pointers = pointers
+        self.posting_docs = posting_docs
+        self.posting_weights = posting_weights
+        self.idf = idf
+        self.documents = documents
+        self.offsets = offsets
+        self.ids = list(ids)
+        # idf of a term no document contains (unknown query terms count against
+        # coverage at this weight) and of a term only one document contains
+        self._unseen_idf = math.log(1.0 + (len(self.ids) + 0.5) / 0.5)
+        self._rare_idf = math.log(1.0 + (len(self.ids) - 0.5) / 1.5)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        items: Iterable[Tuple[str, str]],
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ) -> "LexicalIndex":
+        """
+        Builds the index from (id, text) pairs. Postings are collected in flat
+        typed arrays rather than per-term lists, then sorted into CSR order.
+        """
+        vocabulary: Dict[str, int] = {}
+        term_ids, doc_ids, frequencies, lengths = array("i"), array("i"), array("i"), array("i")
+        ids, texts = [], []
+        for doc_id, text in items:
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(len(ids))
+                frequencies.append(tf)
+            lengths.append(sum(counts.values()))
+            ids.append(doc_id)
+            texts.append(text)
+
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        pointers = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        pointers[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))
+        posting_docs = np.frombuffer(doc_ids, dtype=np.int32)[order]
+        tf = np.frombuffer(frequencies, dtype=np.int32)[order].astype(np.float32)
+
+        doc_lengths = np.frombuffer(lengths, dtype=np.int32).astype(np.float32)
+        avg_length = float(doc_lengths.mean()) if len(doc_lengths) else 1.0
+        norm = k1 * (1.0 - b + b * doc_lengths[posting_docs] / max(avg_length, 1e-9))
+        posting_weights = (tf * (k1 + 1.0) / (tf + norm)).astype(np.float32)
+
+        df = np.diff(pointers).astype(np.float64)
+        idf = np.log(1.0 + (len(ids) - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        documents, offsets = pack_documents(texts)
+        return cls(list(vocabulary), pointers, posting_docs, posting_weights, idf, documents, offsets, ids)
+
+    def document(self, i: int) -> str:
+        return unpack_document(self.documents, self.offsets, i)
+
+    # Search
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Returns each document's BM25 score divided by the query's idf mass,
+        so 1.0 means every query term was matched at full strength. The mass
+        is floored at LEXICAL_MIN_EVIDENCE_TERMS single-document terms, so a
+        query of a few common symbols ("x = 2") never looks like a confident
+        match. Repeated query terms count once.
+        """
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        mass = 0.0
+        for term in set(tokenize(query)):
+            t = self.vocabulary.get(term)
+            if t is None:
+                mass += self._unseen_idf
+                continue
+            idf = float(self.idf[t])
+            mass += idf
+            start, end = self.pointers[t], self.pointers[t + 1]
+            # Each document appears once per term, so a plain fancy-index add is exact
+            scores[self.posting_docs[start:end]] += idf * self.posting_weights[start:end]
+        mass = max(mass, LEXICAL_MIN_EVIDENCE_TERMS * self._rare_idf)
+        return scores / mass
+
+    def search(self, query: str, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k documents with a non-zero score.
+
+        Returns:
+            (indices, scores), sorted by decreasing score. Scores are capped
+            at 1.0.
+        """
+        scores = self.scores(query)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = matched[np.argsort(-scores[matched], kind="stable")]
+        return top, np.minimum(scores[top], 1.0)
+
+    def query(self, queries: Sequence[str], k: int = 5) -> List[List[Tuple[str, float]]]:
+        """[(document, score), ...] per query, best first."""
+        results = []
+        for query in queries:
+            top, scores = self.search(query, k)
+            results.append([(self.document(int(i)), float(score)) for i, score in zip(top, scores)])
+        return results
+
+    # Persistence
+
+    def save(self, index_dir: str) -> None:
+        def write_files(data_dir: str) -> None:
+            with open(os.path.join(data_dir, _TERMS_FILE), "w") as f:
+                json.dump(self.terms, f, ensure_ascii=False)
+            np.save(os.path.join(data_dir, _POINTERS_FILE), self.pointers)
+            np.save(os.path.join(data_dir, _POSTING_DOCS_FILE), self.posting_docs)
+            np.save(os.path.join(data_dir, _POSTING_WEIGHTS_FILE), self.posting_weights)
+            np.save(os.path.join(data_dir, _IDF_FILE), self.idf)
+            save_documents(data_dir, self.documents, self.offsets)
+
+        meta = {
+            "ids": self.ids,
+            "terms": len(self.terms),
+            "postings": len(self.posting_docs),
+        }
+        write_snapshot(index_dir, meta, write_files)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = NUMPY_INDEX_MMAP) -> "LexicalIndex":
+        meta, data_dir = read_snapshot_meta(index_dir)
+        mode = "r" if mmap else None
+        with open(os.path.join(data_dir, _TERMS_FILE)) as f:
+            terms = json.load(f)
+        pointers = np.load(os.path.join(data_dir, _POINTERS_FILE))
+        posting_docs = np.load(os.path.join(data_dir, _POSTING_DOCS_FILE), mmap_mode=mode)
+        posting_weights = np.load(os.path.join(data_dir, _POSTING_WEIGHTS_FILE), mmap_mode=mode)
+        idf = np.load(os.path.join(data_dir, _IDF_FILE))
+        documents, offsets = load_documents(data_dir, mmap)
+        if len(posting_docs) != meta["postings"] or len(posting_weights) != meta["postings"]:
+            raise ValueError(f"Index files in {data_dir} do not match meta.json.")
+        return cls(terms, pointers, posting_docs, posting_weights, idf, documents, offsets, meta["ids"])
+
+
+def _iter_collection(collection, page_size: int = _BUILD_PAGE_SIZE) -> Iterator[Tuple[str, str]]:
+    """Pages through a Chroma collection's documents, so the embeddings are never loaded."""
+    offset = 0
+    while True:
+        page = collection.get(include=["documents"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield from zip(page["ids"], page["documents"])
+        offset += len(page["ids"])
+
+
+def build_from_chroma(collection, index_dir: str = LEXICAL_INDEX_DIR) -> LexicalIndex:
+    """
+    Builds the lexical index over every document in a Chroma collection and
+    publishes it to `index_dir`.
+    """
+    index = LexicalIndex.build(_iter_collection(collection))
+    index.save(index_dir)
+    print(f" Built lexical index: {len(index)} documents, {len(index.terms)} terms in {index_dir}")
+    return index
+
+
+class LexicalIndexService(NumpyRetrievalService):
+    """
+    Serves the published LexicalIndex to kb_search, reloading it when a new
+    build is published. Queries take question texts instead of vectors.
+    """
+
+    index_cls = LexicalIndex
+    load_hint = "Error loading lexical index. Build it with: python lexical_index.py build"
+
+    def __init__(self, index_dir: str = LEXICAL_INDEX_DIR, **kwargs):
+        super().__init__(index_dir, **kwargs)
+
+    def query(self, queries: Sequence[str], k: int = 5) -> List[List[Tuple[str, float]]]:
+        index = self.get_index()
+        if index is None:
+            return [[] for _ in range(len(queries))]
+        return index.query(queries, k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lexical (BM25) index utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Build the lexical index from the Chroma KB collection.")
+    build_cmd.add_argument("--output-dir", default=LEXICAL_INDEX_DIR)
+    tokenize_cmd = sub.add_parser("tokenize", help="Print the index terms of a text.")
+    tokenize_cmd.add_argument("text")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from kb_search import COLLECTION_NAME, get_chroma_collection
+
+        collection = get_chroma_collection(COLLECTION_NAME)
+        if collection is None:
+            raise SystemExit(1)
+        build_from_chroma(collection, args.output_dir)
+    elif args.command == "tokenize":
+        print(" ".join(tokenize(args.text)))
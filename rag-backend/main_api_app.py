@@ -1,28 +1,108 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import APIRouter, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
 from fastapi.middleware.cors import CORSMiddleware 
+from contextlib import asynccontextmanager
+import asyncio
+import json
 
 # CORE RAG AGENT IMPORTS
 
-from ai_gateway import process_query_through_gateway
-from self_learning_agent import run_refinement_agent 
-
-# FASTAPI SETUP 
-app = FastAPI(
-    title="JEE/Math RAG Assistant",
-    description="An intelligent agent that routes math questions to a Knowledge Base (KB) or Web Search (MCP) and learns from human feedback."
+from ai_gateway import (
+    fallback_stats,
+    gateway_single_flight,
+    hedge_stats,
+    process_query_through_gateway_async,
+    process_queries_batch_async,
+    stream_query_through_gateway,
+)
+from admission import AdmissionRejected, llm_admission, retry_after_header, user_rate_limiter
+from feedback_queue import feedback_queue, refinement_worker
+from kb_search import hybrid_stats, lexical_service, retrieval_service, embedding_memo
+from resources import warm_up, is_ready, readiness_report
+from answer_cache import answer_cache
+from search_cache import search_cache
+from context_packer import packer_stats
+from resilience import gemini_dependency, tavily_dependency
+from routing_log import routing_log
+from telemetry import (
+    METRICS_CONTENT_TYPE,
+    new_request_id,
+    register_stats,
+    render_metrics,
+    request_id_var,
+    shutdown_logging,
 )
 
-# CORS MIDDLEWARE 
+# APPLICATION LIFECYCLE
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], 
-    allow_credentials=True,
-    allow_methods=["*"], 
-    allow_headers=["*"], 
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts warm-up (model, clients, VectorDB) in the background so the process
+    answers liveness probes immediately, starts the refinement worker, and
+    releases resources on shutdown.
+    """
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
+    refinement_worker.start()
+    yield
+    await refinement_worker.stop()
+    retrieval_service.close()
+    lexical_service.close()
+    shutdown_logging()
+
+# REQUEST ID MIDDLEWARE
+
+async def request_id_middleware(request: Request, call_next):
+    """
+    Tags every log line written while handling the request with its id. A
+    caller-supplied X-Request-ID is kept; the id is echoed in the response.
+    """
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+# METRICS SOURCES (exported as gauges on /metrics)
+
+register_stats("answer_cache", answer_cache.stats)
+register_stats("embedding_memo", embedding_memo.stats)
+register_stats("search_cache", search_cache.stats)
+register_stats("single_flight", gateway_single_flight.stats)
+register_stats("hedging", lambda: dict(hedge_stats))
+register_stats("context_packer", packer_stats.snapshot)
+register_stats("refinement", refinement_worker.stats)
+register_stats("fallback", lambda: dict(fallback_stats))
+register_stats("gemini", gemini_dependency.stats)
+register_stats("tavily", tavily_dependency.stats)
+register_stats("rate_limit", user_rate_limiter.stats)
+register_stats("llm_admission", llm_admission.stats)
+register_stats("routing_log", routing_log.stats)
+register_stats("hybrid_search", lambda: dict(hybrid_stats))
+
+# ADMISSION CONTROL
+
+def admit_user(user_id: str, request: Request, cost: float = 1.0) -> None:
+    """
+    Charges the caller's token bucket, or refuses with 429 and Retry-After.
+    Anonymous callers are limited per client address rather than sharing one
+    "anon" bucket.
+    """
+    if user_id == "anon" and request.client is not None:
+        user_id = f"anon:{request.client.host}"
+    try:
+        user_rate_limiter.acquire(user_id, cost)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests. Please slow down.",
+            headers=retry_after_header(e.retry_after)
+        )
 
 
 # Schema for the user's question
@@ -37,6 +117,28 @@ class SolveResponse(BaseModel):
     solution: str = Field(..., description="The final step-by-step solution or the guardrail rejection message.")
     confidence: float = Field(..., description="The RAG router's confidence score (0.0 to 1.0) in the Knowledge Base hit.")
     status: str = Field(..., description="Internal status code (e.g., 200_OK, 400_BAD_INPUT).")
+    cached: bool = Field(False, description="True when the answer was served from the answer cache.")
+    cache_tier: Optional[str] = Field(None, description="The cache tier that served the answer (exact or semantic).")
+    degraded: bool = Field(False, description="True when the routed agent failed and the KB agent answered instead.")
+    request_id: Optional[str] = Field(None, description="Id of this request (also sent as X-Request-ID); pass it back with feedback.")
+
+# Schemas for the batch solve endpoint
+class BatchSolveRequest(BaseModel):
+    queries: List[str] = Field(..., min_length=1, max_length=512, description="The math questions to be solved.")
+    level: str = Field("JEE", description="The academic level hint applied to every query.")
+    user_id: str = Field("anon", description="Identifier of the user or job submitting the batch.")
+
+class BatchSolveItem(BaseModel):
+    index: int = Field(..., description="Position of the query in the request.")
+    mode: str = Field(..., description="The Router Agent decision, or REJECTED/BLOCKED.")
+    solution: str = Field(..., description="The solution, or the guardrail message for rejected/blocked items.")
+    confidence: float = Field(0.0, description="The RAG router's confidence score.")
+    status: str = Field(..., description="Internal status code (e.g., 200_OK, 400_BAD_INPUT, 403_FORBIDDEN).")
+    cached: bool = Field(False, description="True when the answer was served from the answer cache.")
+    degraded: bool = Field(False, description="True when the routed agent failed and the KB agent answered instead.")
+
+class BatchSolveResponse(BaseModel):
+    results: List[BatchSolveItem] = Field(..., description="One result per query, in input order.")
 
 # Schema for capturing human feedback
 class HumanFeedback(BaseModel):
@@ -60,28 +162,46 @@ class HumanFeedback(BaseModel):
         None,
         description="The router's confidence score."
     )
+    request_id: Optional[str] = Field(
+        None,
+        description="The request_id of the rated answer, used to match feedback with its routing decision."
+    )
 
 
 # API ENDPOINTS 
 
-@app.get("/")
+router = APIRouter()
+
+@router.get("/")
 async def root():
     """Returns a welcome message and links to API documentation."""
     return {
         "message": "Welcome to the JEE/Math RAG Assistant API.",
         "documentation": "Visit /docs for API schema and testing.",
-        "endpoints": ["/api/solve", "/api/feedback"]
+        "endpoints": ["/api/solve", "/api/solve/stream", "/api/solve/batch", "/api/feedback", "/api/feedback/stats", "/api/cache/stats", "/metrics"]
     }
 
-@app.post("/api/solve", response_model=SolveResponse)
-async def ask_math(req: SolveRequest):
+@router.get("/healthz")
+async def liveness():
+    """Liveness probe: the process is up and serving HTTP."""
+    return {"status": "alive"}
+
+@router.get("/readyz")
+async def readiness():
+    """Readiness probe: 200 once warm-up has loaded every resource, 503 before that."""
+    report = readiness_report()
+    return JSONResponse(status_code=200 if is_ready() else 503, content=report)
+
+@router.post("/api/solve", response_model=SolveResponse)
+async def ask_math(req: SolveRequest, request: Request):
     """
     Handles a user query by running it through the Guardrails, Router, 
     and the appropriate RAG generation agent.
     """
+    admit_user(req.user_id, request)
     
-    # The AI Gateway handles the entire complex flow
-    gateway_response = process_query_through_gateway(req.query, req.level)
+    # The AI Gateway handles the entire complex flow without blocking the event loop
+    gateway_response = await process_query_through_gateway_async(req.query, req.level)
     
     status = gateway_response.get("status")
     
@@ -95,25 +215,153 @@ async def ask_math(req: SolveRequest):
             status_code=403,
             detail=gateway_response["message"]
         )
+    elif status in ("429_TOO_MANY_REQUESTS", "503_SERVICE_UNAVAILABLE", "504_GATEWAY_TIMEOUT"):
+        # Every LLM slot is busy, or an upstream (Gemini/Tavily) failed, timed
+        # out or has an open circuit
+        retry_after = gateway_response.get("retry_after")
+        raise HTTPException(
+            status_code=int(status[:3]),
+            detail=gateway_response["message"],
+            headers=retry_after_header(retry_after) if retry_after else None
+        )
     
     return SolveResponse(
         mode=gateway_response["mode"],
         solution=gateway_response["solution"],
         confidence=gateway_response["confidence"],
-        status=gateway_response["status"]
+        status=gateway_response["status"],
+        cached=gateway_response.get("cached", False),
+        cache_tier=gateway_response.get("cache_tier"),
+        degraded=gateway_response.get("degraded", False),
+        request_id=request_id_var.get()
     )
 
 
-@app.post("/api/feedback")
+@router.post("/api/solve/stream")
+async def ask_math_stream(req: SolveRequest, request: Request):
+    """
+    Streams the solution as Server-Sent Events: a `route` event with the mode
+    and confidence, `token` events with content chunks, then a `done` event
+    with the final status.
+    """
+    admit_user(req.user_id, request)
+
+    async def event_source():
+        async for event in stream_query_through_gateway(req.query, req.level):
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/api/solve/batch", response_model=BatchSolveResponse)
+async def ask_math_batch(req: BatchSolveRequest, request: Request):
+    """
+    Solves many questions in one call. Guardrails run per item, embedding and
+    retrieval are batched, and results come back per item in input order.
+    Each query costs one rate-limit token. A batch larger than the burst is
+    admitted from a full bucket and leaves it in debt for the rest.
+    """
+    admit_user(req.user_id, request, cost=len(req.queries))
+
+    gateway_responses = await process_queries_batch_async(req.queries, req.level)
+
+    return BatchSolveResponse(results=[
+        BatchSolveItem(
+            index=i,
+            mode=r["mode"],
+            solution=r.get("solution", r.get("message", "")),
+            confidence=r.get("confidence", 0.0),
+            status=r["status"],
+            cached=r.get("cached", False),
+            degraded=r.get("degraded", False)
+        )
+        for i, r in enumerate(gateway_responses)
+    ])
+
+
+@router.get("/api/cache/stats")
+async def cache_stats():
+    """
+    Returns entry counts and hit/miss counters for the answer cache tiers, the
+    embedding memo and the web search cache, plus how many requests were coalesced
+    and how much speculative work hedging discarded. `context_packer` totals the
+    estimated prompt context tokens before and after packing.
+    """
+    stats = answer_cache.stats()
+    stats["embedding_memo"] = embedding_memo.stats()
+    stats["search_cache"] = await asyncio.to_thread(search_cache.stats)
+    stats["single_flight"] = gateway_single_flight.stats()
+    stats["hedging"] = dict(hedge_stats)
+    stats["context_packer"] = packer_stats.snapshot()
+    return stats
+
+
+@router.post("/api/feedback")
 async def submit_feedback(fb: HumanFeedback):
     """
-    Collects human feedback and triggers the Self-Learning Refinement Agent 
-    for negative feedback that includes a correction.
+    Records human feedback in the durable feedback queue and returns at once.
+    The background refinement worker turns negative feedback that includes a
+    correction into few-shot examples. The assessment is also appended to the
+    routing log for threshold calibration.
     """
     feedback_data = fb.model_dump()
     
-    run_refinement_agent(feedback_data)
+    feedback_id = await asyncio.to_thread(feedback_queue.enqueue, feedback_data)
+    await asyncio.to_thread(routing_log.record_feedback, feedback_data)
     
-    return {"status": "success", "message": "Feedback recorded and refinement process initiated."}
+    return {"status": "success", "message": "Feedback recorded and queued for refinement.", "feedback_id": feedback_id}
+
+
+@router.get("/api/feedback/stats")
+async def feedback_stats():
+    """
+    Returns the refinement queue depth, the age of the oldest pending item
+    (lag), dead letters, and the worker's batch counters.
+    """
+    return await asyncio.to_thread(refinement_worker.stats)
+
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint: per-stage latency histograms and error counters,
+    request latency and counts by route, router confidence, and the cache,
+    packer and refinement stats above as gauges.
+    """
+    body = await asyncio.to_thread(render_metrics)
+    return Response(content=body, media_type=METRICS_CONTENT_TYPE)
+
+# APP FACTORY
+
+def create_app() -> FastAPI:
+    """
+    Builds the FastAPI application. Used as a factory by multi-worker servers
+    (see gunicorn_conf.py); the module-level `app` serves single-process
+    uvicorn.
+    """
+    app = FastAPI(
+        title="JEE/Math RAG Assistant",
+        description="An intelligent agent that routes math questions to a Knowledge Base (KB) or Web Search (MCP) and learns from human feedback.",
+        lifespan=lifespan
+    )
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"], 
+        allow_credentials=True,
+        allow_methods=["*"], 
+        allow_headers=["*"], 
+        expose_headers=["X-Request-ID"],
+    )
+    app.middleware("http")(request_id_middleware)
+    app.include_router(router)
+    return app
+
+
+app = create_app()
 
 # uvicorn main_api_app:app --reload
+# gunicorn -c gunicorn_conf.py "main_api_app:create_app()"
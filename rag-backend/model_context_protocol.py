@@ -1,15 +1,18 @@
-from tavily import TavilyClient
-from google import genai
-from typing import List, Dict
-from dotenv import load_dotenv
+from typing import AsyncIterator, List, Dict
+from resources import get_genai_client
+from search_cache import search_cache
+from kb_search import run_in_search_executor
+from context_packer import WEB_CONTEXT_TOKEN_BUDGET, pack_passages
+from resilience import gemini_dependency
+from telemetry import get_logger, span
 
+# Configuration (Tavily and Gemini clients are created lazily on first use;
+# Tavily responses are cached on disk, see search_cache.py)
+LLM_MODEL = 'gemini-2.5-flash'
 
-load_dotenv() 
+logger = get_logger("web_agent")
 
-# Configuration
-tavily_client = TavilyClient()
-llm_client = genai.Client()
-LLM_MODEL = 'gemini-2.5-flash'
+INSUFFICIENT_CONTEXT_MESSAGE = "Insufficient context: I cannot construct a complete, grounded solution based only on the provided web snippets."
 
 # The MCP Extraction
 
@@ -17,6 +20,7 @@ def create_mcp_web_rag_prompt(question: str, search_results: List[Dict]) -> str:
     """
     Constructs an LLM prompt that adheres to Model Context Protocol principles:
     Strictly enforcing grounding, attribution, and refusal of ungrounded answers.
+    Page contents are deduplicated and packed into WEB_CONTEXT_TOKEN_BUDGET tokens.
     """
     # System/Role Instruction with MCP Guardrails
     system_instruction = (
@@ -29,13 +33,19 @@ def create_mcp_web_rag_prompt(question: str, search_results: List[Dict]) -> str:
     )
     
     # Format Context from Web Search (The Content)
+    packed = pack_passages(
+        question,
+        [result.get('content') or 'No content available.' for result in search_results],
+        WEB_CONTEXT_TOKEN_BUDGET,
+        label="web"
+    )
     context_sections = []
-    for i, result in enumerate(search_results):
+    for i, (result_index, content) in enumerate(zip(packed.indexes, packed.passages)):
         source_tag = f"[Source {i+1}]"
         context_sections.append(
             f"--- {source_tag} ---\n"
-            f"URL: {result.get('url', 'N/A')}\n"
-            f"Content: {result.get('content', 'No content available.')}\n"
+            f"URL: {search_results[result_index].get('url', 'N/A')}\n"
+            f"Content: {content}\n"
         )
     
     context_string = "\n\n".join(context_sections)
@@ -61,38 +71,107 @@ def WebSearchAgent_MCP(
 ) -> str:
     """
     Performs a web search and generates an MCP-compliant answer using an LLM.
+
+    Raises:
+        DependencyError: Tavily or Gemini failed, timed out or has an open circuit.
     """
-    print(f" Web Search Agent (MCP) executing search for: '{question[:50]}...'")
+    logger.info("Web Search Agent (MCP) searching", extra={"max_results": max_results})
 
     # Retrieval
-    try:
-        search_response = tavily_client.search(
+    with span("web_search"):
+        search_response = search_cache.search(
             query=question, 
             search_depth="advanced", 
             max_results=max_results
         )
-        search_results = search_response.get('results', [])
-        
-        if not search_results:
-            return "Insufficient context: I cannot construct a complete, grounded solution based only on the provided web snippets."
-
-    except Exception as e:
-        return f" Tavily Search Error: {e}"
+    search_results = search_response.get('results', [])
+    
+    if not search_results:
+        return INSUFFICIENT_CONTEXT_MESSAGE
 
     # Extraction & Synthesis (LLM Step)
     rag_prompt = create_mcp_web_rag_prompt(question, search_results)
     
-    print(f" Web Agent synthesizing & grounding answer from {len(search_results)} sources...")
+    logger.info("Web Agent synthesizing grounded answer", extra={"sources": len(search_results)})
     
-
-    try:
-        llm_response = llm_client.models.generate_content(
+    with span("llm_generation"):
+        llm_response = gemini_dependency.call_sync(lambda: get_genai_client().models.generate_content(
             model=LLM_MODEL,
             contents=[rag_prompt],
+        ))
+    
+    return llm_response.text
+
+
+async def _search_async(question: str, max_results: int) -> List[Dict]:
+    """
+    Runs the Tavily search with the async client. Returns the search results
+    (possibly empty); raises `DependencyError` when the search fails.
+    """
+    with span("web_search"):
+        search_response = await search_cache.search_async(
+            query=question, 
+            search_depth="advanced", 
+            max_results=max_results
         )
-        
-        return llm_response.text
+    return search_response.get('results', [])
+
+
+async def WebSearchAgent_MCP_Async(
+    question: str, 
+    max_results: int = 5
+) -> str:
+    """
+    Async variant of `WebSearchAgent_MCP`. Both the Tavily search and the Gemini
+    generation use non-blocking clients. Raises `DependencyError` like the
+    sync variant.
+    """
+    logger.info("Web Search Agent (MCP) searching", extra={"max_results": max_results})
+
+    # Retrieval
+    search_results = await _search_async(question, max_results)
+    if not search_results:
+        return INSUFFICIENT_CONTEXT_MESSAGE
+
+    # Extraction & Synthesis (LLM Step)
+    rag_prompt = await run_in_search_executor(create_mcp_web_rag_prompt, question, search_results)
     
-    except Exception as e:
-        return f" LLM Generation Error: {e}"
+    logger.info("Web Agent synthesizing grounded answer", extra={"sources": len(search_results)})
+
+    with span("llm_generation"):
+        llm_response = await gemini_dependency.call(lambda: get_genai_client().aio.models.generate_content(
+            model=LLM_MODEL,
+            contents=[rag_prompt],
+        ))
+    
+    return llm_response.text
+
 
+async def WebSearchAgent_MCP_Stream(
+    question: str, 
+    max_results: int = 5
+) -> AsyncIterator[str]:
+    """
+    Streaming variant of `WebSearchAgent_MCP`. The search completes first, then
+    the grounded answer is yielded chunk by chunk as Gemini generates it.
+    Failures raise `DependencyError`, before the first chunk or mid-stream.
+    """
+    logger.info("Web Search Agent (MCP) searching", extra={"max_results": max_results, "streaming": True})
+
+    search_results = await _search_async(question, max_results)
+    if not search_results:
+        yield INSUFFICIENT_CONTEXT_MESSAGE
+        return
+
+    rag_prompt = await run_in_search_executor(create_mcp_web_rag_prompt, question, search_results)
+
+    logger.info("Web Agent streaming grounded answer", extra={"sources": len(search_results)})
+
+    with span("llm_generation"):
+        stream = await gemini_dependency.call(lambda: get_genai_client().aio.models.generate_content_stream(
+            model=LLM_MODEL,
+            contents=[rag_prompt],
+        ))
+        async for chunk in gemini_dependency.iterate(stream):
+            if chunk.text:
+                yield chunk.text
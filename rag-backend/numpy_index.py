@@ -0,0 +1,365 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from telemetry import get_logger
+
+logger = get_logger("numpy_index")
+
+# CONFIGURATION
+
+NUMPY_INDEX_DIR = os.getenv("NUMPY_INDEX_DIR", "./numpy_index_math_jee")
+NUMPY_INDEX_MMAP = os.getenv("NUMPY_INDEX_MMAP", "1") == "1"
+RECONNECT_CHECK_INTERVAL = float(os.getenv("KB_RECONNECT_CHECK_INTERVAL", "5.0"))
+
+COSINE = "cosine"
+L2 = "l2"
+
+# On-disk layout of an exported index: meta.json names the current snapshot
+# directory, which holds the data files
+_EMBEDDINGS_FILE = "embeddings.npy"
+_OFFSETS_FILE = "offsets.npy"
+_DOCUMENTS_FILE = "documents.bin"
+_META_FILE = "meta.json"
+_SNAPSHOT_PREFIX = "snapshot-"
+# Superseded snapshots kept so a reader that has just read meta.json can still open its files
+_KEEP_SNAPSHOTS = 2
+
+
+class NumpyVectorIndex:
+    """
+    Exact in-memory vector index for small knowledge bases.
+
+    Embeddings live in one contiguous (n, d) float32 matrix; document texts are
+    concatenated into a single UTF-8 buffer addressed by an (n + 1) offsets
+    array. Both can be memory-mapped from disk. Queries are a single
+    matrix product followed by an `argpartition` top-k.
+
+    Distances follow Chroma's conventions so routing thresholds carry over:
+    `cosine` is 1 - cos(q, x) and `l2` is the squared Euclidean distance.
+
+    For `cosine` the rows are stored as unit vectors (normalized by
+    `from_documents`), so queries read the memory-mapped matrix directly and
+    pre-forked workers keep sharing its pages.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        documents: np.ndarray,
+        offsets: np.ndarray,
+        ids: Sequence[str],
+        metric: str = L2,
+    ):
+        if metric not in (COSINE, L2):
+            raise ValueError(f"Unsupported metric '{metric}'. Use '{COSINE}' or '{L2}'.")
+        if len(offsets) != len(embeddings) + 1:
+            raise ValueError("offsets must have one more entry than there are embeddings.")
+
+        self.embeddings = embeddings
+        self.documents = documents
+        self.offsets = offsets
+        self.ids = list(ids)
+        self.metric = metric
+
+        if metric == L2:
+            self._sq_norms = np.einsum("ij,ij->i", embeddings, embeddings, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    @property
+    def dimension(self) -> int:
+        return self.embeddings.shape[1]
+
+    @classmethod
+    def from_documents(
+        cls,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        embeddings: np.ndarray,
+        metric: str = L2,
+    ) -> "NumpyVectorIndex":
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if metric == COSINE:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        buffer, offsets = pack_documents(documents)
+        return cls(embeddings, buffer, offsets, ids, metric)
+
+    def document(self, i: int) -> str:
+        return unpack_document(self.documents, self.offsets, i)
+
+    # Search
+
+    def distances(self, query_vectors: np.ndarray) -> np.ndarray:
+        """Returns the (m, n) distance matrix between the queries and every document."""
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if self.metric == COSINE:
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.clip(norms, 1e-12, None)
+            return 1.0 - queries @ self.embeddings.T
+
+        q_sq = np.einsum("ij,ij->i", queries, queries)[:, np.newaxis]
+        dist = q_sq + self._sq_norms[np.newaxis, :] - 2.0 * (queries @ self.embeddings.T)
+        return np.maximum(dist, 0.0)
+
+    def search(self, query_vectors: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k for a batch of queries.
+
+        Returns:
+            (indices, distances), each of shape (m, min(k, n)), sorted by
+            increasing distance per row.
+        """
+        dist = self.distances(query_vectors)
+        k = min(k, dist.shape[1])
+        if k == 0:
+            empty = np.empty((dist.shape[0], 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+
+        if k < dist.shape[1]:
+            top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(dist.shape[1]), (dist.shape[0], 1))
+        top_dist = np.take_along_axis(dist, top, axis=1)
+        order = np.argsort(top_dist, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_dist, order, axis=1)
+
+    def query(self, query_vectors: np.ndarray, k: int = 5) -> List[List[Tuple[str, float]]]:
+        """Same result shape as `kb_search.search_by_vectors`: [(document, distance), ...] per query."""
+        indices, dists = self.search(query_vectors, k)
+        return [
+            [(self.document(int(i)), float(d)) for i, d in zip(row_i, row_d)]
+            for row_i, row_d in zip(indices, dists)
+        ]
+
+    # Persistence
+
+    def save(self, index_dir: str) -> None:
+        def write_files(data_dir: str) -> None:
+            np.save(os.path.join(data_dir, _EMBEDDINGS_FILE), self.embeddings)
+            save_documents(data_dir, self.documents, self.offsets)
+
+        meta = {"metric": self.metric, "ids": self.ids, "dimension": self.dimension}
+        write_snapshot(index_dir, meta, write_files)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = NUMPY_INDEX_MMAP) -> "NumpyVectorIndex":
+        meta, data_dir = read_snapshot_meta(index_dir)
+        embeddings = np.load(os.path.join(data_dir, _EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        documents, offsets = load_documents(data_dir, mmap)
+        if len(meta["ids"]) != len(embeddings) or len(offsets) != len(embeddings) + 1:
+            raise ValueError(f"Index files in {data_dir} do not match {_META_FILE}.")
+        return cls(embeddings, documents, offsets, meta["ids"], meta["metric"])
+
+# SNAPSHOT STORAGE (shared with lexical_index.py)
+
+def pack_documents(documents: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenates the texts into one UTF-8 buffer plus an (n + 1) offsets array."""
+    encoded = [doc.encode("utf-8") for doc in documents]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_document(documents: np.ndarray, offsets: np.ndarray, i: int) -> str:
+    return documents[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8")
+
+
+def save_documents(data_dir: str, documents: np.ndarray, offsets: np.ndarray) -> None:
+    np.save(os.path.join(data_dir, _OFFSETS_FILE), offsets)
+    documents.tofile(os.path.join(data_dir, _DOCUMENTS_FILE))
+
+
+def load_documents(data_dir: str, mmap: bool = NUMPY_INDEX_MMAP) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.load(os.path.join(data_dir, _OFFSETS_FILE))
+    doc_path = os.path.join(data_dir, _DOCUMENTS_FILE)
+    if mmap and os.path.getsize(doc_path) > 0:
+        documents = np.memmap(doc_path, dtype=np.uint8, mode="r")
+    else:
+        documents = np.fromfile(doc_path, dtype=np.uint8)
+    if len(offsets) and offsets[-1] != len(documents):
+        raise ValueError(f"{_DOCUMENTS_FILE} in {data_dir} does not match {_OFFSETS_FILE}.")
+    return documents, offsets
+
+
+def write_snapshot(index_dir: str, meta: Dict, write_files: Callable[[str], None]) -> None:
+    """
+    Publishes an export: `write_files` writes the data files into a new
+    snapshot directory, then meta.json is switched to it with an atomic
+    rename. Readers therefore never see a half-written export, and processes
+    that have the previous snapshot memory-mapped keep reading it undisturbed
+    (its files are never rewritten in place).
+    """
+    snapshot = f"{_SNAPSHOT_PREFIX}{time.time_ns()}-{os.getpid()}"
+    os.makedirs(os.path.join(index_dir, snapshot))
+    write_files(os.path.join(index_dir, snapshot))
+
+    tmp_path = os.path.join(index_dir, f"{_META_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(dict(meta, snapshot=snapshot), f)
+        f.flush()
+        os.fsync(f.fileno())
+    # The rename publishes the export; its mtime is what reloads watch
+    os.replace(tmp_path, os.path.join(index_dir, _META_FILE))
+    _prune_snapshots(index_dir)
+
+
+def read_snapshot_meta(index_dir: str) -> Tuple[Dict, str]:
+    """Returns the published meta.json and the directory holding its data files."""
+    with open(os.path.join(index_dir, _META_FILE)) as f:
+        meta = json.load(f)
+    # Exports written before snapshots existed keep their files next to meta.json
+    return meta, os.path.join(index_dir, meta.get("snapshot", ""))
+
+
+def _prune_snapshots(index_dir: str, keep: int = _KEEP_SNAPSHOTS) -> None:
+    """
+    Removes all but the newest `keep` snapshots. Unlinking files another
+    process still has memory-mapped is safe on POSIX; the pages stay valid
+    until that process unmaps them.
+    """
+    snapshots = sorted(
+        (name for name in os.listdir(index_dir) if name.startswith(_SNAPSHOT_PREFIX)),
+        key=lambda name: int(name[len(_SNAPSHOT_PREFIX):].split("-")[0]),
+    )
+    for name in snapshots[:-keep]:
+        shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+
+def index_exists(index_dir: str = NUMPY_INDEX_DIR) -> bool:
+    return os.path.exists(os.path.join(index_dir, _META_FILE))
+
+
+def export_from_chroma(collection, index_dir: str = NUMPY_INDEX_DIR) -> NumpyVectorIndex:
+    """
+    Exports every document and embedding from a Chroma collection into a
+    NumpyVectorIndex, keeping the collection's distance metric.
+    """
+    data = collection.get(include=["documents", "embeddings"])
+    metric = (collection.metadata or {}).get("hnsw:space", L2)
+    if metric not in (COSINE, L2):
+        raise ValueError(f"Collection uses unsupported metric '{metric}'.")
+
+    index = NumpyVectorIndex.from_documents(
+        data["ids"],
+        data["documents"],
+        np.asarray(data["embeddings"], dtype=np.float32),
+        metric,
+    )
+    index.save(index_dir)
+    print(f" Exported {len(index)} documents ({metric}) to {index_dir}")
+    return index
+
+
+class NumpyRetrievalService:
+    """
+    Drop-in alternative to `kb_search.RetrievalService` backed by an exported
+    NumpyVectorIndex. Reloads the index when the export on disk changes; if a
+    reload fails, the previously loaded index keeps serving.
+
+    The index is read-only and memory-mapped, so any number of worker
+    processes can open the same export, and an index opened before a
+    pre-fork server forks is shared by its workers copy-on-write.
+    """
+
+    index_cls = NumpyVectorIndex
+    load_hint = "Error loading NumPy index. Export it first with: python numpy_index.py export"
+
+    def __init__(
+        self,
+        index_dir: str = NUMPY_INDEX_DIR,
+        mmap: bool = NUMPY_INDEX_MMAP,
+        check_interval: float = RECONNECT_CHECK_INTERVAL,
+    ):
+        self.index_dir = index_dir
+        self.mmap = mmap
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._index = None
+        self._fingerprint: Optional[int] = None
+        self._last_check = 0.0
+
+    def _disk_fingerprint(self) -> Optional[int]:
+        try:
+            return os.stat(os.path.join(self.index_dir, _META_FILE)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self) -> None:
+        """Loads (or reloads) the index. Caller must hold the lock."""
+        fingerprint = self._disk_fingerprint()
+        self._last_check = time.monotonic()
+        try:
+            index = self.index_cls.load(self.index_dir, mmap=self.mmap)
+        except Exception as e:
+            # The fingerprint is left unchanged so the next check tries again
+            logger.error(self.load_hint, extra={
+                "index_dir": self.index_dir, "error": str(e), "serving_previous": self._index is not None,
+            })
+            return
+        self._index = index
+        self._fingerprint = fingerprint
+        logger.info("Retrieval service loaded index", extra={"index": self.index_cls.__name__, "documents": len(index)})
+
+    def start(self) -> None:
+        """Opens the index unless it is already open (e.g. preloaded before fork)."""
+        with self._lock:
+            if self._index is None:
+                self._load()
+
+    def close(self) -> None:
+        with self._lock:
+            self._index = None
+            self._fingerprint = None
+            self._last_check = 0.0
+            logger.info("Retrieval service closed")
+
+    def get_index(self):
+        """
+        Returns the loaded index, reloading it when the export on disk has
+        changed. A missing or broken export is retried once per
+        `check_interval`, not on every query.
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return self._index
+
+        with self._lock:
+            if now - self._last_check >= self.check_interval:
+                self._last_check = now
+                if self._index is None or self._disk_fingerprint() != self._fingerprint:
+                    self._load()
+            return self._index
+
+    def is_available(self) -> bool:
+        return self.get_index() is not None
+
+    def query(self, query_vectors: np.ndarray, k: int = 5) -> List[List[Tuple[str, float]]]:
+        index = self.get_index()
+        if index is None:
+            return [[] for _ in range(len(query_vectors))]
+        return index.query(query_vectors, k)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NumPy vector index utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="Export the Chroma KB collection to a NumPy index.")
+    export_cmd.add_argument("--output-dir", default=NUMPY_INDEX_DIR)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from kb_search import COLLECTION_NAME, get_chroma_collection
+
+        collection = get_chroma_collection(COLLECTION_NAME)
+        if collection is None:
+            raise SystemExit(1)
+        export_from_chroma(collection, args.output_dir)
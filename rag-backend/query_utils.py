@@ -0,0 +1,33 @@
+import re
+from typing import Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = " ?.!"
+# Numbers, LaTeX commands, elementary function names and operators
+_MATH_TOKEN = re.compile(
+    r"\d+(?:\.\d+)?"
+    r"|\\[A-Za-z]+"
+    r"|\b(?:arcsin|arccos|arctan|sinh|cosh|tanh|sin|cos|tan|cot|sec|csc|log|ln|exp|sqrt)\b"
+    r"|[-+*/^=<>!|√∫∑∏π]",
+    re.IGNORECASE,
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a user query for cache keys: lowercases, collapses whitespace and
+    strips trailing punctuation. LaTeX and symbols are left untouched.
+    """
+    return _WHITESPACE.sub(" ", query.strip().lower()).rstrip(_TRAILING_PUNCTUATION)
+
+
+def math_signature(query: str) -> Tuple[str, ...]:
+    """
+    The numbers, LaTeX commands, function names and operators of a query, in
+    order. Questions whose embeddings are near-identical but whose signatures
+    differ ("x^2-5x+6=0" and "x^2-5x+7=0") are different problems.
+    """
+    return tuple(
+        token if token.startswith("\\") else token.lower()
+        for token in _MATH_TOKEN.findall(query)
+    )
@@ -0,0 +1,339 @@
+"""
+Deadlines, timeouts, retries and circuit breakers for the Gemini and Tavily calls.
+
+Every gateway request runs under a deadline (`REQUEST_DEADLINE_SECONDS`)
+held in a contextvar, so it follows the request into executor threads and
+coalesced single-flight tasks. Each upstream call goes through a
+`Dependency`, which bounds one attempt by its own timeout and by whatever is
+left of the deadline, retries transient failures with full-jitter backoff,
+and fails fast while its circuit breaker is open.
+
+Failures surface as `DependencyError` (503) or `DependencyTimeout` (504)
+instead of error strings, and the gateway decides what to serve instead.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+from telemetry import dependency_calls, get_logger
+
+logger = get_logger("resilience")
+
+T = TypeVar("T")
+
+# CONFIGURATION
+
+# End-to-end budget of one gateway request; 0 disables the deadline
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+# Held back from the web leg so the KB answer can still be generated if it fails
+KB_FALLBACK_RESERVE_SECONDS = float(os.getenv("KB_FALLBACK_RESERVE_SECONDS", "8"))
+
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "20"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "1"))
+TAVILY_TIMEOUT_SECONDS = float(os.getenv("TAVILY_TIMEOUT_SECONDS", "8"))
+TAVILY_MAX_RETRIES = int(os.getenv("TAVILY_MAX_RETRIES", "2"))
+
+RETRY_BACKOFF_BASE_SECONDS = float(os.getenv("RETRY_BACKOFF_BASE_SECONDS", "0.2"))
+RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("RETRY_BACKOFF_MAX_SECONDS", "2.0"))
+
+# Consecutive failures that open a breaker, and how long it stays open before a probe
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Threads that run blocking client calls so the caller can stop waiting at the timeout
+DEPENDENCY_SYNC_WORKERS = int(os.getenv("DEPENDENCY_SYNC_WORKERS", "32"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# ERRORS
+
+class DependencyError(Exception):
+    """An upstream call failed, was refused by an open circuit, or had no deadline left."""
+
+    status = "503_SERVICE_UNAVAILABLE"
+
+    def __init__(self, dependency: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{dependency}: {message}")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class DependencyTimeout(DependencyError):
+    """An upstream call did not answer within its timeout or the request deadline."""
+
+    status = "504_GATEWAY_TIMEOUT"
+
+
+class CircuitOpenError(DependencyError):
+    """The dependency's breaker is open; the call was not attempted."""
+
+# DEADLINES
+
+_deadline_var: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Runs the block under a deadline `seconds` from now. Nested deadlines can
+    only shorten the current one. None or a non-positive value leaves the
+    current deadline unchanged.
+    """
+    if seconds is None or seconds <= 0:
+        yield
+        return
+    current = _deadline_var.get()
+    at = time.monotonic() + seconds
+    token = _deadline_var.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        try:
+            _deadline_var.reset(token)
+        except ValueError:
+            # An async generator finalized from another context cannot reset its token
+            _deadline_var.set(current)
+
+
+@contextmanager
+def reserve(seconds: float) -> Iterator[None]:
+    """Ends the block's deadline `seconds` early, keeping that time for a fallback."""
+    left = remaining()
+    with deadline(left - seconds if left is not None and left > seconds else None):
+        yield
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is no deadline."""
+    at = _deadline_var.get()
+    return None if at is None else at - time.monotonic()
+
+# CIRCUIT BREAKER
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    fail fast. Once `reset_seconds` have passed, one probe call is let through
+    (half-open): success closes the circuit, failure opens it again. Guarded by
+    a lock because sync calls run on worker threads.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at < self.reset_seconds:
+                self.rejected += 1
+                return False
+            # One probe per reset period; concurrent callers keep failing fast
+            self.state = HALF_OPEN
+            self._opened_at = now
+            return True
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("Circuit closed", extra={"dependency": self.name})
+            self.state = CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                    logger.warning("Circuit opened", extra={
+                        "dependency": self.name,
+                        "consecutive_failures": self.consecutive_failures,
+                    })
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "open": self.state == OPEN,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
+
+# DEPENDENCIES
+
+# Distinct classes before Python 3.11
+_TIMEOUT_ERRORS = (TimeoutError, asyncio.TimeoutError, concurrent.futures.TimeoutError)
+
+_SYNC_EXECUTOR = ThreadPoolExecutor(max_workers=DEPENDENCY_SYNC_WORKERS, thread_name_prefix="dependency")
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Client errors (4xx other than 408/429) are not retried and do not count against the breaker."""
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return not (isinstance(code, int) and 400 <= code < 500 and code not in (408, 429))
+
+
+class Dependency:
+    """
+    Timeout, retry and circuit-breaker policy for one upstream service.
+
+    `call` (async) and `call_sync` make up to `max_retries + 1` attempts. Each
+    attempt is bounded by `timeout` and by the request deadline; a retry only
+    starts if its jittered backoff fits in what is left of the deadline.
+    """
+
+    def __init__(self, name: str, timeout: float, max_retries: int, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker(name)
+
+    def _admit(self) -> float:
+        """Checks the breaker and the deadline; returns the timeout for the next attempt."""
+        if not self.breaker.allow():
+            dependency_calls.inc(dependency=self.name, outcome="rejected")
+            raise CircuitOpenError(self.name, "circuit open, failing fast", retry_after=self.breaker.retry_after())
+        left = remaining()
+        if left is None:
+            return self.timeout
+        if left <= 0:
+            dependency_calls.inc(dependency=self.name, outcome="deadline")
+            raise DependencyTimeout(self.name, "request deadline exceeded")
+        return min(self.timeout, left)
+
+    def _succeeded(self) -> None:
+        self.breaker.record_success()
+        dependency_calls.inc(dependency=self.name, outcome="ok")
+
+    def _failed(self, error: Exception, timeout: float) -> DependencyError:
+        """Records a failed attempt and returns the error to raise if it is not retried."""
+        if isinstance(error, _TIMEOUT_ERRORS):
+            dependency_calls.inc(dependency=self.name, outcome="timeout")
+            self.breaker.record_failure()
+            failure = DependencyTimeout(self.name, f"no response within {timeout:.1f}s")
+        else:
+            dependency_calls.inc(dependency=self.name, outcome="error")
+            if _is_retryable(error):
+                self.breaker.record_failure()
+            failure = DependencyError(self.name, f"{type(error).__name__}: {error}")
+        failure.__cause__ = error
+        return failure
+
+    def _backoff(self, attempt: int, error: Exception) -> Optional[float]:
+        """Full-jitter delay before the next attempt, or None when it should not be retried."""
+        if attempt >= self.max_retries or not _is_retryable(error):
+            return None
+        delay = random.uniform(0, min(RETRY_BACKOFF_MAX_SECONDS, RETRY_BACKOFF_BASE_SECONDS * 2 ** attempt))
+        left = remaining()
+        if left is not None and left <= delay:
+            return None
+        logger.info("Retrying dependency call", extra={
+            "dependency": self.name, "attempt": attempt + 1, "delay": round(delay, 3), "error": str(error),
+        })
+        return delay
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Awaits `fn()` under the policy. `fn` must create a fresh awaitable per attempt."""
+        attempt = 0
+        while True:
+            timeout = self._admit()
+            try:
+                result = await asyncio.wait_for(fn(), timeout)
+            except Exception as e:
+                failure = self._failed(e, timeout)
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise failure
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self._succeeded()
+            return result
+
+    def call_sync(self, fn: Callable[[], T]) -> T:
+        """
+        Blocking variant of `call`. The attempt runs on a dependency thread so
+        the caller stops waiting at the timeout; the abandoned thread is freed
+        when the client's own HTTP timeout fires.
+        """
+        attempt = 0
+        while True:
+            timeout = self._admit()
+            future = _SYNC_EXECUTOR.submit(contextvars.copy_context().run, fn)
+            try:
+                result = future.result(timeout)
+            except Exception as e:
+                future.cancel()
+                failure = self._failed(e, timeout)
+                delay = self._backoff(attempt, e)
+                if delay is None:
+                    raise failure
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self._succeeded()
+            return result
+
+    async def iterate(self, chunks: AsyncIterator[T]) -> AsyncIterator[T]:
+        """
+        Yields from a streaming response, bounding the wait for each chunk by
+        the timeout and the deadline. Never retried, since earlier chunks have
+        already been delivered. The breaker records a success once the stream
+        is exhausted; stalls and transient errors count as failures, as in `call`.
+        """
+        iterator = chunks.__aiter__()
+        while True:
+            left = remaining()
+            timeout = self.timeout if left is None else min(self.timeout, max(left, 0.0))
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+            except StopAsyncIteration:
+                # Opening the stream already counted the call; only the breaker hears the outcome
+                self.breaker.record_success()
+                return
+            except Exception as e:
+                raise self._failed(e, timeout)
+            yield chunk
+
+    def stats(self) -> Dict[str, object]:
+        stats = self.breaker.stats()
+        stats["timeout_seconds"] = self.timeout
+        stats["max_retries"] = self.max_retries
+        return stats
+
+
+# Process-wide policies shared by every agent (and by the sync and async paths)
+gemini_dependency = Dependency("gemini", GEMINI_TIMEOUT_SECONDS, GEMINI_MAX_RETRIES)
+tavily_dependency = Dependency("tavily", TAVILY_TIMEOUT_SECONDS, TAVILY_MAX_RETRIES)
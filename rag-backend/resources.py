@@ -0,0 +1,203 @@
+import gc
+import os
+import threading
+import time
+from typing import Callable, Dict, Generic, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from telemetry import get_logger
+
+logger = get_logger("resources")
+
+T = TypeVar("T")
+
+# Providers behind the LLM and search clients: the real APIs, or the offline
+# fakes in fake_providers.py (for load tests and local development)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+SEARCH_PROVIDER = os.getenv("SEARCH_PROVIDER", "tavily")
+LLM_PROVIDERS = ("gemini", "fake")
+SEARCH_PROVIDERS = ("tavily", "fake")
+
+
+class LazyResource(Generic[T]):
+    """
+    A process-wide singleton that is built on first use.
+
+    Construction is guarded by a lock (double-checked), so concurrent first
+    callers wait for one shared instance instead of each building their own.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self._factory = factory
+        self._instance: Optional[T] = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> T:
+        instance = self._instance
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            if self._instance is None:
+                start = time.perf_counter()
+                self._instance = self._factory()
+                self.load_seconds = time.perf_counter() - start
+                logger.info("Loaded resource", extra={"resource": self.name, "seconds": round(self.load_seconds, 3)})
+            return self._instance
+
+    def reset(self) -> None:
+        with self._lock:
+            self._instance = None
+            self.load_seconds = None
+
+
+# Factories (heavy imports happen here, not at module import)
+
+def _load_embedding_model():
+    from embedding_backends import load_embedding_backend
+    return load_embedding_backend()
+
+
+def _check_provider(kind: str, name: str, choices) -> None:
+    if name not in choices:
+        raise ValueError(f"Unknown {kind} '{name}'. Choose one of: {', '.join(choices)}")
+
+
+def _load_genai_client():
+    _check_provider("LLM_PROVIDER", LLM_PROVIDER, LLM_PROVIDERS)
+    if LLM_PROVIDER == "fake":
+        from fake_providers import FakeGenAIClient
+        return FakeGenAIClient()
+    from google import genai
+    from google.genai import types
+    from resilience import GEMINI_TIMEOUT_SECONDS
+    # Transport-level backstop; the per-call policy lives in resilience.py
+    return genai.Client(http_options=types.HttpOptions(timeout=int(GEMINI_TIMEOUT_SECONDS * 1000)))
+
+
+def _load_tavily_client():
+    _check_provider("SEARCH_PROVIDER", SEARCH_PROVIDER, SEARCH_PROVIDERS)
+    if SEARCH_PROVIDER == "fake":
+        from fake_providers import FakeTavilyClient
+        return FakeTavilyClient()
+    from tavily import TavilyClient
+    return TavilyClient()
+
+
+def _load_async_tavily_client():
+    _check_provider("SEARCH_PROVIDER", SEARCH_PROVIDER, SEARCH_PROVIDERS)
+    if SEARCH_PROVIDER == "fake":
+        from fake_providers import FakeAsyncTavilyClient
+        return FakeAsyncTavilyClient()
+    from tavily import AsyncTavilyClient
+    return AsyncTavilyClient()
+
+
+embedding_model = LazyResource("embedding model", _load_embedding_model)
+genai_client = LazyResource("Gemini client", _load_genai_client)
+tavily_client = LazyResource("Tavily client", _load_tavily_client)
+async_tavily_client = LazyResource("async Tavily client", _load_async_tavily_client)
+
+ALL_RESOURCES = [embedding_model, genai_client, tavily_client, async_tavily_client]
+
+
+def get_embedding_model():
+    return embedding_model.get()
+
+
+def get_genai_client():
+    return genai_client.get()
+
+
+def get_tavily_client():
+    return tavily_client.get()
+
+
+def get_async_tavily_client():
+    return async_tavily_client.get()
+
+
+# WARM-UP AND READINESS
+
+_ready = threading.Event()
+_warm_up_error: Optional[str] = None
+
+
+def warm_up() -> None:
+    """
+    Loads every lazy resource, opens the retrieval services, runs one encode and
+    loads the few-shot example index so the first real request does not pay for
+    model initialization. Marks the process ready on success.
+    """
+    global _warm_up_error
+    from kb_search import HYBRID_SEARCH, lexical_service, retrieval_service
+    from example_index import example_index
+
+    try:
+        for resource in ALL_RESOURCES:
+            resource.get()
+        retrieval_service.start()
+        if HYBRID_SEARCH:
+            lexical_service.start()
+        get_embedding_model().encode(["warm-up"])
+        example_index.refresh(force=True)
+        _warm_up_error = None
+        _ready.set()
+        logger.info("Warm-up complete. Ready to serve traffic.")
+    except Exception as e:
+        _warm_up_error = str(e)
+        logger.error("Warm-up failed", extra={"error": str(e)})
+
+
+def preload() -> None:
+    """
+    Loads what pre-forked workers can share, in the parent before it forks:
+    the embedding model's weights and the read-only NumPy KB and lexical
+    indexes. Pages that are never written afterwards stay shared
+    copy-on-write, and `gc.freeze()` keeps the collector from touching (and so copying) the
+    objects created up to this point.
+
+    No inference runs here: torch's OpenMP pool and ONNX Runtime's session
+    threads do not survive fork, so the ONNX backend is left to the workers
+    and the first encode stays in each worker's `warm_up`. HTTP clients and
+    sqlite connections are per worker too.
+    """
+    from embedding_backends import EMBEDDING_BACKEND
+    from kb_search import HYBRID_SEARCH, VECTOR_BACKEND, lexical_service, retrieval_service
+
+    if EMBEDDING_BACKEND != "onnx":
+        embedding_model.get()
+    if VECTOR_BACKEND == "numpy":
+        retrieval_service.start()
+    if HYBRID_SEARCH:
+        lexical_service.start()
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded shared resources", extra={
+        "embedding_backend": EMBEDDING_BACKEND, "vector_backend": VECTOR_BACKEND, "frozen_objects": gc.get_freeze_count(),
+    })
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def readiness_report() -> Dict[str, object]:
+    return {
+        "ready": is_ready(),
+        "error": _warm_up_error,
+        "providers": {"llm": LLM_PROVIDER, "search": SEARCH_PROVIDER},
+        "resources": {
+            r.name: {"loaded": r.loaded, "load_seconds": r.load_seconds}
+            for r in ALL_RESOURCES
+        },
+    }
@@ -1,10 +1,106 @@
-from typing import List, Tuple, Dict
+import json
+import os
+import re
+from typing import List, Tuple, Dict, Optional
+
+from telemetry import get_logger
+
+logger = get_logger("router")
 
 KB_RESPONSE = "KB_RESPONSE"
 WEB_SEARCH = "WEB_SEARCH"
 
+# Default top-distance threshold: closer KB hits are answered from the KB
 HIGH_CONFIDENCE_THRESHOLD = 0.45
 
+# A query whose best BM25 hit covers at least this share of the query's idf
+# mass (see lexical_index.py) is answered from the KB whatever its vector
+# distance. BM25 scores are not distances, so this is a separate threshold;
+# above 1 disables the lexical route.
+LEXICAL_ROUTE_SCORE = float(os.getenv("LEXICAL_ROUTE_SCORE", "0.8"))
+
+# Which signal sent a query to the KB, as recorded in the routing log
+VECTOR_SIGNAL = "vector"
+LEXICAL_SIGNAL = "lexical"
+
+# Per-level / per-topic thresholds calibrated offline by calibrate_router.py,
+# read once at startup
+ROUTER_CONFIG_PATH = os.getenv("ROUTER_CONFIG_PATH", "./router_config.json")
+
+# Query topics for per-topic thresholds, named after the KB document topics.
+# A keyword matches as a word prefix ("derivative" matches "derivatives").
+TOPIC_KEYWORDS = {
+    "differential_calculus": ["derivative", "differentia", "limit", "continu", "tangent", "maxima", "minima", "rolle", "mean value"],
+    "integral_calculus": ["integra", "antiderivative", "area under", "definite", "indefinite"],
+    "coordinate_geometry": ["ellipse", "parabola", "hyperbola", "circle", "locus", "coordinate", "straight line", "slope", "eccentricity"],
+    "complex_numbers_and_quadratics": ["complex", "modulus", "argument", "imaginary", "quadratic", "root", "discriminant"],
+    "sequences_and_algebra": ["sequence", "series", "progression", "sum", "logarithm", "binomial", "polynomial"],
+    "probability": ["probabilit", "bayes", "permutation", "combination", "random", "expect", "statistic"],
+}
+GENERAL_TOPIC = "general"
+ANY = "*"
+
+# Hedging: when the top KB distance is within HEDGE_BAND of the threshold, the
+# gateway runs the KB and Web agents in parallel and keeps one answer.
+# 0 disables hedging.
+HEDGE_BAND = float(os.getenv("HEDGE_BAND", "0.0"))
+
+# prefer_kb: keep the KB answer unless it is unusable, then wait for the web answer.
+# first_wins: keep whichever usable answer arrives first.
+HEDGE_PREFER_KB = "prefer_kb"
+HEDGE_FIRST_WINS = "first_wins"
+HEDGE_POLICY = os.getenv("HEDGE_POLICY", HEDGE_PREFER_KB)
+
+_TOPIC_PATTERNS = {
+    topic: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in keywords) + r")", re.IGNORECASE)
+    for topic, keywords in TOPIC_KEYWORDS.items()
+}
+
+
+def query_topic(question: str) -> str:
+    """The topic with the most keyword matches in the question; ties go to the first listed."""
+    best, best_count = GENERAL_TOPIC, 0
+    for topic, pattern in _TOPIC_PATTERNS.items():
+        count = len(pattern.findall(question))
+        if count > best_count:
+            best, best_count = topic, count
+    return best
+
+
+def load_route_thresholds(path: str = ROUTER_CONFIG_PATH) -> Dict[str, float]:
+    """
+    Reads calibrated thresholds keyed "level/topic", where either part may be
+    "*". A missing or unreadable config leaves every route on
+    HIGH_CONFIDENCE_THRESHOLD.
+    """
+    try:
+        with open(path) as f:
+            config = json.load(f)
+        thresholds = {str(key): float(value) for key, value in config["thresholds"].items()}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.warning("Ignoring unreadable router config", extra={"path": path, "error": str(e)})
+        return {}
+    logger.info("Loaded router config", extra={"path": path, "thresholds": len(thresholds)})
+    return thresholds
+
+
+ROUTE_THRESHOLDS = load_route_thresholds()
+
+
+def route_threshold(level: str, topic: str) -> float:
+    """Most specific calibrated threshold: level/topic, level/*, */topic, */*, then the default."""
+    for key in (f"{level}/{topic}", f"{level}/{ANY}", f"{ANY}/{topic}", f"{ANY}/{ANY}"):
+        if key in ROUTE_THRESHOLDS:
+            return ROUTE_THRESHOLDS[key]
+    return HIGH_CONFIDENCE_THRESHOLD
+
+
+def lexical_route(lexical_score: Optional[float]) -> bool:
+    """True when the best lexical hit alone is strong enough for the KB route."""
+    return lexical_score is not None and lexical_score >= LEXICAL_ROUTE_SCORE
+
 
 def RouterAgent(
     question: str, 
@@ -31,7 +127,8 @@ def RouterAgent(
     
     # Check Confidence of the Top Result
     if search_results:
-        top_document, top_distance = search_results[0]
+        # Hybrid results are ordered by fused rank, so take the closest hit
+        top_document, top_distance = min(search_results, key=lambda hit: hit[1])
         
         print(f"   - Top result distance: {top_distance:.4f} (Threshold: {HIGH_CONFIDENCE_THRESHOLD})")
         
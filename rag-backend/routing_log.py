@@ -0,0 +1,172 @@
+"""
+Append-only log of routing decisions and human feedback, the input of
+calibrate_router.py.
+
+The gateway records one `decision` line per freshly routed query (cache hits
+are not routed) with its level, topic, closest vector distance, best lexical
+(BM25 coverage) score, threshold, the router's route and the signal that chose
+the KB route, and the mode that finally answered (after hedging or the
+web-to-KB fallback). The two scores are on different scales and are logged
+separately. `/api/feedback` records a `feedback` line with the assessment.
+Both carry the request id, so feedback can be matched with the decision it
+rates.
+
+Callers only enqueue lines; a background writer thread appends them, so the
+event loop never waits on the file. Each line is written with a single
+O_APPEND write, so worker processes can share one file without interleaving
+lines.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from query_utils import normalize_query
+from telemetry import get_logger, request_id_var
+
+logger = get_logger("routing_log")
+
+# CONFIGURATION
+
+# Empty disables the log
+ROUTING_LOG_PATH = os.getenv("ROUTING_LOG_PATH", "./routing_log.jsonl")
+# Past this size the log is rotated to <path>.1 (replacing the previous one)
+ROUTING_LOG_MAX_BYTES = int(os.getenv("ROUTING_LOG_MAX_BYTES", str(100 * 1024 * 1024)))
+# The size is checked once every this many lines
+_ROTATE_CHECK_EVERY = 1000
+
+DECISION = "decision"
+FEEDBACK = "feedback"
+
+
+@dataclass
+class RoutingDecision:
+    """What the router saw and chose for one query, logged once the query is answered."""
+    query: str
+    level: str
+    topic: str
+    vector_distance: Optional[float]
+    lexical_score: Optional[float]
+    threshold: float
+    route: str
+    signal: Optional[str] = None
+    request_id: Optional[str] = None
+
+
+class RoutingLog:
+    """JSON lines appended to `path` by a background writer; never raises into the request path."""
+
+    def __init__(self, path: str = ROUTING_LOG_PATH, max_bytes: int = ROUTING_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writes = 0
+        self.written = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _append(self, entry: Dict) -> None:
+        """Queues a line for the writer thread, starting it on first use."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._drain, name="routing-log", daemon=True)
+                self._writer.start()
+        self._queue.put(entry)
+
+    def _drain(self) -> None:
+        while True:
+            entry = self._queue.get()
+            try:
+                if entry is None:
+                    return
+                self._write(entry)
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Blocks until every queued line has been written."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        """Writes the queued lines and stops the writer thread."""
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None and writer.is_alive():
+            self._queue.put(None)
+            writer.join()
+
+    def _reset_after_fork(self) -> None:
+        """The writer thread does not survive fork; a forked worker starts its own on first use."""
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+
+    def _write(self, entry: Dict) -> None:
+        line = (json.dumps(entry, default=str) + "\n").encode("utf-8")
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+            with self._lock:
+                self.written += 1
+                self._writes += 1
+                check = self._writes % _ROTATE_CHECK_EVERY == 0
+            if check and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, f"{self.path}.1")
+                logger.info("Rotated routing log", extra={"path": self.path})
+        except OSError as e:
+            with self._lock:
+                self.errors += 1
+            logger.warning("Could not write routing log", extra={"path": self.path, "error": str(e)})
+
+    def record_decision(self, decision: RoutingDecision, mode: str) -> None:
+        """Logs a routing decision with `mode`, the agent that finally answered (or failed)."""
+        self._append({
+            "type": DECISION,
+            "ts": round(time.time(), 3),
+            "request_id": decision.request_id or request_id_var.get(),
+            "query": normalize_query(decision.query),
+            "level": decision.level,
+            "topic": decision.topic,
+            "vector_distance": None if decision.vector_distance is None else round(float(decision.vector_distance), 5),
+            "lexical_score": None if decision.lexical_score is None else round(float(decision.lexical_score), 5),
+            "threshold": decision.threshold,
+            "route": decision.route,
+            "signal": decision.signal,
+            "mode": mode,
+        })
+
+    def record_feedback(self, feedback: Dict) -> None:
+        self._append({
+            "type": FEEDBACK,
+            "ts": round(time.time(), 3),
+            "request_id": feedback.get("request_id"),
+            "query": normalize_query(feedback.get("query", "")),
+            "assessment": feedback.get("assessment"),
+            "route_mode": feedback.get("route_mode"),
+            "confidence": feedback.get("confidence_score"),
+        })
+
+    def stats(self) -> Dict[str, int]:
+        return {"written": self.written, "errors": self.errors}
+
+
+# Process-wide log shared by the gateway and the API
+routing_log = RoutingLog()
+atexit.register(routing_log.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=routing_log._reset_after_fork)
@@ -0,0 +1,202 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+from query_utils import normalize_query
+from resilience import tavily_dependency
+from resources import get_async_tavily_client, get_tavily_client
+from telemetry import get_logger
+
+logger = get_logger("search_cache")
+
+# CONFIGURATION
+
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "./search_cache.sqlite3")
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(24 * 3600)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "20000"))
+# Eviction runs once every this many writes rather than on every write
+EVICTION_INTERVAL = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS search_cache_last_access ON search_cache(last_access);
+"""
+
+
+class SearchCache:
+    """
+    On-disk TTL cache for Tavily search responses.
+
+    Backed by a sqlite file in WAL mode, so every uvicorn worker on the host
+    reads and writes the same cache. Entries are keyed on the normalized query,
+    search depth and `max_results`, expire after `ttl_seconds`, and the least
+    recently used entries are evicted once the table exceeds `max_entries`.
+    """
+
+    def __init__(
+        self,
+        path: str = SEARCH_CACHE_PATH,
+        ttl_seconds: float = SEARCH_CACHE_TTL_SECONDS,
+        max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite connections are not shared across threads."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(query: str, search_depth: str, max_results: int) -> str:
+        raw = json.dumps([normalize_query(query), search_depth, max_results])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _record_error(self, operation: str, error: sqlite3.Error) -> None:
+        with self._lock:
+            self.errors += 1
+        logger.warning("Search cache unavailable", extra={"operation": operation, "error": str(error)})
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Returns the cached response, or None on a miss. sqlite errors (e.g.
+        "database is locked" while other workers write) count as a miss.
+        """
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT response FROM search_cache WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._record_error("get", e)
+            row = None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        try:
+            with conn:
+                conn.execute("UPDATE search_cache SET last_access = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            # Only the LRU order is stale; the hit is still served
+            self._record_error("touch", e)
+        return json.loads(row[0])
+
+    def put(self, key: str, response: Dict) -> None:
+        """Stores a response. A failed write is logged and skipped; it never fails the request."""
+        now = time.time()
+        try:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, response, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(response), now, now),
+                )
+        except sqlite3.Error as e:
+            self._record_error("put", e)
+            return
+
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % EVICTION_INTERVAL == 0
+        if should_evict:
+            try:
+                self.evict()
+            except sqlite3.Error as e:
+                self._record_error("evict", e)
+
+    def evict(self) -> int:
+        """Drops expired entries, then the least recently used ones beyond `max_entries`."""
+        conn = self._conn()
+        with conn:
+            expired = conn.execute(
+                "DELETE FROM search_cache WHERE created_at <= ?",
+                (time.time() - self.ttl_seconds,),
+            ).rowcount
+            overflow = conn.execute(
+                "DELETE FROM search_cache WHERE key IN ("
+                " SELECT key FROM search_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        return expired + overflow
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            entries = self._conn().execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        except sqlite3.Error as e:
+            self._record_error("stats", e)
+            entries = -1
+        with self._lock:
+            return {"entries": entries, "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    # Cached Tavily search
+
+    def search(self, query: str, search_depth: str = "advanced", max_results: int = 5) -> Dict:
+        """
+        `TavilyClient.search` with the cache in front. Misses go through the
+        Tavily timeout/retry/breaker policy and raise `DependencyError` on
+        failure. Failed searches are not cached.
+        """
+        key = self.make_key(query, search_depth, max_results)
+        cached = self.get(key)
+        if cached is not None:
+            logger.debug("Web search served from the search cache")
+            return cached
+
+        response = tavily_dependency.call_sync(lambda: get_tavily_client().search(
+            query=query,
+            search_depth=search_depth,
+            max_results=max_results
+        ))
+        if response.get('results'):
+            self.put(key, response)
+        return response
+
+    async def search_async(self, query: str, search_depth: str = "advanced", max_results: int = 5) -> Dict:
+        """Async variant of `search`; sqlite access runs off the event loop."""
+        key = self.make_key(query, search_depth, max_results)
+        cached = await asyncio.to_thread(self.get, key)
+        if cached is not None:
+            logger.debug("Web search served from the search cache")
+            return cached
+
+        response = await tavily_dependency.call(lambda: get_async_tavily_client().search(
+            query=query,
+            search_depth=search_depth,
+            max_results=max_results
+        ))
+        if response.get('results'):
+            await asyncio.to_thread(self.put, key, response)
+        return response
+
+
+# Process-wide search cache used by the web agents
+search_cache = SearchCache()
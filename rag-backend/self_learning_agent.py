@@ -1,32 +1,26 @@
-import os
 import json
-from google import genai
 from typing import List, Dict, Tuple
-from dotenv import load_dotenv
+from resources import get_genai_client
+from resilience import gemini_dependency
+from example_store import example_store
+from telemetry import get_logger
 
-load_dotenv() 
-try:
-    client = genai.Client()
-except Exception:
-    print("WARNING: Gemini client initialization failed. Check GEMINI_API_KEY.")
+logger = get_logger("refinement")
     
 # CONFIGURATION
 
+# Legacy whole-file store; migrate it with `python example_store.py import`
 REFINED_EXAMPLES_FILE = "optimized_examples.json"
 
 # STORAGE AND RETRIEVAL
 
 def load_refined_examples() -> List[Dict]:
     """Loads the persistent store of human-validated examples."""
-    if os.path.exists(REFINED_EXAMPLES_FILE):
-        with open(REFINED_EXAMPLES_FILE, 'r') as f:
-            return json.load(f)
-    return []
+    return [example for _, example in example_store.iter_examples()]
 
-def save_refined_examples(examples: List[Dict]):
-    """Saves the current list of refined examples."""
-    with open(REFINED_EXAMPLES_FILE, 'w') as f:
-        json.dump(examples, f, indent=4)
+def save_refined_example(example: Dict) -> int:
+    """Appends one refined example to the store (constant cost, safe under concurrency)."""
+    return example_store.append(example)
 
 # THE REFINEMENT LOGIC
 
@@ -65,24 +59,107 @@ def run_refinement_agent(feedback_item: Dict):
     }}
     """
     
-    print(" Refinement Agent: Analyzing human correction...")
+    logger.info("Refinement Agent analyzing human correction")
     
     try:
-        response = client.models.generate_content(
+        # Timeout, retries and circuit breaker in resilience.py
+        response = gemini_dependency.call_sync(lambda: get_genai_client().models.generate_content(
             model='gemini-2.5-flash',
             contents=[refinement_prompt]
-        )
+        ))
         
         refined_example = json.loads(response.text.strip())
         
-        examples = load_refined_examples()
-        examples.append(refined_example)
-        save_refined_examples(examples)
+        save_refined_example(refined_example)
         
-        print(f" Refinement successful. Added new example for query: {query[:30]}...")
+        logger.info("Refinement successful, added new example")
         
     except json.JSONDecodeError:
-        print(" Refinement Agent failed to parse LLM output into JSON.")
+        logger.warning("Refinement Agent failed to parse LLM output into JSON")
     except Exception as e:
-        print(f" Refinement Agent failed: {e}")
+        logger.error("Refinement Agent failed", extra={"error": str(e)})
 
+
+# MICRO-BATCHED REFINEMENT
+
+def is_refinable(feedback_item: Dict) -> bool:
+    """Only negative feedback that carries a human correction is turned into an example."""
+    return (
+        feedback_item.get('assessment') in ['INCORRECT', 'COMPLEX']
+        and bool(feedback_item.get('correction_text'))
+    )
+
+def _strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text.strip()
+
+def run_refinement_batch(feedback_items: List[Dict]) -> List[Dict]:
+    """
+    Converts several corrections into few-shot examples with one LLM call.
+
+    The prompt lists the corrections in order and asks for a JSON array with
+    one {"question", "ideal_answer"} object per correction. Raises on an LLM
+    error or a malformed/short array so the caller can retry the whole batch.
+
+    Returns:
+        The refined examples that were appended to the example store.
+    """
+    items = [item for item in feedback_items if is_refinable(item)]
+    if not items:
+        return []
+
+    corrections = "\n".join(
+        f"""
+    [{i}]
+    Original Query: {item['query']}
+    Human Correction (Gold Standard): {item['correction_text']}"""
+        for i, item in enumerate(items, start=1)
+    )
+
+    refinement_prompt = f"""
+    You are a prompt engineer for an AI Math Tutor. Your job is to extract the 
+    core knowledge from human corrections to create reusable, high-quality 
+    "Few-Shot Examples" for future LLM responses.
+
+    Create a JSON array with exactly {len(items)} objects, one per correction and in 
+    the same order. Each object has two keys: "question" and "ideal_answer".
+    
+    --- INPUT ---
+    {corrections}
+    
+    --- INSTRUCTIONS ---
+    1. The "question" must be the core math problem from the query.
+    2. The "ideal_answer" must be the clean, simplified, step-by-step solution provided 
+       in the Human Correction, formatted with numbered steps and proper LaTeX.
+    
+    --- REQUIRED JSON OUTPUT ---
+    [
+        {{
+            "question": "[Extracted core question]",
+            "ideal_answer": "[Cleaned, step-by-step solution]"
+        }}
+    ]
+    """
+
+    logger.info("Refinement Agent analyzing human corrections", extra={"corrections": len(items)})
+
+    # Timeout, retries and circuit breaker in resilience.py; while the breaker is
+    # open this fails fast and the queue retries the batch after its backoff
+    response = gemini_dependency.call_sync(lambda: get_genai_client().models.generate_content(
+        model='gemini-2.5-flash',
+        contents=[refinement_prompt]
+    ))
+
+    refined_examples = json.loads(_strip_code_fence(response.text))
+    if not isinstance(refined_examples, list) or len(refined_examples) != len(items):
+        raise ValueError(f"Expected a JSON array of {len(items)} examples.")
+    for example in refined_examples:
+        if not isinstance(example, dict) or not example.get("question") or not example.get("ideal_answer"):
+            raise ValueError("Refined example is missing 'question' or 'ideal_answer'.")
+
+    example_store.append_many(refined_examples)
+    logger.info("Refinement successful", extra={"examples_added": len(refined_examples)})
+    return refined_examples
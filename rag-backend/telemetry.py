@@ -0,0 +1,367 @@
+"""
+Request telemetry: stage timing spans, request metrics and structured logging.
+
+- `span(stage)` times one gateway stage into the `math_agent_stage_seconds`
+  histogram and counts the stage's errors.
+- `record_request(...)` counts each gateway response by route and status and
+  records its latency and router confidence.
+- `register_stats(name, fn)` exposes an existing stats dict (answer cache,
+  search cache, hedging, ...) as gauges, read at scrape time.
+- `render_metrics()` returns the Prometheus text exposition for `/metrics`.
+  It uses prometheus_client when it is installed and a small built-in
+  registry otherwise. Under a multi-worker server (gunicorn_conf.py sets
+  PROMETHEUS_MULTIPROC_DIR), counters and histograms are summed across
+  workers, while the stats gauges describe the worker that served the scrape.
+
+Logs go through a QueueHandler, so request threads only enqueue records and a
+background QueueListener formats and writes them. Every record carries the
+request id from `request_id_var`, which the API sets per request.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# CONFIGURATION
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# "json" for one JSON object per line, "text" for human-readable lines
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+METRIC_PREFIX = "math_agent"
+# Set by gunicorn_conf.py: prometheus_client then keeps metrics in per-process files there
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+STAGES = (
+    "input_guardrail",
+    "embedding",
+    "vector_query",
+    "lexical_query",
+    "routing",
+    "llm_generation",
+    "web_search",
+    "output_guardrail",
+)
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+REQUEST_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.55, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+# STRUCTURED LOGGING
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is logged as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+class _RequestIdFilter(logging.Filter):
+    """Stamps the current request id on the record in the calling thread, before it is queued."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = {k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS}
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        return line
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_logging_lock = threading.Lock()
+
+
+def configure_logging() -> None:
+    """Installs the queue handler on the `math_agent` logger and starts its listener (idempotent)."""
+    global _listener
+    with _logging_lock:
+        if _listener is not None:
+            return
+        log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(_RequestIdFilter())
+
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+        root = logging.getLogger(METRIC_PREFIX)
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    with _logging_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            logging.getLogger(METRIC_PREFIX).handlers.clear()
+
+
+def _reset_logging_after_fork() -> None:
+    """
+    The listener thread does not survive fork, and its queue or lock may have
+    been held mid-operation. A forked worker starts over with its own.
+    """
+    global _listener, _logging_lock
+    _listener = None
+    _logging_lock = threading.Lock()
+    logging.getLogger(METRIC_PREFIX).handlers.clear()
+    configure_logging()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_logging_after_fork)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the `math_agent` hierarchy, e.g. get_logger("gateway")."""
+    configure_logging()
+    return logging.getLogger(f"{METRIC_PREFIX}.{name}")
+
+# METRICS
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Counter:
+    """Built-in counter used when prometheus_client is not installed."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name}_total {self.documentation}", f"# TYPE {self.name}_total counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class _Histogram:
+    """Built-in cumulative histogram used when prometheus_client is not installed."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            # Per-bucket counts, then +Inf count and sum
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+                le = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class _PrometheusCounter:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self._metric = prometheus_client.Counter(name, documentation, labelnames)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        (self._metric.labels(**labels) if labels else self._metric).inc(amount)
+
+
+class _PrometheusHistogram:
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self._metric = prometheus_client.Histogram(name, documentation, labelnames, buckets=buckets)
+
+    def observe(self, value: float, **labels: str) -> None:
+        (self._metric.labels(**labels) if labels else self._metric).observe(value)
+
+
+_new_counter = _PrometheusCounter if prometheus_client else _Counter
+_new_histogram = _PrometheusHistogram if prometheus_client else _Histogram
+
+stage_seconds = _new_histogram(
+    f"{METRIC_PREFIX}_stage_seconds", "Latency of each gateway stage.", ("stage",), STAGE_BUCKETS)
+stage_errors = _new_counter(
+    f"{METRIC_PREFIX}_stage_errors", "Exceptions raised inside a gateway stage.", ("stage",))
+request_seconds = _new_histogram(
+    f"{METRIC_PREFIX}_request_seconds", "End-to-end gateway latency by route.", ("route",), REQUEST_BUCKETS)
+requests_total = _new_counter(
+    f"{METRIC_PREFIX}_requests", "Gateway responses by route, status and cache tier.", ("route", "status", "cache"))
+dependency_calls = _new_counter(
+    f"{METRIC_PREFIX}_dependency_calls", "Gemini/Tavily call attempts by outcome (ok, timeout, error, rejected, deadline).", ("dependency", "outcome"))
+admission_wait_seconds = _new_histogram(
+    f"{METRIC_PREFIX}_admission_wait_seconds", "Time admitted requests waited in the queue for an LLM slot.", (), STAGE_BUCKETS)
+admission_rejections = _new_counter(
+    f"{METRIC_PREFIX}_admission_rejections", "Requests refused with 429 by reason (rate_limited, queue_full, queue_timeout).", ("reason",))
+router_confidence = _new_histogram(
+    f"{METRIC_PREFIX}_router_confidence", "Router confidence (1 - top KB distance) of routed queries.", ("route",), CONFIDENCE_BUCKETS)
+
+_METRICS = [stage_seconds, stage_errors, request_seconds, requests_total, router_confidence, dependency_calls,
+            admission_wait_seconds, admission_rejections]
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Times a gateway stage. Exceptions are counted against the stage and
+    re-raised; cancellation and generator close are not counted as errors.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except (asyncio.CancelledError, GeneratorExit):
+        raise
+    except BaseException:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_request(response: dict, seconds: float) -> None:
+    """
+    Counts one gateway response by route, status and cache tier and records its
+    latency. The router confidence is recorded for freshly routed answers only.
+    """
+    route = response.get("mode", "UNKNOWN")
+    requests_total.inc(route=route, status=response.get("status", "UNKNOWN"), cache=response.get("cache_tier") or "none")
+    request_seconds.observe(seconds, route=route)
+    if "confidence" in response and not response.get("cached"):
+        router_confidence.observe(response["confidence"], route=route)
+
+# STATS SOURCES (existing stats dicts exported as gauges)
+
+_stats_sources: Dict[str, Callable[[], dict]] = {}
+
+
+def register_stats(name: str, source: Callable[[], dict]) -> None:
+    _stats_sources[name] = source
+
+
+def _flatten(prefix: str, value, out: List[Tuple[str, float]]) -> None:
+    if isinstance(value, (bool, int, float)):
+        out.append((prefix, float(value)))
+    elif isinstance(value, dict):
+        for key, inner in value.items():
+            _flatten(f"{prefix}_{key}", inner, out)
+
+
+def _stats_gauges() -> List[Tuple[str, float]]:
+    gauges: List[Tuple[str, float]] = []
+    for name, source in list(_stats_sources.items()):
+        try:
+            _flatten(f"{METRIC_PREFIX}_{name}", source(), gauges)
+        except Exception as e:
+            get_logger("telemetry").warning("Stats source failed", extra={"source": name, "error": str(e)})
+    return [(key.replace(".", "_").replace("-", "_").replace(":", "_"), value) for key, value in gauges]
+
+
+if prometheus_client:
+    class _StatsCollector:
+        def collect(self):
+            from prometheus_client.core import GaugeMetricFamily
+            for key, value in _stats_gauges():
+                gauge = GaugeMetricFamily(key, f"Exported from the {key} stats.")
+                gauge.add_metric([], value)
+                yield gauge
+
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        _registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(_registry)
+    else:
+        _registry = prometheus_client.REGISTRY
+    _registry.register(_StatsCollector())
+
+METRICS_CONTENT_TYPE = prometheus_client.CONTENT_TYPE_LATEST if prometheus_client else "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render_metrics() -> bytes:
+    """The Prometheus text exposition of every metric and registered stats source."""
+    if prometheus_client:
+        return prometheus_client.generate_latest(_registry)
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for key, value in _stats_gauges():
+        lines.extend([f"# TYPE {key} gauge", f"{key} {value}"])
+    return ("\n".join(lines) + "\n").encode("utf-8")
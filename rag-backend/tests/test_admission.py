@@ -0,0 +1,25 @@
+import pytest
+
+from admission import AdmissionRejected, UserRateLimiter
+
+
+def test_batch_above_the_burst_pays_its_full_cost():
+    limiter = UserRateLimiter(per_minute=60, burst=10)
+    limiter.acquire("alice", cost=512)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.acquire("alice")
+
+    # 10 - 512 tokens left; one more token at one per second takes ~503s
+    assert rejected.value.retry_after == pytest.approx(503, abs=1)
+
+
+def test_batch_above_the_burst_waits_for_a_full_bucket():
+    limiter = UserRateLimiter(per_minute=60, burst=10)
+    limiter.acquire("bob", cost=4)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.acquire("bob", cost=50)
+
+    assert rejected.value.retry_after == pytest.approx(4, abs=0.1)
+    limiter.acquire("carol", cost=50)
@@ -0,0 +1,30 @@
+import numpy as np
+
+from answer_cache import AnswerCache
+
+VECTOR = np.ones(8, dtype=np.float32)
+
+
+def _response(solution):
+    return {"mode": "KB_RESPONSE", "solution": solution, "confidence": 0.8, "status": "200_OK"}
+
+
+def test_semantic_hit_requires_the_same_numbers_and_symbols():
+    cache = AnswerCache()
+    cache.put("Solve x^2-5x+6=0", "JEE", _response("x = 2 or x = 3"), VECTOR)
+
+    assert cache.get_semantic(VECTOR, "JEE", "Solve x^2-5x+7=0") is None
+    assert cache.get_semantic(VECTOR, "JEE", "Please solve x^2 - 5x + 6 = 0")["solution"] == "x = 2 or x = 3"
+    assert cache.stats()["semantic"]["signature_mismatches"] == 1
+
+
+def test_refusals_are_not_cached():
+    cache = AnswerCache()
+    for solution in (
+        "KB Response Agent failed: No relevant context was provided.",
+        "'Insufficient context: I cannot construct a complete, grounded solution.'",
+    ):
+        cache.put("Solve x^2-5x+6=0", "JEE", _response(solution), VECTOR)
+
+    assert cache.get_exact("Solve x^2-5x+6=0", "JEE") is None
+    assert cache.get_semantic(VECTOR, "JEE", "Solve x^2-5x+6=0") is None
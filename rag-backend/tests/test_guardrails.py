@@ -0,0 +1,72 @@
+from guardrails import MATH_KEYWORDS, GuardrailEngine
+
+
+def baseline_input_guardrail(user_input):
+    """The substring check the engine replaced."""
+    return any(word in user_input.lower() for word in MATH_KEYWORDS)
+
+
+MATH_QUERIES = [
+    "What is mathematical induction?",
+    "mathematical reasoning in JEE",
+    "How do I simplify algebraic expressions",
+    "Rationalize 1/(sqrt2+1)",
+    "Define a functional relationship",
+    "What is the formula for integration by parts?",
+    "Integrate x cos(x) dx",
+    "Differentiate e^x sin x",
+    "Solve x^2 - 5x + 6 = 0",
+    "Find the eccentricity of the ellipse x^2/9 + y^2/4 = 1",
+    "Prove that the sum of the first n natural numbers is n(n+1)/2",
+    "Is every subset of a countable set countable?",
+    "Evaluate the antiderivative of 1/x",
+    "Graph the cotangent function",
+    "Is the system nonlinear?",
+    "Find the eigenvectors of the matrix [[2, 1], [1, 2]]",
+    "Area of a semicircle of radius 3",
+    "What is the probability of two heads?",
+    "Explain the mean value theorem",
+    "Calculate the determinant of the matrices",
+    "How many permutations of ABC are there?",
+    "Logarithmic differentiation of x^x",
+    "Exponential growth equations",
+    "Trigonometric identities for sin 2x",
+    "Limits and continuity of piecewise functions",
+    "Vectors perpendicular to the plane",
+    "Summation of a geometric progression",
+    "Complex numbers in polar form",
+]
+
+NON_MATH_QUERIES = [
+    "tell me a joke about cats",
+    "What is the capital of France?",
+    "Write me a poem",
+]
+
+# Queries the baseline accepted only because a keyword appeared inside an
+# unrelated word ("reset", "assume", "upset")
+INTENDED_DIFFERENCES = [
+    "Can you reset my password and assume I forgot it",
+    "I am upset about the weather",
+]
+
+
+def test_math_queries_pass_both_engines():
+    engine = GuardrailEngine()
+    for query in MATH_QUERIES:
+        assert baseline_input_guardrail(query), query
+        assert engine.check_input(query), query
+
+
+def test_engines_agree_except_on_keywords_inside_other_words():
+    engine = GuardrailEngine()
+    for query in MATH_QUERIES + NON_MATH_QUERIES + INTENDED_DIFFERENCES:
+        expected = baseline_input_guardrail(query) and query not in INTENDED_DIFFERENCES
+        assert engine.check_input(query) == expected, query
+
+
+def test_block_rules_match_word_forms():
+    engine = GuardrailEngine()
+    assert engine.blocking_rule("This maliciously crafted input") == "malicious"
+    assert engine.blocking_rule("See https://example.com") == "url"
+    assert engine.blocking_rule("The integral is x^2 / 2") is None
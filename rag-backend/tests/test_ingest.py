@@ -0,0 +1,66 @@
+import numpy as np
+
+import ingest
+
+
+class FakeCollection:
+    """The slice of the Chroma collection API that ingest uses."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, ids=None, where=None, include=None):
+        if ids is not None:
+            return {"ids": [i for i in ids if i in self.rows]}
+        return {"ids": [i for i, (_, meta) in self.rows.items() if meta["source"] == where["source"]]}
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        for i, document, meta in zip(ids, documents, metadatas):
+            self.rows[i] = (document, meta)
+
+    def delete(self, ids):
+        for i in ids:
+            del self.rows[i]
+
+    def documents(self):
+        return sorted(document for document, _ in self.rows.values())
+
+
+class FakeEmbedder:
+    def __init__(self, workers=1):
+        pass
+
+    def encode(self, texts):
+        return np.zeros((len(texts), 4), dtype=np.float32)
+
+    def close(self):
+        pass
+
+
+SHARED = "The shared passage about integration by parts."
+
+
+def test_pruning_one_source_keeps_a_chunk_another_source_shares(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "Embedder", FakeEmbedder)
+    (tmp_path / "a.md").write_text(f"Only in a.\n\n{SHARED}")
+    (tmp_path / "z.md").write_text(f"Only in z.\n\n{SHARED}")
+    collection = FakeCollection()
+    ingest.ingest([str(tmp_path)], collection, batch_size=1, max_chars=40, progress_every=0)
+    assert collection.documents().count(SHARED) == 2
+
+    (tmp_path / "z.md").write_text("Only in z, edited.")
+    ingest.ingest([str(tmp_path / "z.md")], collection, batch_size=1, max_chars=40, progress_every=0)
+
+    assert SHARED in collection.documents()
+    assert "Only in z." not in collection.documents()
+
+
+def test_rerun_skips_unchanged_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "Embedder", FakeEmbedder)
+    (tmp_path / "a.md").write_text(f"Only in a.\n\n{SHARED}")
+    collection = FakeCollection()
+    ingest.ingest([str(tmp_path)], collection, max_chars=40, progress_every=0)
+
+    stats = ingest.ingest([str(tmp_path)], collection, max_chars=40, progress_every=0)
+
+    assert (stats.embedded, stats.skipped, stats.pruned) == (0, 2, 0)
@@ -0,0 +1,65 @@
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+
+from kb_search import RetrievalService
+
+
+class FakeCollection:
+    def __init__(self, client, started, release):
+        self.client = client
+        self.started = started
+        self.release = release
+
+    def query(self, query_embeddings, n_results, include):
+        self.started.set()
+        self.release.wait(5)
+        # A query that outlives its client's cached system would fail here
+        assert not self.client.cleared
+        return {"documents": [["doc"]], "distances": [[0.1]]}
+
+
+def fake_chromadb(clients, started, release):
+    class PersistentClient:
+        def __init__(self, path):
+            self.cleared = False
+            clients.append(self)
+
+        def get_collection(self, name, embedding_function=None):
+            return FakeCollection(self, started, release)
+
+        def clear_system_cache(self):
+            self.cleared = True
+
+    return types.SimpleNamespace(PersistentClient=PersistentClient)
+
+
+def test_reconnect_waits_for_queries_on_the_old_handle(monkeypatch, tmp_path):
+    clients, started, release = [], threading.Event(), threading.Event()
+    monkeypatch.setitem(sys.modules, "chromadb", fake_chromadb(clients, started, release))
+
+    service = RetrievalService(path=str(tmp_path), check_interval=0.0)
+    service.start()
+
+    results = []
+    reader = threading.Thread(target=lambda: results.append(service.query(np.zeros((1, 4)))))
+    reader.start()
+    assert started.wait(5)
+
+    (tmp_path / "chroma.sqlite3").write_bytes(b"rebuilt")
+    reconnect = threading.Thread(target=service.get_collection)
+    reconnect.start()
+    time.sleep(0.05)
+    assert not clients[0].cleared
+
+    release.set()
+    reader.join(5)
+    reconnect.join(5)
+
+    assert results == [[[("doc", 0.1)]]]
+    assert clients[0].cleared
+    assert len(clients) == 2 and not clients[1].cleared
+    service.close()
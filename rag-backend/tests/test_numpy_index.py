@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from numpy_index import COSINE, NumpyVectorIndex
+
+
+def test_cosine_export_round_trips_as_unit_rows(tmp_path):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(20, 8)).astype(np.float32) * 5
+    queries = rng.normal(size=(3, 8)).astype(np.float32)
+    index = NumpyVectorIndex.from_documents([f"d{i}" for i in range(20)], [f"doc {i}" for i in range(20)], embeddings, COSINE)
+
+    index.save(str(tmp_path))
+    loaded = NumpyVectorIndex.load(str(tmp_path), mmap=True)
+
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = 1.0 - (queries / np.linalg.norm(queries, axis=1, keepdims=True)) @ unit.T
+    assert np.linalg.norm(loaded.embeddings, axis=1) == pytest.approx(np.ones(20), abs=1e-5)
+    assert loaded.distances(queries) == pytest.approx(expected, abs=1e-5)
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, Dependency, DependencyTimeout, deadline, remaining
+
+
+async def stream(chunks, stall=None):
+    for chunk in chunks:
+        yield chunk
+    if stall:
+        await asyncio.sleep(stall)
+
+
+async def drain(dependency, chunks):
+    return [chunk async for chunk in dependency.iterate(chunks)]
+
+
+def test_iterate_records_the_stream_outcome_on_the_breaker():
+    breaker = CircuitBreaker("llm", failure_threshold=1)
+    dependency = Dependency("llm", timeout=0.05, max_retries=0, breaker=breaker)
+
+    with pytest.raises(DependencyTimeout):
+        asyncio.run(drain(dependency, stream(["a"], stall=1)))
+    assert breaker.state == OPEN
+
+    breaker.state = HALF_OPEN
+    assert asyncio.run(drain(dependency, stream(["a", "b"]))) == ["a", "b"]
+    assert breaker.state == CLOSED
+
+
+def test_deadline_restores_the_outer_deadline():
+    assert remaining() is None
+    with deadline(10):
+        outer = remaining()
+        with deadline(1):
+            assert remaining() < 2
+        assert remaining() == pytest.approx(outer, abs=0.1)
+        with deadline(None):
+            assert remaining() == pytest.approx(outer, abs=0.1)
+    assert remaining() is None
@@ -0,0 +1,27 @@
+import json
+
+from routing_log import RoutingDecision, RoutingLog
+
+
+def test_decision_is_written_in_the_background_with_the_final_mode(tmp_path):
+    path = tmp_path / "routing_log.jsonl"
+    log = RoutingLog(str(path))
+    decision = RoutingDecision("Find the area of a circle", "JEE", "coordinate_geometry", 0.5, 0.2, 0.45,
+                               "WEB_SEARCH", None, "req-1")
+
+    # The web leg failed and the KB answered instead
+    log.record_decision(decision, "KB_RESPONSE")
+    log.flush()
+    log.close()
+
+    entry = json.loads(path.read_text())
+    assert (entry["route"], entry["mode"], entry["request_id"]) == ("WEB_SEARCH", "KB_RESPONSE", "req-1")
+    assert (entry["vector_distance"], entry["lexical_score"]) == (0.5, 0.2)
+    assert log.stats() == {"written": 1, "errors": 0}
+
+
+def test_disabled_log_starts_no_writer(tmp_path):
+    log = RoutingLog("")
+    log.record_feedback({"query": "x", "assessment": "CORRECT"})
+    log.flush()
+    assert log.stats() == {"written": 0, "errors": 0}
@@ -1,16 +1,9 @@
-import os
-from tavily import TavilyClient
-from google import genai
 from typing import List, Dict
-from dotenv import load_dotenv 
-load_dotenv()
+from resources import get_genai_client, get_tavily_client
 
-# Configuration 
-
-from tavily import TavilyClient
-tavily_client = TavilyClient()
-llm_client = genai.Client()
-LLM_MODEL = 'gemini-2.5-flash' 
+# Configuration (Tavily and Gemini clients are created lazily on first use,
+# by the provider selected in resources.py)
+LLM_MODEL = 'gemini-2.5-flash'
 
 def create_web_rag_prompt(question: str, search_results: List[Dict]) -> str:
     """
@@ -72,7 +65,7 @@ def WebSearchAgent(
     # Perform the Search using Tavily
     try:
         
-        search_response = tavily_client.search(
+        search_response = get_tavily_client().search(
             query=question, 
             search_depth="advanced", 
             max_results=max_results
@@ -93,7 +86,7 @@ def WebSearchAgent(
 
     # Generate the Final Answer using the LLM
     try:
-        llm_response = llm_client.models.generate_content(
+        llm_response = get_genai_client().models.generate_content(
             model=LLM_MODEL,
             contents=[rag_prompt],
         )
@@ -1,13 +1,8 @@
-import os
-from tavily import TavilyClient
-from google import genai
 from typing import List, Dict
-from dotenv import load_dotenv 
-load_dotenv()
+from resources import get_genai_client, get_tavily_client
 
-# Configuration 
-tavily_client = TavilyClient()
-llm_client = genai.Client()
+# Configuration (Tavily and Gemini clients are created lazily on first use,
+# by the provider selected in resources.py)
 LLM_MODEL = 'gemini-2.5-flash'
 
 def create_web_rag_prompt(question: str, search_results: List[Dict]) -> str:
@@ -63,7 +58,7 @@ def WebSearchAgent(
 
    
     try:
-        search_response = tavily_client.search(
+        search_response = get_tavily_client().search(
             query=question, 
             search_depth="advanced",
             max_results=max_results
@@ -82,7 +77,7 @@ def WebSearchAgent(
     print(f" Web Agent synthesizing & extracting solution from {len(search_results)} sources...")
 
     try:
-        llm_response = llm_client.models.generate_content(
+        llm_response = get_genai_client().models.generate_content(
             model=LLM_MODEL,
             contents=[rag_prompt],
         )